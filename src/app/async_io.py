@@ -0,0 +1,42 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+
+class AsyncLoader:
+    """
+    runs blocking loaders (boto3 calls, decompression, parsing) on a bounded
+    thread pool so they never block the event loop, and coalesces concurrent
+    calls for the same key into a single load
+    """
+
+    def __init__(self, max_concurrency: int = 16):
+        self.max_concurrency = max_concurrency
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_concurrency, thread_name_prefix="s3-io")
+        # key -> future of the load in progress
+        self._in_flight = {}
+        self._counters = {"loads": 0, "coalesced": 0}
+
+    async def run(self, key, func, *args):
+        """
+        awaits func(*args) run on the thread pool; callers asking for a key
+        that is already being loaded share the result of that load
+        """
+        future = self._in_flight.get(key)
+        if future is not None:
+            self._counters["coalesced"] += 1
+            # shielded so that a cancelled request does not cancel the others
+            return await asyncio.shield(future)
+
+        loop = asyncio.get_running_loop()
+        future = loop.run_in_executor(self._executor, func, *args)
+        self._in_flight[key] = future
+        self._counters["loads"] += 1
+        future.add_done_callback(lambda _: self._in_flight.pop(key, None))
+        return await asyncio.shield(future)
+
+    def stats(self) -> dict:
+        stats = dict(self._counters)
+        stats["in_flight"] = len(self._in_flight)
+        stats["max_concurrency"] = self.max_concurrency
+        return stats
@@ -0,0 +1,159 @@
+import logging
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+# returned by TTLCache.peek() for a key that is not cached
+MISSING = object()
+
+
+class _Entry:
+    __slots__ = ("value", "loaded_at", "ttl", "refreshing")
+
+    def __init__(self, value, ttl: float):
+        self.value = value
+        self.loaded_at = time.monotonic()
+        self.ttl = ttl
+        self.refreshing = False
+
+    def is_stale(self, now: float) -> bool:
+        return now - self.loaded_at > self.ttl
+
+
+class TTLCache:
+    """
+    in-process cache with a TTL per key, LRU eviction once max_entries is
+    reached, and stale-while-revalidate refreshes run on a background thread
+    """
+
+    def __init__(
+        self,
+        default_ttl: float = 300,
+        max_entries: int = 256,
+        refresh_workers: int = 2,
+    ):
+        self.default_ttl = default_ttl
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._load_locks = {}
+        self._executor = ThreadPoolExecutor(
+            max_workers=refresh_workers, thread_name_prefix="cache-refresh")
+        self._counters = {
+            "hits": 0,
+            "stale_hits": 0,
+            "misses": 0,
+            "refreshes": 0,
+            "refresh_failures": 0,
+            "evictions": 0,
+        }
+
+    def peek(self, key, loader):
+        """
+        returns the cached value for key, or MISSING without calling loader();
+        never blocks on a load, stale values are returned and refreshed in
+        the background with loader
+        """
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return MISSING
+            self._entries.move_to_end(key)
+            if not entry.is_stale(now):
+                self._counters["hits"] += 1
+                return entry.value
+            self._counters["stale_hits"] += 1
+            if not entry.refreshing:
+                entry.refreshing = True
+                self._executor.submit(self._refresh, key, loader, entry.ttl)
+            return entry.value
+
+    def get(self, key, loader, ttl: float = None):
+        """
+        returns the cached value for key, calling loader() on a miss;
+        stale values are returned immediately and refreshed in the background
+        """
+        value = self.peek(key, loader)
+        if value is not MISSING:
+            return value
+        with self._lock:
+            self._counters["misses"] += 1
+            load_lock = self._load_locks.setdefault(key, threading.Lock())
+
+        # only one caller loads a missing key, the others wait for its result
+        with load_lock:
+            with self._lock:
+                entry = self._entries.get(key)
+                if entry is not None:
+                    return entry.value
+            value = loader()
+            self._store(key, value, self.default_ttl if ttl is None else ttl)
+            with self._lock:
+                self._load_locks.pop(key, None)
+            return value
+
+    def __contains__(self, key) -> bool:
+        """
+        whether key is cached; use peek() rather than testing it before a
+        get(), the entry can be evicted in between
+        """
+        with self._lock:
+            return key in self._entries
+
+    def prefetch(self, key, loader, ttl: float = None):
+        """
+        loads key on a background thread so a later get() is a hit
+        """
+        def load():
+            try:
+                return self.get(key, loader, ttl)
+            except Exception:
+                # nobody waits on the future, the failure would go unnoticed
+                logger.exception(f"prefetch failed for {key}")
+                raise
+
+        return self._executor.submit(load)
+
+    def _refresh(self, key, loader, ttl: float):
+        try:
+            value = loader()
+        except Exception:
+            logger.exception(f"background refresh failed for {key}")
+            with self._lock:
+                self._counters["refresh_failures"] += 1
+                entry = self._entries.get(key)
+                if entry is not None:
+                    entry.refreshing = False
+            return
+        self._store(key, value, ttl)
+        with self._lock:
+            self._counters["refreshes"] += 1
+
+    def _store(self, key, value, ttl: float):
+        with self._lock:
+            self._entries[key] = _Entry(value, ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self._counters["evictions"] += 1
+
+    def invalidate(self, key=None):
+        """
+        drops one key, or every key when none is given
+        """
+        with self._lock:
+            if key is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(key, None)
+
+    def stats(self) -> dict:
+        with self._lock:
+            stats = dict(self._counters)
+            stats["entries"] = len(self._entries)
+            stats["max_entries"] = self.max_entries
+        return stats
@@ -2,24 +2,108 @@ from fastapi import (
     # Depends,
     FastAPI,
     # File,
-    # HTTPException,
+    HTTPException,
+    Query,
+    Request,
     # Security,
     # UploadFile,
 )
+from fastapi.responses import PlainTextResponse
 from fastapi.routing import APIRouter
+from starlette.routing import Match
 import os
-import json
-import boto3
-import gzip
+import time
+from functools import partial
 # from core.wasabi import WASABI_CONNECT
 from fastapi.middleware.cors import CORSMiddleware
-# from core.s3_utilities import read_jsonl_file
+from botocore.exceptions import ClientError
+from app.async_io import AsyncLoader
+from app.cache import MISSING, TTLCache
+from app.queries import CompanyIndex, CompanyIndexes, InvalidCursor, InvalidSort, paginate, project
+from app.responses import CodecJSONResponse, PreparedResponse, PreparedResponses
+from app.shared_dataset import PREPARED_OBJECTS, open_dataset, read_current_version
+from app.snapshots import SnapshotHolder
+from core.company_store import PackedCompanyStore
+from core.metrics import HTTP_REQUEST_SECONDS, METRICS
+from core.rankings import RANKINGS_PATH, load_ranking_index
+from core.s3_utilities import (
+    merge_jsonl_lines,
+    read_jsonl_file_revalidated,
+    read_parquet_file_revalidated,
+)
+from core.snapshot_bundle import load_snapshot_bundle, read_snapshot_pointer
+
+try:
+    import pyarrow as pa
+except ImportError:  # the companies table is optional
+    pa = None
 
 SERVICE_ENDPOINT = os.getenv(
     "SERVICE_ENDPOINT", "https://s3.us-west-1.wasabisys.com")
 ACCESS_KEY_ID = os.environ.get("ACCESS_KEY_ID")
 SECRET_ACCESS_KEY = os.environ.get("SECRET_ACCESS_KEY")
 
+# cache settings, a TTL can be overridden per object with e.g.
+# CACHE_TTL_ALL_COMPANY_DATA=600 or CACHE_TTL_COMPANY=60
+CACHE_TTL_SECONDS = float(os.getenv("CACHE_TTL_SECONDS", "300"))
+CACHE_MAX_ENTRIES = int(os.getenv("CACHE_MAX_ENTRIES", "256"))
+# single companies have a cache of their own, so that a burst of lookups
+# never evicts the aggregates
+COMPANY_CACHE_MAX_ENTRIES = int(os.getenv("COMPANY_CACHE_MAX_ENTRIES", "1024"))
+CACHE_WARM_ON_STARTUP = os.getenv("CACHE_WARM_ON_STARTUP", "1") == "1"
+
+cache = TTLCache(default_ttl=CACHE_TTL_SECONDS, max_entries=CACHE_MAX_ENTRIES)
+company_cache = TTLCache(default_ttl=CACHE_TTL_SECONDS, max_entries=COMPANY_CACHE_MAX_ENTRIES)
+
+# max number of S3 loads running at the same time, requests beyond it wait
+# without blocking the event loop
+S3_MAX_CONCURRENCY = int(os.getenv("S3_MAX_CONCURRENCY", "16"))
+
+loader = AsyncLoader(max_concurrency=S3_MAX_CONCURRENCY)
+
+# Cache-Control max-age of the aggregate endpoints, whose JSON bodies are
+# encoded and compressed once per data refresh
+RESPONSE_MAX_AGE = int(os.getenv("RESPONSE_MAX_AGE", "60"))
+
+responses = PreparedResponses()
+
+# page size of the filtered all_companies / all_company_data queries
+DEFAULT_PAGE_SIZE = int(os.getenv("DEFAULT_PAGE_SIZE", "100"))
+MAX_PAGE_SIZE = int(os.getenv("MAX_PAGE_SIZE", "1000"))
+
+company_indexes = CompanyIndexes()
+
+
+def cache_ttl(object_name: str) -> float:
+    return float(os.getenv(f"CACHE_TTL_{object_name.upper()}", CACHE_TTL_SECONDS))
+
+
+# set to a local directory to serve single companies from a memory-mapped
+# copy of the packed company store instead of ranged reads
+COMPANY_STORE_LOCAL_DIR = os.getenv("COMPANY_STORE_LOCAL_DIR")
+
+company_store = PackedCompanyStore(
+    service_endpoint=SERVICE_ENDPOINT,
+    access_key_id=ACCESS_KEY_ID,
+    secret_access_key=SECRET_ACCESS_KEY,
+    bucket_name="dei-bucket",
+    local_dir=COMPANY_STORE_LOCAL_DIR,
+    index_ttl=cache_ttl("company_index"),
+)
+
+# serve the aggregates from the snapshot bundle published by the batch jobs
+# (see core.snapshot_bundle): it is loaded at startup, its pointer is checked
+# every SNAPSHOT_REFRESH_SECONDS and a new version is swapped in as a whole.
+# Until a bundle exists, the aggregates are loaded one by one from S3.
+SNAPSHOT_BUNDLE_ENABLED = os.getenv("SNAPSHOT_BUNDLE_ENABLED", "1") == "1"
+SNAPSHOT_REFRESH_SECONDS = float(os.getenv("SNAPSHOT_REFRESH_SECONDS", "60"))
+
+# multi-worker mode (see gunicorn.conf.py): the bundle is materialized in this
+# directory by a single loader process, and every worker maps it instead of
+# loading its own copy; the directory is checked every few seconds
+SHARED_DATASET_DIR = os.getenv("SHARED_DATASET_DIR")
+SHARED_DATASET_REFRESH_SECONDS = float(os.getenv("SHARED_DATASET_REFRESH_SECONDS", "5"))
+
 app = FastAPI(
     title="Diversity API",
     description="Diversity project API",
@@ -27,6 +111,7 @@ app = FastAPI(
     docs_url="/api/v1/docs",
     redoc_url="/api/v1/redoc",
     openapi_url="/api/v1/openapi.json",
+    default_response_class=CodecJSONResponse,
 )
 router = APIRouter()
 
@@ -38,6 +123,53 @@ app.add_middleware(
 )
 
 
+def route_template(request: Request) -> str:
+    """
+    the path template of the route serving a request (e.g. /api/v1/company),
+    so that metrics are not labelled with every distinct URL
+    """
+    route = request.scope.get("route")
+    if route is not None:
+        return route.path
+    for route in request.app.router.routes:
+        match, _ = route.matches(request.scope)
+        if match == Match.FULL and hasattr(route, "path"):
+            return route.path
+    return "unmatched"
+
+
+@app.middleware("http")
+async def record_request_metrics(request: Request, call_next):
+    start = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        METRICS.observe(HTTP_REQUEST_SECONDS, time.perf_counter() - start,
+                        route=route_template(request), method=request.method, status=status)
+
+
+@app.get("/metrics", include_in_schema=False)
+def get_metrics():
+    """
+    metrics of this worker in the Prometheus text format
+    """
+    gauges = {f"dei_cache_{name}": value for name, value in cache.stats().items()}
+    gauges.update({f"dei_company_cache_{name}": value for name, value in company_cache.stats().items()})
+    gauges.update({f"dei_loader_{name}": value for name, value in loader.stats().items()})
+    gauges.update({f"dei_snapshot_{name}": value for name, value in snapshots.stats().items()
+                   if isinstance(value, (int, float))})
+    return PlainTextResponse(
+        METRICS.render_prometheus(gauges), media_type="text/plain; version=0.0.4")
+
+
+@app.on_event("shutdown")
+def stop_snapshot_refresh():
+    snapshots.stop()
+
+
 @router.get("/")
 def root():
     """ """
@@ -58,56 +190,17 @@ def root():
 #        object_path="company_scorecards/scorecards.json")
 #    return scorecards
 
-def read_jsonl_file(
-    service_endpoint: str,
-    access_key_id: str,
-    secret_access_key: str,
-    bucket_name: str = "dei-bucket",
-    object_path: str = "raw_data/ADM.jsonl.gz",
-    return_lines: bool = False,
-):
-    """
-    reads the contents of a JSON Lines file stored in a Wasabi bucket
-    """
-    s3 = boto3.client('s3',
-                      aws_access_key_id=access_key_id,
-                      aws_secret_access_key=secret_access_key,
-                      endpoint_url=service_endpoint)
-
-    response = s3.get_object(Bucket=bucket_name, Key=object_path)
-
-    # read the contents of the file
-    file_content = response['Body'].read()
-
-    # decompress the gzipped content
-    file_content = gzip.decompress(file_content)
-
-    # parse the JSON lines
-    json_lines = file_content.decode('utf-8').split('\n')
-    if return_lines:
-        return json_lines
-    else:
-        json_objects = []
-        for line in json_lines:
-            if line:
-                json_objects.append(json.loads(line))
-
-        return json_objects
-
-
 def get_all_company_data():
-    all_dat = read_jsonl_file(
+    return read_jsonl_file_revalidated(
         service_endpoint=SERVICE_ENDPOINT,
         access_key_id=ACCESS_KEY_ID,
         secret_access_key=SECRET_ACCESS_KEY,
         bucket_name="dei-bucket",
         object_path="company_scores/all/all_companies.jsonl.gz",
-        return_lines=True
+        return_lines=True,
+        as_bytes=True,
+        transform=merge_jsonl_lines,
     )
-    result_dict = {}
-    for d in all_dat:
-        result_dict.update(json.loads(d))
-    return result_dict
 
 
 def get_all_companies():
@@ -120,96 +213,416 @@ def get_all_companies():
     - company website
     - company id
     """
-    all_dat = read_jsonl_file(
+    return read_jsonl_file_revalidated(
         service_endpoint=SERVICE_ENDPOINT,
         access_key_id=ACCESS_KEY_ID,
         secret_access_key=SECRET_ACCESS_KEY,
         bucket_name="dei-bucket",
         object_path="company_scores/all/companies_metadata.jsonl.gz",
-        return_lines=True
+        return_lines=True,
+        as_bytes=True,
+        transform=merge_jsonl_lines,
     )
-    result_dict = {}
-    for d in all_dat:
-        result_dict.update(json.loads(d))
-    return result_dict
 
 
 def get_one_company_data(company_id: str):
-    all_dat = read_jsonl_file(
+    """
+    reads one company from the packed company store, falling back to its
+    by_company_id object if the company (or the store) is not there
+    """
+    try:
+        company = company_store.get(company_id)
+    except ClientError as e:
+        if e.response.get('Error', {}).get('Code') not in ('NoSuchKey', '404'):
+            raise
+        company = None
+    if company is not None:
+        return company
+    return read_jsonl_file_revalidated(
         service_endpoint=SERVICE_ENDPOINT,
         access_key_id=ACCESS_KEY_ID,
         secret_access_key=SECRET_ACCESS_KEY,
         bucket_name="dei-bucket",
         object_path=f"company_scores/by_company_id/{company_id}.jsonl.gz",
-        return_lines=True
+        return_lines=True,
+        as_bytes=True,
+        transform=merge_jsonl_lines,
     )
-    company_dict = {}
-    for d in all_dat:
-        d_format = json.loads(d)
-        for k, item in d_format.items():
-            company_dict[k] = item
-    return company_dict
 
 
 def get_industry_stats():
-    all_dat = read_jsonl_file(
+    return read_jsonl_file_revalidated(
         service_endpoint=SERVICE_ENDPOINT,
         access_key_id=ACCESS_KEY_ID,
         secret_access_key=SECRET_ACCESS_KEY,
         bucket_name="dei-bucket",
         object_path="company_scores/all/industry_statistics.jsonl.gz",
-        return_lines=True
+        return_lines=True,
+        as_bytes=True,
+        transform=merge_jsonl_lines,
     )
-    result_dict = {}
-    for d in all_dat:
-        result_dict.update(json.loads(d))
-    return result_dict
 
 
 def get_sector_stats():
-    all_dat = read_jsonl_file(
+    return read_jsonl_file_revalidated(
         service_endpoint=SERVICE_ENDPOINT,
         access_key_id=ACCESS_KEY_ID,
         secret_access_key=SECRET_ACCESS_KEY,
         bucket_name="dei-bucket",
         object_path="company_scores/all/sector_statistics.jsonl.gz",
-        return_lines=True
+        return_lines=True,
+        as_bytes=True,
+        transform=merge_jsonl_lines,
     )
-    result_dict = {}
-    for d in all_dat:
-        result_dict.update(json.loads(d))
-    return result_dict
 
 
-@router.get("/all_company_data")
-async def get_all_data():
-    data = get_all_company_data()
+def get_companies_table():
+    """
+    flattened table of all the companies, from the parquet snapshot
+    """
+    return read_parquet_file_revalidated(
+        service_endpoint=SERVICE_ENDPOINT,
+        access_key_id=ACCESS_KEY_ID,
+        secret_access_key=SECRET_ACCESS_KEY,
+        bucket_name="dei-bucket",
+        object_path="company_scores/all/companies.parquet",
+    )
+
+
+def get_rankings():
+    """
+    sorted per-industry and per-sector score rankings of the companies
+    """
+    return read_jsonl_file_revalidated(
+        service_endpoint=SERVICE_ENDPOINT,
+        access_key_id=ACCESS_KEY_ID,
+        secret_access_key=SECRET_ACCESS_KEY,
+        bucket_name="dei-bucket",
+        object_path=RANKINGS_PATH,
+        return_lines=True,
+        as_bytes=True,
+        transform=load_ranking_index,
+    )
+
+
+CACHED_OBJECTS = {
+    "all_company_data": get_all_company_data,
+    "all_companies": get_all_companies,
+    "industry_stats": get_industry_stats,
+    "sector_stats": get_sector_stats,
+    "companies_table": get_companies_table,
+    "rankings": get_rankings,
+}
+
+
+# transforms of the bundle objects the API loads, see CACHED_OBJECTS
+BUNDLE_TRANSFORMS = {
+    "all_company_data": merge_jsonl_lines,
+    "all_companies": merge_jsonl_lines,
+    "industry_stats": merge_jsonl_lines,
+    "sector_stats": merge_jsonl_lines,
+    "rankings": load_ranking_index,
+}
+if pa is not None:
+    BUNDLE_TRANSFORMS["companies_table"] = None
+
+
+def load_snapshot(current):
+    """
+    loads the bundle the pointer refers to, or returns None if there is no
+    bundle or it is the current one
+    """
+    credentials = {
+        "service_endpoint": SERVICE_ENDPOINT,
+        "access_key_id": ACCESS_KEY_ID,
+        "secret_access_key": SECRET_ACCESS_KEY,
+        "bucket_name": "dei-bucket",
+    }
+    pointer = read_snapshot_pointer(**credentials)
+    if pointer is None or (current is not None and pointer["version"] == current.version):
+        return None
+    snapshot = load_snapshot_bundle(pointer, BUNDLE_TRANSFORMS, **credentials)
+    snapshot.derived["responses"] = {
+        object_name: PreparedResponse(snapshot.objects[object_name])
+        for object_name in PREPARED_OBJECTS & snapshot.objects.keys()
+    }
+    return index_snapshot(snapshot)
+
+
+def load_shared_snapshot(current):
+    """
+    maps the current version of the shared dataset, or returns None if there
+    is none yet or it is the current one
+    """
+    version = read_current_version(SHARED_DATASET_DIR)
+    if version is None or (current is not None and version == current.version):
+        return None
+    return index_snapshot(open_dataset(SHARED_DATASET_DIR, version, BUNDLE_TRANSFORMS))
+
+
+def index_snapshot(snapshot):
+    # responses and indexes are built before the swap, so that requests to
+    # the new version never wait for them nor mix them with another version
+    if "all_companies" in snapshot.objects:
+        snapshot.derived["company_index"] = CompanyIndex(snapshot.objects["all_companies"])
+    return snapshot
+
+
+if SHARED_DATASET_DIR:
+    snapshots = SnapshotHolder(load_shared_snapshot, refresh_seconds=SHARED_DATASET_REFRESH_SECONDS)
+else:
+    snapshots = SnapshotHolder(load_snapshot, refresh_seconds=SNAPSHOT_REFRESH_SECONDS)
+
+
+def load_object(object_name: str):
+    data = CACHED_OBJECTS[object_name]()
+    if object_name in PREPARED_OBJECTS:
+        # encoding happens here, in the loading (or refreshing) thread, and
+        # only when the data actually changed
+        responses.prepare(object_name, data)
+    if object_name == "all_companies":
+        company_indexes.build(data)
     return data
 
 
+def get_cached(object_name: str):
+    return cache.get(
+        object_name, partial(load_object, object_name), ttl=cache_ttl(object_name))
+
+
+def get_cached_company(company_id: str):
+    return company_cache.get(
+        company_id,
+        lambda: get_one_company_data(company_id=company_id),
+        ttl=cache_ttl("company"),
+    )
+
+
+async def get_cached_async(object_name: str):
+    snapshot = snapshots.current
+    if snapshot is not None and object_name in snapshot.objects:
+        return snapshot.objects[object_name]
+    # cached values (even stale ones) are returned without blocking, only
+    # misses go to the thread pool
+    value = cache.peek(object_name, partial(load_object, object_name))
+    if value is not MISSING:
+        return value
+    return await loader.run(object_name, get_cached, object_name)
+
+
+async def get_cached_company_async(company_id: str):
+    snapshot = snapshots.current
+    if snapshot is not None and company_id in snapshot.objects.get("all_company_data", ()):
+        return snapshot.objects["all_company_data"][company_id]
+    value = company_cache.peek(company_id, lambda: get_one_company_data(company_id=company_id))
+    if value is not MISSING:
+        return value
+    return await loader.run(("company", company_id), get_cached_company, company_id)
+
+
+async def send_prepared(request: Request, object_name: str):
+    snapshot = snapshots.current
+    if snapshot is not None and object_name in snapshot.derived.get("responses", ()):
+        return snapshot.derived["responses"][object_name].to_response(
+            request, max_age=RESPONSE_MAX_AGE)
+    data = await get_cached_async(object_name)
+    prepared = responses.get(object_name, data)
+    if prepared is None:
+        prepared = await loader.run(
+            ("prepare", object_name, id(data)), responses.prepare, object_name, data)
+    return prepared.to_response(request, max_age=RESPONSE_MAX_AGE)
+
+
+async def query_companies(
+    object_name: str,
+    filters: dict,
+    fields: str = None,
+    sort_by: str = None,
+    order: str = "desc",
+    limit: int = DEFAULT_PAGE_SIZE,
+    cursor: str = None,
+):
+    """
+    filters, sorts and paginates the companies of an aggregate with the
+    indexes of the companies metadata, and only encodes the requested page
+    """
+    snapshot = snapshots.current
+    if snapshot is not None and "company_index" in snapshot.derived and object_name in snapshot.objects:
+        # the index and the data of the same version
+        index = snapshot.derived["company_index"]
+        data = snapshot.objects[object_name]
+    else:
+        metadata = await get_cached_async("all_companies")
+        index = company_indexes.get(metadata)
+        if index is None:
+            index = await loader.run(("company_index", id(metadata)), company_indexes.build, metadata)
+        data = metadata if object_name == "all_companies" else await get_cached_async(object_name)
+
+    if sort_by and sort_by not in index.scores:
+        raise HTTPException(
+            status_code=400, detail=f"unknown score {sort_by}, expected one of {sorted(index.scores)}")
+    try:
+        company_ids = index.query(filters, sort_by=sort_by, ascending=order == "asc")
+        page, next_cursor = paginate(company_ids, index.version, cursor=cursor, limit=limit)
+    except (InvalidSort, InvalidCursor) as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    selected = fields.split(",") if fields else None
+    return {
+        "data": {
+            company_id: project(data[company_id], selected)
+            for company_id in page if company_id in data
+        },
+        "total": len(company_ids),
+        "next_cursor": next_cursor,
+    }
+
+
+@app.on_event("startup")
+def warm_cache():
+    if SNAPSHOT_BUNDLE_ENABLED or SHARED_DATASET_DIR:
+        # one load of the whole bundle, before serving
+        snapshots.refresh()
+        snapshots.start()
+    if not CACHE_WARM_ON_STARTUP:
+        return
+    snapshot = snapshots.current
+    for object_name in CACHED_OBJECTS:
+        if snapshot is not None and object_name in snapshot.objects:
+            continue
+        cache.prefetch(
+            object_name, partial(load_object, object_name), ttl=cache_ttl(object_name))
+
+
+@router.get("/all_company_data")
+async def get_all_data(
+    request: Request,
+    industry: str = None,
+    sector: str = None,
+    company_size: str = None,
+    fields: str = None,
+    sort_by: str = None,
+    order: str = Query("desc", regex="^(asc|desc)$"),
+    limit: int = Query(None, ge=1, le=MAX_PAGE_SIZE),
+    cursor: str = None,
+):
+    """
+    without parameters, returns the data of every company; with filters
+    (industry, sector, company_size), a comma separated list of fields, a
+    score to sort_by, a limit or a cursor, returns one page of matching
+    companies as {"data": ..., "total": ..., "next_cursor": ...}
+    """
+    if not any((industry, sector, company_size, fields, sort_by, limit, cursor)):
+        return await send_prepared(request, "all_company_data")
+    return await query_companies(
+        "all_company_data",
+        filters={"industry": industry, "sector": sector, "company_size": company_size},
+        fields=fields, sort_by=sort_by, order=order,
+        limit=limit or DEFAULT_PAGE_SIZE, cursor=cursor,
+    )
+
+
 @router.get("/all_companies")
-async def get_data():
-    data = get_all_companies()
-    return data
+async def get_data(
+    request: Request,
+    industry: str = None,
+    sector: str = None,
+    company_size: str = None,
+    fields: str = None,
+    sort_by: str = None,
+    order: str = Query("desc", regex="^(asc|desc)$"),
+    limit: int = Query(None, ge=1, le=MAX_PAGE_SIZE),
+    cursor: str = None,
+):
+    """
+    without parameters, returns the metadata of every company; accepts the
+    same filtering, projection, sorting and pagination as /all_company_data
+    """
+    if not any((industry, sector, company_size, fields, sort_by, limit, cursor)):
+        return await send_prepared(request, "all_companies")
+    return await query_companies(
+        "all_companies",
+        filters={"industry": industry, "sector": sector, "company_size": company_size},
+        fields=fields, sort_by=sort_by, order=order,
+        limit=limit or DEFAULT_PAGE_SIZE, cursor=cursor,
+    )
 
 
 @router.get("/company")
 async def get_one_company(
     company_id: str,
 ):
-    data = get_one_company_data(company_id=company_id)
+    data = await get_cached_company_async(company_id=company_id)
     return data
 
 
 @router.get("/industry_stats")
-async def get_data():
-    data = get_industry_stats()
-    return data
+async def get_data(request: Request):
+    return await send_prepared(request, "industry_stats")
 
 
 @router.get("/sector_stats")
-async def get_data():
-    data = get_sector_stats()
-    return data
+async def get_data(request: Request):
+    return await send_prepared(request, "sector_stats")
+
+
+@router.get("/companies_table")
+async def get_companies_columns(
+    columns: str = None,
+):
+    """
+    returns the flattened companies table as {column: [values]}, restricted to
+    the comma separated list of columns if given
+    """
+    table = await get_cached_async("companies_table")
+    selected = columns.split(",") if columns else table.column_names
+    unknown = [column for column in selected if column not in table.column_names]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"unknown columns: {unknown}")
+    # selecting columns does not copy the underlying buffers, converting
+    # them to python lists is done off the event loop
+    # the key names the table too: a call for a replaced table must not share
+    # the conversion of the old one
+    return await loader.run(
+        ("companies_table", id(table), tuple(selected)), lambda: table.select(selected).to_pydict())
+
+
+@router.get("/rankings/top")
+async def get_top_companies(
+    group_by: str = Query(..., regex="^(industry|sector)$"),
+    group: str = Query(...),
+    score: str = Query(...),
+    n: int = Query(10, ge=1, le=MAX_PAGE_SIZE),
+):
+    """
+    returns the n best companies of an industry or sector for a score
+    """
+    rankings = await get_cached_async("rankings")
+    if group not in rankings.rankings.get(group_by, {}):
+        raise HTTPException(status_code=404, detail=f"unknown {group_by} {group}")
+    return rankings.top(group_by, group, score, n=n)
+
+
+@router.get("/rankings/company")
+async def get_company_rank(
+    company_id: str,
+    group_by: str = Query(..., regex="^(industry|sector)$"),
+    score: str = None,
+):
+    """
+    returns the rank of a company within its industry or sector, for one
+    score or for every score
+    """
+    rankings = await get_cached_async("rankings")
+    scores = [score] if score else sorted(rankings.scores)
+    return {score: rankings.rank_of(group_by, company_id, score) for score in scores}
+
+
+@router.get("/cache_stats")
+async def get_cache_stats():
+    stats = cache.stats()
+    stats["company"] = company_cache.stats()
+    stats["loader"] = loader.stats()
+    stats["snapshot"] = snapshots.stats()
+    return stats
 
 app.include_router(router, prefix="/api/v1")
@@ -0,0 +1,150 @@
+import base64
+import hashlib
+import json
+import threading
+
+FILTER_FIELDS = ("industry", "sector", "company_size")
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+class InvalidSort(ValueError):
+    pass
+
+
+class CompanyIndex:
+    """
+    in-memory indexes over the companies metadata ({company_id: metadata}),
+    built once per data refresh: companies by industry / sector / company size
+    and companies sorted by each score
+    """
+
+    def __init__(self, companies: dict):
+        self.source = companies
+        self.company_ids = list(companies)
+        self.positions = {company_id: i for i, company_id in enumerate(self.company_ids)}
+        self.by_field = {field: {} for field in FILTER_FIELDS}
+        self.scores = {}
+        for company_id, company in companies.items():
+            for field in FILTER_FIELDS:
+                self.by_field[field].setdefault(company.get(field), set()).add(company_id)
+            for score, value in ((company.get("scores") or {}).get("score") or {}).items():
+                self.scores.setdefault(score, {})[company_id] = value
+        # identifies the indexed content, so that cursors stay valid across
+        # refreshes (and workers) as long as the results cannot change
+        self.version = hashlib.blake2b(json.dumps(
+            [self.company_ids, [[field, [company.get(field) for company in companies.values()]]
+                                for field in FILTER_FIELDS], self.scores],
+            sort_keys=True, default=str,
+        ).encode("utf-8"), digest_size=8).hexdigest()
+        self._sorted = {}
+        self._lock = threading.Lock()
+
+    def sorted_by(self, score: str):
+        """
+        returns the company ids sorted by decreasing score (companies without
+        this score last) and their {company_id: position}; computed once per
+        score. Raises InvalidSort if the values of the score are not numbers
+        """
+        result = self._sorted.get(score)
+        if result is None:
+            values = self.scores.get(score, {})
+            try:
+                ordered = sorted(
+                    self.company_ids,
+                    key=lambda company_id: (values.get(company_id) is None, -(values.get(company_id) or 0)),
+                )
+            except TypeError as e:
+                raise InvalidSort(f"the values of {score} are not all numbers, it cannot be sorted by") from e
+            result = (ordered, {company_id: i for i, company_id in enumerate(ordered)})
+            with self._lock:
+                self._sorted[score] = result
+        return result
+
+    def query(self, filters: dict = None, sort_by: str = None, ascending: bool = False) -> list:
+        """
+        returns the ids of the companies matching every filter ({field: value}),
+        sorted by score if sort_by is given, else in the order of the data
+        """
+        candidates = None
+        for field, value in (filters or {}).items():
+            if value is None:
+                continue
+            matches = self.by_field[field].get(value, set())
+            candidates = matches if candidates is None else candidates & matches
+        ordered, positions = self.sorted_by(sort_by) if sort_by else (self.company_ids, self.positions)
+        if candidates is not None:
+            # only the matching companies are sorted
+            ordered = sorted(candidates, key=positions.__getitem__)
+        if sort_by and ascending:
+            # keep the companies without score last
+            values = self.scores.get(sort_by, {})
+            with_score = [c for c in ordered if values.get(c) is not None]
+            ordered = with_score[::-1] + ordered[len(with_score):]
+        return ordered
+
+
+class CompanyIndexes:
+    """
+    keeps the index of the companies metadata, rebuilt only when the data
+    object it was built from is replaced
+    """
+
+    def __init__(self):
+        self._index = None
+        self._lock = threading.Lock()
+
+    def get(self, companies: dict):
+        index = self._index
+        if index is not None and index.source is companies:
+            return index
+        return None
+
+    def build(self, companies: dict) -> CompanyIndex:
+        index = self.get(companies)
+        if index is None:
+            index = CompanyIndex(companies)
+            with self._lock:
+                self._index = index
+        return index
+
+
+def encode_cursor(offset: int, version: str) -> str:
+    raw = json.dumps({"o": offset, "v": version}).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii")
+
+
+def decode_cursor(cursor: str, version: str) -> int:
+    """
+    returns the offset of a cursor, which must come from the same data version
+    """
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+        offset = int(payload["o"])
+    except (ValueError, KeyError, TypeError, AttributeError) as e:
+        raise InvalidCursor("invalid cursor") from e
+    if offset < 0:
+        raise InvalidCursor("invalid cursor")
+    if payload.get("v") != version:
+        raise InvalidCursor("the data changed since this cursor was issued, restart from the first page")
+    return offset
+
+
+def paginate(company_ids: list, version: str, cursor: str = None, limit: int = 100):
+    """
+    returns the page of company ids starting at the cursor, and the cursor of
+    the next page (None on the last page)
+    """
+    offset = decode_cursor(cursor, version) if cursor else 0
+    page = company_ids[offset:offset + limit]
+    next_offset = offset + limit
+    next_cursor = encode_cursor(next_offset, version) if next_offset < len(company_ids) else None
+    return page, next_cursor
+
+
+def project(record: dict, fields: list = None) -> dict:
+    if not fields:
+        return record
+    return {field: record[field] for field in fields if field in record}
@@ -0,0 +1,161 @@
+import gzip
+import hashlib
+import threading
+from fastapi import Request, Response
+from fastapi.responses import FileResponse, JSONResponse
+from core import json_codec
+
+try:
+    import brotli
+except ImportError:  # brotli responses are optional
+    brotli = None
+
+# content encodings a prepared response can be sent with, smallest first
+ENCODINGS = ("br", "gzip")
+
+
+def parse_accept_encoding(header: str) -> dict:
+    """
+    returns {encoding: q} for an Accept-Encoding header
+    """
+    encodings = {}
+    for part in header.split(","):
+        name, _, params = part.strip().partition(";")
+        if not name:
+            continue
+        q = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        encodings[name.strip().lower()] = q
+    return encodings
+
+
+class CodecJSONResponse(JSONResponse):
+    """
+    JSON response encoded with the codec of core.json_codec
+    """
+
+    def render(self, content) -> bytes:
+        return json_codec.dumps(content)
+
+
+class PreparedResponse:
+    """
+    a JSON body encoded once, with its compressed variants and ETag, that can
+    be sent as-is to every client asking for the same data
+    """
+
+    __slots__ = ("source", "body", "etag", "encoded")
+
+    def __init__(self, data):
+        self.source = data
+        self.body = json_codec.dumps(data)
+        self.etag = '"' + hashlib.blake2b(self.body, digest_size=16).hexdigest() + '"'
+        self.encoded = {"gzip": gzip.compress(self.body, compresslevel=6)}
+        if brotli is not None:
+            self.encoded["br"] = brotli.compress(self.body)
+
+    def select_encoding(self, accept_encoding: str):
+        accepted = parse_accept_encoding(accept_encoding)
+        for encoding in ENCODINGS:
+            q = accepted.get(encoding, accepted.get("*", 0.0))
+            if q > 0 and encoding in self.encoded:
+                return encoding
+        if accepted.get("identity", accepted.get("*", 1.0)) == 0:
+            # the client refuses the plain body: gzip is always available
+            return "gzip"
+        return None
+
+    def variant_etag(self, encoding) -> str:
+        """
+        the ETag of the body sent with the given content encoding; each variant
+        has its own strong ETag since their bytes differ
+        """
+        if encoding is None:
+            return self.etag
+        return self.etag[:-1] + "-" + encoding + '"'
+
+    def matches(self, if_none_match: str) -> bool:
+        """
+        whether an If-None-Match header names any variant of this body
+        """
+        digest = self.etag.strip('"')
+        for tag in if_none_match.split(","):
+            tag = tag.strip().removeprefix("W/")
+            if tag == "*":
+                return True
+            tag = tag.strip('"')
+            for encoding in ENCODINGS:
+                tag = tag.removesuffix("-" + encoding)
+            if tag == digest:
+                return True
+        return False
+
+    def to_response(self, request: Request, max_age: int) -> Response:
+        encoding = self.select_encoding(request.headers.get("accept-encoding", ""))
+        headers = {
+            "ETag": self.variant_etag(encoding),
+            "Cache-Control": f"public, max-age={max_age}",
+            "Vary": "Accept-Encoding",
+        }
+        if self.matches(request.headers.get("if-none-match", "")):
+            return Response(status_code=304, headers=headers)
+
+        if encoding is not None:
+            headers["Content-Encoding"] = encoding
+        return self.content_response(encoding, headers)
+
+    def content_response(self, encoding, headers: dict) -> Response:
+        content = self.body if encoding is None else self.encoded[encoding]
+        return Response(content=content, media_type="application/json", headers=headers)
+
+
+class FilePreparedResponse(PreparedResponse):
+    """
+    a prepared response whose body and compressed variants are files (see
+    app.shared_dataset), sent from the page cache shared by every worker
+    instead of being held in the memory of each of them
+    """
+
+    __slots__ = ("paths",)
+
+    def __init__(self, data, etag: str, paths: dict):
+        # paths: {"identity": body path, "gzip": ..., "br": ...}
+        self.source = data
+        self.etag = etag
+        self.paths = paths
+        self.body = None
+        self.encoded = {encoding: None for encoding in paths if encoding != "identity"}
+
+    def content_response(self, encoding, headers: dict) -> Response:
+        return FileResponse(
+            self.paths[encoding or "identity"], media_type="application/json", headers=headers)
+
+
+class PreparedResponses:
+    """
+    keeps the prepared response of each aggregate endpoint; a response is only
+    encoded again when the data object it was built from is replaced
+    """
+
+    def __init__(self):
+        self._prepared = {}
+        self._lock = threading.Lock()
+
+    def get(self, name: str, data):
+        prepared = self._prepared.get(name)
+        if prepared is not None and prepared.source is data:
+            return prepared
+        return None
+
+    def prepare(self, name: str, data) -> PreparedResponse:
+        prepared = self.get(name, data)
+        if prepared is None:
+            prepared = PreparedResponse(data)
+            with self._lock:
+                self._prepared[name] = prepared
+        return prepared
@@ -0,0 +1,246 @@
+# shared dataset of the multi-worker mode (see gunicorn.conf.py): a single
+# loader process materializes each version of the snapshot bundle (see
+# core.snapshot_bundle) into a local directory, and every worker maps it read
+# only instead of downloading and parsing a copy of its own:
+# - the encoded bodies of the aggregate routes, and their gzip / br variants,
+#   are files sent from the page cache
+# - all_company_data and all_companies are packed (the JSON documents of the
+#   companies, concatenated) and memory-mapped, a company is decoded when read
+# - the companies table is an Arrow IPC file, memory-mapped without copy
+# - the small objects (statistics, rankings) are decoded by each worker
+# A version is written in a directory of its own, which is then made current
+# by replacing current.json.
+
+import logging
+import mmap
+import os
+import shutil
+import time
+from collections.abc import Mapping
+from app.responses import FilePreparedResponse, PreparedResponse
+from core import json_codec
+from core.snapshot_bundle import SnapshotBundle
+
+try:
+    import pyarrow as pa
+except ImportError:  # the companies table is optional
+    pa = None
+
+logger = logging.getLogger(__name__)
+
+CURRENT_FILE = "current.json"
+MANIFEST_FILE = "dataset.json"
+# versions kept in the directory, for the workers still reading an older one
+SHARED_DATASET_KEEP_VERSIONS = int(os.getenv("SHARED_DATASET_KEEP_VERSIONS", "3"))
+# a replaced version is kept at least this long: the workers only switch to
+# the new one at their next refresh, and send the files of the old one until then
+SHARED_DATASET_RETAIN_SECONDS = float(os.getenv("SHARED_DATASET_RETAIN_SECONDS", "300"))
+
+# objects whose whole content is served as one encoded response
+PREPARED_OBJECTS = {"all_company_data", "all_companies", "industry_stats", "sector_stats"}
+# {company_id: data} objects, packed instead of being decoded by every worker
+PACKED_OBJECTS = ("all_company_data", "all_companies")
+
+
+class PackedMapping(Mapping):
+    """
+    read only {company_id: data} over a memory-mapped blob of JSON documents,
+    a company is only decoded when it is read
+    """
+
+    def __init__(self, blob, offsets: dict):
+        self._blob = blob
+        self._offsets = offsets
+
+    def __getitem__(self, company_id):
+        offset, length = self._offsets[company_id]
+        return json_codec.loads(self._blob[offset:offset + length])
+
+    def __contains__(self, company_id):
+        return company_id in self._offsets
+
+    def __iter__(self):
+        return iter(self._offsets)
+
+    def __len__(self):
+        return len(self._offsets)
+
+
+def _map_file(path: str):
+    with open(path, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return b""
+        return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+def _write(path: str, content: bytes):
+    with open(path, "wb") as f:
+        f.write(content)
+
+
+def _write_packed(path: str, companies: dict) -> dict:
+    offsets = {}
+    offset = 0
+    with open(path, "wb") as f:
+        for company_id, company_data in companies.items():
+            document = json_codec.dumps(company_data)
+            f.write(document)
+            offsets[company_id] = [offset, len(document)]
+            offset += len(document)
+    return offsets
+
+
+def _write_prepared(directory: str, name: str, data) -> dict:
+    prepared = PreparedResponse(data)
+    files = {"identity": f"{name}.json"}
+    _write(os.path.join(directory, files["identity"]), prepared.body)
+    for encoding, content in prepared.encoded.items():
+        files[encoding] = f"{name}.json.{encoding}"
+        _write(os.path.join(directory, files[encoding]), content)
+    return {"etag": prepared.etag, "files": files}
+
+
+def materialize_dataset(
+    snapshot: SnapshotBundle,
+    directory: str,
+    keep: int = SHARED_DATASET_KEEP_VERSIONS,
+    retain_seconds: float = SHARED_DATASET_RETAIN_SECONDS,
+) -> str:
+    """
+    writes a loaded bundle into directory/<version>/ and makes it the current
+    version; its objects are the {company_id: data} and statistics dicts, the
+    raw lines of the rankings and the companies table
+    """
+    version_dir = os.path.join(directory, snapshot.version)
+    if os.path.exists(os.path.join(version_dir, MANIFEST_FILE)):
+        _make_current(directory, snapshot.version)
+        return snapshot.version
+    tmp_dir = os.path.join(directory, f".{snapshot.version}.tmp")
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(tmp_dir)
+
+    manifest = {"version": snapshot.version, "created_at": snapshot.created_at,
+                "objects": {}, "responses": {}}
+    for name, data in snapshot.objects.items():
+        if name in PACKED_OBJECTS:
+            offsets = _write_packed(os.path.join(tmp_dir, f"{name}.bin"), data)
+            _write(os.path.join(tmp_dir, f"{name}.index.json"), json_codec.dumps(offsets))
+            manifest["objects"][name] = {"kind": "packed", "blob": f"{name}.bin",
+                                         "index": f"{name}.index.json"}
+        elif name == "companies_table":
+            if pa is None:
+                continue
+            with pa.OSFile(os.path.join(tmp_dir, f"{name}.arrow"), "wb") as sink:
+                with pa.ipc.new_file(sink, data.schema) as writer:
+                    writer.write_table(data)
+            manifest["objects"][name] = {"kind": "arrow", "file": f"{name}.arrow"}
+        elif isinstance(data, list):
+            _write(os.path.join(tmp_dir, f"{name}.jsonl"), b"\n".join(data))
+            manifest["objects"][name] = {"kind": "jsonl", "file": f"{name}.jsonl"}
+        elif name not in PREPARED_OBJECTS:
+            _write(os.path.join(tmp_dir, f"{name}.json"), json_codec.dumps(data))
+            manifest["objects"][name] = {"kind": "json", "file": f"{name}.json"}
+        if name in PREPARED_OBJECTS:
+            manifest["responses"][name] = _write_prepared(tmp_dir, name, data)
+            if name not in manifest["objects"]:
+                # small objects are decoded from their encoded body
+                manifest["objects"][name] = {"kind": "json", "file": f"{name}.json"}
+
+    _write(os.path.join(tmp_dir, MANIFEST_FILE), json_codec.dumps(manifest))
+    os.replace(tmp_dir, version_dir)
+    _make_current(directory, snapshot.version)
+    logger.info(f"materialized dataset {snapshot.version} in {directory}")
+    if keep:
+        prune_dataset_versions(directory, keep=keep, retain_seconds=retain_seconds)
+    return snapshot.version
+
+
+def _make_current(directory: str, version: str):
+    tmp_path = os.path.join(directory, f".{CURRENT_FILE}.tmp")
+    _write(tmp_path, json_codec.dumps({"version": version}))
+    os.replace(tmp_path, os.path.join(directory, CURRENT_FILE))
+
+
+def dataset_versions(directory: str) -> list:
+    return sorted(
+        entry.name for entry in os.scandir(directory)
+        if entry.is_dir() and not entry.name.startswith("."))
+
+
+def prune_dataset_versions(
+    directory: str,
+    keep: int = SHARED_DATASET_KEEP_VERSIONS,
+    retain_seconds: float = SHARED_DATASET_RETAIN_SECONDS,
+):
+    """
+    removes every version but the `keep` most recent ones, once the version
+    that replaced it was materialized more than retain_seconds ago. The
+    response files of a version are opened when they are sent, so a version is
+    only removed when no worker can still serve it; the packed and Arrow
+    files a worker mapped stay readable until it unmaps them.
+    """
+    current = read_current_version(directory)
+    versions = dataset_versions(directory)
+    now = time.time()
+    for version, newer in zip(versions[:-keep], versions[1:]):
+        if version == current:
+            continue
+        try:
+            replaced_at = os.path.getmtime(os.path.join(directory, newer, MANIFEST_FILE))
+        except FileNotFoundError:
+            continue
+        if now - replaced_at > retain_seconds:
+            shutil.rmtree(os.path.join(directory, version), ignore_errors=True)
+
+
+def read_current_version(directory: str):
+    """
+    returns the current version of the dataset, or None if there is none yet
+    """
+    try:
+        with open(os.path.join(directory, CURRENT_FILE), "rb") as f:
+            return json_codec.loads(f.read())["version"]
+    except FileNotFoundError:
+        return None
+
+
+def open_dataset(directory: str, version: str, transforms: dict = None) -> SnapshotBundle:
+    """
+    maps one version of the dataset as a SnapshotBundle, with the file-backed
+    responses of the aggregates in derived["responses"]; transforms are
+    applied to the lines of the JSON Lines objects (e.g. the rankings)
+    """
+    transforms = transforms or {}
+    version_dir = os.path.join(directory, version)
+    with open(os.path.join(version_dir, MANIFEST_FILE), "rb") as f:
+        manifest = json_codec.loads(f.read())
+
+    objects = {}
+    for name, entry in manifest["objects"].items():
+        if entry["kind"] == "packed":
+            with open(os.path.join(version_dir, entry["index"]), "rb") as f:
+                offsets = json_codec.loads(f.read())
+            objects[name] = PackedMapping(_map_file(os.path.join(version_dir, entry["blob"])), offsets)
+        elif entry["kind"] == "arrow":
+            if pa is None:
+                continue
+            source = pa.memory_map(os.path.join(version_dir, entry["file"]))
+            objects[name] = pa.ipc.open_file(source).read_all()
+        elif entry["kind"] == "jsonl":
+            with open(os.path.join(version_dir, entry["file"]), "rb") as f:
+                lines = f.read().split(b"\n")
+            transform = transforms.get(name)
+            objects[name] = lines if transform is None else transform(lines)
+        else:
+            with open(os.path.join(version_dir, entry["file"]), "rb") as f:
+                objects[name] = json_codec.loads(f.read())
+
+    snapshot = SnapshotBundle(manifest["version"], manifest.get("created_at"), objects)
+    snapshot.derived["responses"] = {
+        name: FilePreparedResponse(
+            objects[name], response["etag"],
+            {encoding: os.path.join(version_dir, file) for encoding, file in response["files"].items()})
+        for name, response in manifest["responses"].items()
+    }
+    return snapshot
+
@@ -0,0 +1,65 @@
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class SnapshotHolder:
+    """
+    holds the snapshot bundle served by the API. New versions are loaded by
+    load(current), which returns None when there is nothing new, on a
+    background thread, and replace the current one in a single assignment:
+    a request that reads `current` once sees one consistent version.
+    """
+
+    def __init__(self, load, refresh_seconds: float = 60):
+        self.load = load
+        self.refresh_seconds = refresh_seconds
+        self.current = None
+        self._refresh_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self._counters = {"checks": 0, "loads": 0, "failures": 0}
+
+    def refresh(self) -> bool:
+        """
+        loads and swaps in the latest version, returns whether it changed; a
+        failed load keeps the current version
+        """
+        with self._refresh_lock:
+            self._counters["checks"] += 1
+            try:
+                snapshot = self.load(self.current)
+            except Exception:
+                self._counters["failures"] += 1
+                logger.exception("failed to load the snapshot bundle")
+                return False
+            if snapshot is None:
+                return False
+            self.current = snapshot
+            self._counters["loads"] += 1
+            return True
+
+    def _run(self):
+        while not self._stop.wait(self.refresh_seconds):
+            self.refresh()
+
+    def start(self):
+        if self._thread is None:
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="snapshot-refresh", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def stats(self) -> dict:
+        stats = dict(self._counters)
+        snapshot = self.current
+        stats["version"] = snapshot.version if snapshot is not None else None
+        stats["age_seconds"] = time.time() - snapshot.loaded_at if snapshot is not None else None
+        return stats
@@ -0,0 +1,63 @@
+# compares IndustryInsights.industry_and_sector_comparisons to the row-wise
+# implementation it replaced
+#
+# usage (from src/): python -m benchmarks.bench_industry_insights --sizes 10000 100000 1000000
+
+import argparse
+import json
+import time
+import pandas as pd
+from benchmarks.synthetic import make_companies_df
+from core.industry_insights import IndustryInsights, SCORE_COLUMNS
+
+
+def legacy_industry_and_sector_comparisons(df: pd.DataFrame) -> pd.DataFrame:
+    for score in SCORE_COLUMNS:
+        df[f"{score} Rank by Industry"] = df.groupby("industry")[score].rank(ascending=False, method='min')
+        df[f"{score} Rank by Sector"] = df.groupby("sector")[score].rank(ascending=False, method='min')
+
+    for score in SCORE_COLUMNS:
+        total_companies_in_industry = df.groupby('industry').size()
+        total_companies_in_sector = df.groupby('sector').size()
+
+        df[f"{score} Top % by Industry"] = df.apply(lambda x: (x[f"{score} Rank by Industry"] / total_companies_in_industry[x['industry']]) * 100, axis=1)
+        df[f"{score} Top % by Sector"] = df.apply(lambda x: (x[f"{score} Rank by Sector"] / total_companies_in_sector[x['sector']]) * 100, axis=1)
+    return df
+
+
+def best_of(func, df: pd.DataFrame, repeat: int) -> float:
+    timings = []
+    for _ in range(repeat):
+        frame = df.copy()
+        start = time.perf_counter()
+        func(frame)
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000, 1_000_000])
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--legacy-max-rows", type=int, default=1_000_000,
+                        help="skip the row-wise implementation above this size")
+    args = parser.parse_args()
+
+    insights = IndustryInsights(service_endpoint=None, access_key_id=None, secret_access_key=None)
+    results = []
+    for size in args.sizes:
+        df = make_companies_df(size)
+        result = {
+            "rows": size,
+            "vectorized_s": best_of(insights.industry_and_sector_comparisons, df, args.repeat),
+        }
+        if size <= args.legacy_max_rows:
+            # the row-wise version is slow enough that one run is representative
+            result["legacy_s"] = best_of(legacy_industry_and_sector_comparisons, df, 1)
+            result["speedup"] = result["legacy_s"] / result["vectorized_s"]
+        results.append(result)
+        print(json.dumps(result))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+# compares the JSON codecs of core.json_codec on records shaped like our
+# JSON Lines files, against the str-based json.loads / json.dumps they replaced
+#
+# usage (from src/): python -m benchmarks.bench_json_codec --records 20000
+
+import argparse
+import json
+import time
+from benchmarks.synthetic import make_company_scores, make_companies_metadata, make_raw_profiles
+from core.json_codec import available_codecs
+
+SHAPES = {
+    "raw_profile": make_raw_profiles,
+    "company_scores": make_company_scores,
+    "companies_metadata": make_companies_metadata,
+}
+
+
+def best_of(func, repeat: int) -> float:
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def legacy_decode(lines: list):
+    # what the readers did: decode the file to str, then json.loads each line
+    for line in b"\n".join(lines).decode("utf-8").split("\n"):
+        json.loads(line)
+
+
+def legacy_encode(records: list):
+    for record in records:
+        json.dumps(record).encode("utf-8")
+
+
+def decode(codec, lines: list):
+    for line in lines:
+        codec.loads(line)
+
+
+def encode(codec, records: list):
+    for record in records:
+        codec.dumps(record)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--records", type=int, default=20_000)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--shapes", nargs="+", default=list(SHAPES), choices=list(SHAPES))
+    args = parser.parse_args()
+
+    codecs = available_codecs()
+    for shape in args.shapes:
+        records = SHAPES[shape](args.records)
+        lines = [json.dumps(record).encode("utf-8") for record in records]
+        size_mb = sum(len(line) for line in lines) / 1e6
+
+        legacy_decode_s = best_of(lambda: legacy_decode(lines), args.repeat)
+        legacy_encode_s = best_of(lambda: legacy_encode(records), args.repeat)
+        for name, codec in codecs.items():
+            decode_s = best_of(lambda: decode(codec, lines), args.repeat)
+            encode_s = best_of(lambda: encode(codec, records), args.repeat)
+            print(json.dumps({
+                "shape": shape,
+                "codec": name,
+                "records": args.records,
+                "mb": round(size_mb, 2),
+                "decode_mb_s": size_mb / decode_s,
+                "encode_mb_s": size_mb / encode_s,
+                "decode_speedup": legacy_decode_s / decode_s,
+                "encode_speedup": legacy_encode_s / encode_s,
+            }))
+
+
+if __name__ == "__main__":
+    main()
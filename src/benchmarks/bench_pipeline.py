@@ -0,0 +1,294 @@
+# end-to-end benchmarks of the read / score / aggregate / serve pipeline, on
+# synthetic data and against an in-process S3 stand-in (moto), so that results
+# are reproducible and can be compared between commits:
+# - download_parse: write, full read, streamed read and concurrent bulk read
+#   of raw_data files
+# - scorecard_input / scorecard_batch: sampled input stage, and the batch
+#   runner when the diversity package is importable
+# - insights: companies table, comparisons and the full insights job
+# - api: latency percentiles and throughput of the main routes
+#
+# usage (from src/): python -m benchmarks.bench_pipeline --scale small --output bench.json
+
+import argparse
+import asyncio
+import json
+import os
+import platform
+import subprocess
+import time
+
+# moto intercepts the AWS endpoints, the modules read these at import time so
+# they are set before anything from core, services or app is imported
+LOCAL_ENDPOINT = "https://s3.us-east-1.amazonaws.com"
+BUCKET = "dei-bucket"
+
+SCALES = {
+    "small": {"raw_files": 4, "raw_lines": 5_000, "companies": 2_000,
+              "api_requests": 200, "api_concurrency": 8},
+    "medium": {"raw_files": 8, "raw_lines": 50_000, "companies": 20_000,
+               "api_requests": 1_000, "api_concurrency": 16},
+    "large": {"raw_files": 16, "raw_lines": 200_000, "companies": 100_000,
+              "api_requests": 5_000, "api_concurrency": 32},
+}
+BENCHMARKS = ("download_parse", "scorecards", "insights", "api")
+
+
+def configure_local_s3():
+    os.environ["SERVICE_ENDPOINT"] = LOCAL_ENDPOINT
+    os.environ["ACCESS_KEY_ID"] = "benchmark"
+    os.environ["SECRET_ACCESS_KEY"] = "benchmark"
+    os.environ["AWS_DEFAULT_REGION"] = "us-east-1"
+    os.environ["CACHE_WARM_ON_STARTUP"] = "0"
+
+
+def credentials() -> dict:
+    return {
+        "service_endpoint": LOCAL_ENDPOINT,
+        "access_key_id": "benchmark",
+        "secret_access_key": "benchmark",
+    }
+
+
+def timed(func, *args, **kwargs):
+    start = time.perf_counter()
+    result = func(*args, **kwargs)
+    return time.perf_counter() - start, result
+
+
+def percentile(sorted_values: list, q: float) -> float:
+    if not sorted_values:
+        return None
+    return sorted_values[min(len(sorted_values) - 1, int(q * len(sorted_values)))]
+
+
+def object_size(key: str) -> int:
+    from core.s3_client import get_s3_client
+    return get_s3_client(**credentials()).head_object(Bucket=BUCKET, Key=key)["ContentLength"]
+
+
+def bench_download_parse(params: dict) -> list:
+    from benchmarks.synthetic import make_raw_profiles
+    from core.s3_utilities import (
+        fetch_jsonl_files,
+        iter_jsonl_file,
+        read_jsonl_file,
+        save_records_to_s3_as_jsonl_file,
+    )
+
+    keys = [f"raw_data/company_{i}.jsonl.gz" for i in range(params["raw_files"])]
+    profiles = make_raw_profiles(params["raw_lines"])
+    write_s = 0
+    for key in keys:
+        duration, _ = timed(save_records_to_s3_as_jsonl_file, profiles, bucket_name=BUCKET,
+                            object_path=key, **credentials())
+        write_s += duration
+    compressed_mb = sum(object_size(key) for key in keys) / 1e6
+    nb_records = params["raw_lines"] * len(keys)
+
+    read_s = sum(timed(read_jsonl_file, bucket_name=BUCKET, object_path=key, **credentials())[0]
+                 for key in keys)
+    stream_s = sum(timed(lambda key: sum(1 for _ in iter_jsonl_file(
+        bucket_name=BUCKET, object_path=key, **credentials())), key)[0] for key in keys)
+    bulk_s, _ = timed(lambda: sum(1 for _ in fetch_jsonl_files(
+        keys, bucket_name=BUCKET, return_lines=True, **credentials())))
+    return [{
+        "benchmark": "download_parse",
+        "files": len(keys),
+        "records": nb_records,
+        "compressed_mb": compressed_mb,
+        "write_records_s": nb_records / write_s,
+        "read_records_s": nb_records / read_s,
+        "read_compressed_mb_s": compressed_mb / read_s,
+        "stream_records_s": nb_records / stream_s,
+        "bulk_read_records_s": nb_records / bulk_s,
+    }]
+
+
+def bench_scorecards(params: dict, workers: int) -> list:
+    from core.s3_utilities import sample_jsonl_file
+
+    keys = [f"raw_data/company_{i}.jsonl.gz" for i in range(params["raw_files"])]
+    sample_size = max(1, params["raw_lines"] // 10)
+    results = []
+    for mode in ("head", "reservoir"):
+        duration = sum(timed(lambda key: sum(1 for _ in sample_jsonl_file(
+            bucket_name=BUCKET, object_path=key, n=sample_size, mode=mode, seed=key,
+            return_lines=True, **credentials())), key)[0] for key in keys)
+        results.append({
+            "benchmark": "scorecard_input",
+            "mode": mode,
+            "files": len(keys),
+            "sample_size": sample_size,
+            "seconds_per_file": duration / len(keys),
+        })
+
+    try:
+        from services.run_scorecards import run_all_scores
+    except ImportError as e:
+        results.append({"benchmark": "scorecard_batch", "skipped": f"cannot import the runner: {e}"})
+        return results
+    # the pool workers are forked and inherit the S3 stand-in
+    duration, report = timed(run_all_scores, workers=workers, force=True, sample_size=sample_size)
+    results.append({
+        "benchmark": "scorecard_batch",
+        "files": len(keys),
+        "workers": workers,
+        "seconds": duration,
+        "failed": report["nb_failed"],
+    })
+    return results
+
+
+def bench_insights(params: dict) -> list:
+    from benchmarks.synthetic import make_companies_metadata
+    from core.industry_insights import IndustryInsights
+    from core.s3_utilities import save_records_to_s3_as_jsonl_file
+
+    save_records_to_s3_as_jsonl_file(
+        make_companies_metadata(params["companies"]), bucket_name=BUCKET,
+        object_path="company_scores/all/companies_metadata.jsonl.gz", **credentials())
+    insights = IndustryInsights(bucket_name=BUCKET, **credentials())
+    table_s, df = timed(insights.get_data_across_companies)
+    comparisons_s, _ = timed(insights.industry_and_sector_comparisons, df.copy())
+    job_s, _ = timed(insights.run_and_save_industry_and_sector_stats)
+    return [{
+        "benchmark": "insights",
+        "companies": params["companies"],
+        "companies_table_s": table_s,
+        "comparisons_s": comparisons_s,
+        "insights_job_s": job_s,
+    }]
+
+
+async def _measure_route(client, path: str, nb_requests: int, concurrency: int) -> dict:
+    # the first request loads the data, it is reported on its own
+    start = time.perf_counter()
+    response = await client.get(path)
+    cold_ms = (time.perf_counter() - start) * 1000
+    if response.status_code != 200:
+        return {"path": path, "error": response.status_code}
+
+    latencies = []
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one():
+        async with semaphore:
+            request_start = time.perf_counter()
+            await client.get(path)
+            latencies.append((time.perf_counter() - request_start) * 1000)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one() for _ in range(nb_requests)))
+    duration = time.perf_counter() - start
+    latencies.sort()
+    return {
+        "path": path,
+        "cold_ms": cold_ms,
+        "p50_ms": percentile(latencies, 0.5),
+        "p95_ms": percentile(latencies, 0.95),
+        "p99_ms": percentile(latencies, 0.99),
+        "requests_s": nb_requests / duration,
+    }
+
+
+def bench_api(params: dict) -> list:
+    import httpx
+    from benchmarks.synthetic import make_company_scores
+    from core.company_store import publish_packed_company_store
+    from core.s3_utilities import save_records_to_s3_as_jsonl_file
+
+    scores = make_company_scores(params["companies"])
+    save_records_to_s3_as_jsonl_file(
+        scores, bucket_name=BUCKET,
+        object_path="company_scores/all/all_companies.jsonl.gz", **credentials())
+    companies = {}
+    for record in scores:
+        companies.update(record)
+    publish_packed_company_store(companies, bucket_name=BUCKET, **credentials())
+
+    from app.main import app
+    paths = [
+        "/api/v1/all_companies",
+        "/api/v1/all_companies?industry=industry_1&sort_by=Retention&limit=50",
+        "/api/v1/company?company_id=1",
+        "/api/v1/industry_stats",
+        "/api/v1/rankings/top?group_by=industry&group=industry_1&score=Retention Score&n=10",
+    ]
+
+    async def run():
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://benchmark") as client:
+            return [await _measure_route(client, path, params["api_requests"], params["api_concurrency"])
+                    for path in paths]
+
+    return [dict(benchmark="api", requests=params["api_requests"],
+                 concurrency=params["api_concurrency"], **route)
+            for route in asyncio.run(run())]
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--scale", choices=list(SCALES), default="small")
+    parser.add_argument("--raw-files", type=int)
+    parser.add_argument("--raw-lines", type=int)
+    parser.add_argument("--companies", type=int)
+    parser.add_argument("--api-requests", type=int)
+    parser.add_argument("--api-concurrency", type=int)
+    parser.add_argument("--workers", type=int, default=2, help="scorecard batch workers")
+    parser.add_argument("--only", nargs="+", choices=BENCHMARKS, default=list(BENCHMARKS))
+    parser.add_argument("--output", help="path of the JSON results file")
+    args = parser.parse_args()
+
+    params = dict(SCALES[args.scale])
+    for name in params:
+        if getattr(args, name) is not None:
+            params[name] = getattr(args, name)
+
+    configure_local_s3()
+    from moto import mock_aws
+    from core import json_codec
+    from core.s3_client import get_s3_client
+
+    results = []
+    with mock_aws():
+        get_s3_client(**credentials()).create_bucket(Bucket=BUCKET)
+        # the scorecard input reads the raw files written by download_parse,
+        # and the API serves what the insights job wrote
+        if "download_parse" in args.only or "scorecards" in args.only:
+            results += bench_download_parse(params)
+        if "scorecards" in args.only:
+            results += bench_scorecards(params, workers=args.workers)
+        if "insights" in args.only or "api" in args.only:
+            results += bench_insights(params)
+        if "api" in args.only:
+            results += bench_api(params)
+    for result in results:
+        print(json.dumps(result))
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({
+                "meta": {
+                    "scale": args.scale,
+                    "params": params,
+                    "timestamp": time.time(),
+                    "git_commit": git_commit(),
+                    "python": platform.python_version(),
+                    "platform": platform.platform(),
+                    "json_codec": json_codec.CODEC.name,
+                },
+                "results": results,
+            }, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
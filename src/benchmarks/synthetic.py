@@ -0,0 +1,101 @@
+# synthetic data shaped like the company_scores aggregates, for benchmarks
+
+import numpy as np
+import pandas as pd
+from core.industry_insights import SCORE_COLUMNS
+
+
+def make_companies_df(
+    nb_companies: int,
+    nb_industries: int = 150,
+    nb_sectors: int = 12,
+    seed: int = 0,
+) -> pd.DataFrame:
+    """
+    returns a flattened companies table like IndustryInsights.get_data_across_companies
+    """
+    rng = np.random.default_rng(seed)
+    industries = np.array([f"industry_{i}" for i in range(nb_industries)])
+    industry_idx = rng.integers(0, nb_industries, nb_companies)
+    df = pd.DataFrame({
+        "company_name": [f"company {i}" for i in range(nb_companies)],
+        "industry": industries[industry_idx],
+        # every industry belongs to a single sector
+        "sector": [f"sector_{i % nb_sectors}" for i in industry_idx],
+        "company_size": rng.choice(["1-10", "11-50", "51-200", "201-500", "501+"], nb_companies),
+        "company_website": [f"https://company{i}.com" for i in range(nb_companies)],
+        "company_id": [str(i) for i in range(nb_companies)],
+    })
+    for score in SCORE_COLUMNS:
+        values = rng.integers(0, 101, nb_companies).astype(float)
+        # some companies miss some scores
+        values[rng.random(nb_companies) < 0.05] = np.nan
+        df[score] = values
+    return df
+
+
+def make_raw_profiles(nb_profiles: int, seed: int = 0) -> list:
+    """
+    returns records shaped like the lines of raw_data/<company>.jsonl.gz:
+    one employee profile with its work history and education
+    """
+    rng = np.random.default_rng(seed)
+    profiles = []
+    for i in range(nb_profiles):
+        experiences = [
+            {
+                "company": f"company {rng.integers(0, 1000)}",
+                "title": f"title {rng.integers(0, 300)}",
+                "location": "San Francisco Bay Area",
+                "starts_at": {"day": 1, "month": int(rng.integers(1, 13)), "year": int(rng.integers(1990, 2023))},
+                "ends_at": None if j == 0 else {"day": 1, "month": 6, "year": 2020},
+                "description": "lorem ipsum dolor sit amet " * int(rng.integers(0, 8)),
+            }
+            for j in range(int(rng.integers(1, 6)))
+        ]
+        profiles.append({
+            "public_identifier": f"profile-{i}",
+            "full_name": f"First{i} Last{i}",
+            "gender": rng.choice(["female", "male", None]),
+            "ethnicity": rng.choice(["asian", "black", "hispanic", "white", None]),
+            "city": "San Francisco",
+            "country": "US",
+            "experiences": experiences,
+            "education": [{"school": f"school {rng.integers(0, 500)}", "degree_name": "BSc"}],
+        })
+    return profiles
+
+
+def make_company_scores(nb_companies: int, nb_years: int = 5, seed: int = 0) -> list:
+    """
+    returns {company_id: scorecard} records shaped like the lines of
+    company_scores/all/all_companies.jsonl.gz
+    """
+    rng = np.random.default_rng(seed)
+    records = []
+    for i in range(nb_companies):
+        scorecard = {
+            str(2018 + year): {
+                f"{group}_{metric}": float(rng.random())
+                for group in ("women", "men", "asian", "black", "hispanic", "white")
+                for metric in ("share", "hired", "left", "promoted")
+            }
+            for year in range(nb_years)
+        }
+        scorecard["score"] = {score: float(rng.integers(0, 101)) for score in SCORE_COLUMNS}
+        records.append({str(i): scorecard})
+    return records
+
+
+def make_companies_metadata(nb_companies: int, seed: int = 0) -> list:
+    """
+    returns {company_id: metadata} records shaped like the lines of
+    company_scores/all/companies_metadata.jsonl.gz, with their scores
+    """
+    df = make_companies_df(nb_companies, seed=seed)
+    records = []
+    for row in df.to_dict(orient="records"):
+        scores = {score[:-len(" Score")]: row.pop(score) for score in SCORE_COLUMNS}
+        row["scores"] = {"score": {name: value for name, value in scores.items() if value == value}}
+        records.append({row["company_id"]: row})
+    return records
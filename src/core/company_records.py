@@ -0,0 +1,119 @@
+# typed records of the companies metadata (company_scores/all/companies_metadata.jsonl.gz).
+# Each {company_id: metadata} line is decoded into a CompanyRecord with fixed
+# slots, the five scores flattened into float fields, and checked against the
+# expected schema so that a renamed or retyped field fails at decode time
+# instead of silently becoming NaN in the statistics.
+
+import sys
+import numpy as np
+import pandas as pd
+from core import json_codec
+from core.metrics import METRICS
+
+TEXT_FIELDS = (
+    "company_name",
+    "industry",
+    "sector",
+    "company_size",
+    "company_website",
+    "company_id",
+)
+# fields with few distinct values, interned so that companies share them
+SHARED_TEXT_FIELDS = ("industry", "sector", "company_size")
+# name in scores.score -> record attribute; the table column is "<name> Score"
+SCORE_FIELDS = {
+    "Talent Pipeline": "talent_pipeline",
+    "Retention": "retention",
+    "Access & Advancement": "access_and_advancement",
+    "Representation": "representation",
+    "Historical": "historical",
+}
+
+
+class SchemaDriftError(ValueError):
+    pass
+
+
+class CompanyRecord:
+    __slots__ = TEXT_FIELDS + tuple(SCORE_FIELDS.values())
+
+    def __init__(self, **fields):
+        for name in self.__slots__:
+            setattr(self, name, fields.get(name))
+
+    def __repr__(self):
+        return f"CompanyRecord(company_id={self.company_id!r}, company_name={self.company_name!r})"
+
+
+def _drift(key, message: str):
+    return SchemaDriftError(f"company {key!r}: {message}")
+
+
+def decode_company(key: str, metadata) -> CompanyRecord:
+    """
+    returns the CompanyRecord of the metadata of one company, raises
+    SchemaDriftError if it does not have the expected schema
+    """
+    if not isinstance(metadata, dict):
+        raise _drift(key, f"expected an object, got {type(metadata).__name__}")
+    record = CompanyRecord.__new__(CompanyRecord)
+    for field in TEXT_FIELDS:
+        value = metadata.get(field)
+        if value is not None and not isinstance(value, str):
+            raise _drift(key, f"{field} should be a string, got {type(value).__name__}")
+        if field in SHARED_TEXT_FIELDS and value is not None:
+            value = sys.intern(value)
+        setattr(record, field, value)
+    if record.company_id is None:
+        record.company_id = key
+
+    scores = metadata.get("scores") or {}
+    if not isinstance(scores, dict):
+        raise _drift(key, f"scores should be an object, got {type(scores).__name__}")
+    scores = scores.get("score") or {}
+    if not isinstance(scores, dict):
+        raise _drift(key, f"scores.score should be an object, got {type(scores).__name__}")
+    unknown = set(scores) - set(SCORE_FIELDS)
+    if unknown:
+        raise _drift(key, f"unknown scores {sorted(unknown)}, expected {list(SCORE_FIELDS)}")
+    for name, attribute in SCORE_FIELDS.items():
+        value = scores.get(name)
+        if value is not None:
+            if isinstance(value, bool) or not isinstance(value, (int, float)):
+                raise _drift(key, f"score {name!r} should be a number, got {value!r}")
+            value = float(value)
+        setattr(record, attribute, value)
+    return record
+
+
+def decode_company_records(json_lines: list) -> list:
+    """
+    decodes the {company_id: metadata} JSON Lines (str or bytes) of the
+    companies metadata into CompanyRecords; the dicts of a line are dropped
+    as soon as its records are built. Like merging the lines into one dict, a
+    company_id that appears twice keeps its first position and its last metadata
+    """
+    records = {}
+    with METRICS.stage("company_records_decode"):
+        for number, line in enumerate(json_lines, start=1):
+            if not line:
+                continue
+            companies = json_codec.loads(line)
+            if not isinstance(companies, dict):
+                raise SchemaDriftError(f"line {number}: expected an object, got {type(companies).__name__}")
+            for key, metadata in companies.items():
+                records[key] = decode_company(key, metadata)
+    METRICS.add_records("company_records_decode", len(records))
+    return list(records.values())
+
+
+def records_to_dataframe(records: list) -> pd.DataFrame:
+    """
+    returns the flattened companies table, built column by column from the records
+    """
+    columns = {field: [getattr(record, field) for record in records] for field in TEXT_FIELDS}
+    for name, attribute in SCORE_FIELDS.items():
+        # missing scores become NaN
+        columns[f"{name} Score"] = np.array(
+            [getattr(record, attribute) for record in records], dtype=float)
+    return pd.DataFrame(columns)
@@ -0,0 +1,238 @@
+# packed company store: every company of company_scores/all/all_companies.jsonl.gz
+# is gzipped on its own and appended to one blob, and an index maps each
+# company_id to the (offset, length) of its member in the blob. A single
+# company then costs one small ranged GET, or a seek in a local mmap copy.
+
+import gzip
+import hashlib
+import logging
+import mmap
+import os
+import shutil
+import tempfile
+import threading
+import time
+from botocore.exceptions import ClientError
+from core import json_codec
+from core.s3_client import get_s3_client
+from core.s3_utilities import read_object_revalidated
+
+logger = logging.getLogger(__name__)
+
+PACKED_BLOB_PATH = "company_scores/packed/companies.bin"
+PACKED_INDEX_PATH = "company_scores/packed/index.json"
+# index of a store that was not published (yet)
+EMPTY_INDEX = {"blob_path": PACKED_BLOB_PATH, "blob_etag": None, "blob_size": 0, "offsets": {}}
+
+
+def pack_companies(companies: dict):
+    """
+    returns the packed blob and its index {company_id: [offset, length]} for
+    a dict of company_id -> company data
+    """
+    members = []
+    index = {}
+    offset = 0
+    for company_id, company_data in companies.items():
+        member = gzip.compress(json_codec.dumps(company_data))
+        index[company_id] = [offset, len(member)]
+        members.append(member)
+        offset += len(member)
+    return b''.join(members), index
+
+
+def unpack_company(member: bytes) -> dict:
+    return json_codec.loads(gzip.decompress(member))
+
+
+def publish_packed_company_store(
+    companies: dict,
+    service_endpoint: str,
+    access_key_id: str,
+    secret_access_key: str,
+    bucket_name: str = "dei-bucket",
+):
+    """
+    uploads the packed blob, then the index; the index records the ETag of
+    the blob it describes so that readers never mix two versions
+    """
+    blob, offsets = pack_companies(companies)
+    s3 = get_s3_client(service_endpoint=service_endpoint,
+                       access_key_id=access_key_id,
+                       secret_access_key=secret_access_key)
+    response = s3.put_object(Body=blob, Bucket=bucket_name, Key=PACKED_BLOB_PATH)
+    index = {
+        "blob_path": PACKED_BLOB_PATH,
+        "blob_etag": response.get('ETag'),
+        "blob_size": len(blob),
+        "offsets": offsets,
+    }
+    s3.put_object(
+        Body=json_codec.dumps(index),
+        Bucket=bucket_name,
+        Key=PACKED_INDEX_PATH,
+        ContentType='application/json',
+    )
+    logger.info(f"packed {len(offsets)} companies in {len(blob)} bytes")
+    return index
+
+
+class PackedCompanyStore:
+    """
+    reads single companies from the packed store, either with ranged GETs or,
+    when local_dir is set, from a memory-mapped local copy of the blob
+    """
+
+    def __init__(
+        self,
+        service_endpoint: str,
+        access_key_id: str,
+        secret_access_key: str,
+        bucket_name: str = "dei-bucket",
+        local_dir: str = None,
+        index_ttl: float = 60,
+    ):
+        self.service_endpoint = service_endpoint
+        self.access_key_id = access_key_id
+        self.secret_access_key = secret_access_key
+        self.bucket_name = bucket_name
+        self.local_dir = local_dir
+        self.index_ttl = index_ttl
+        self._index = None
+        self._index_checked_at = 0
+        self._maps = {}
+        self._lock = threading.Lock()
+
+    def _client(self):
+        return get_s3_client(
+            service_endpoint=self.service_endpoint,
+            access_key_id=self.access_key_id,
+            secret_access_key=self.secret_access_key,
+        )
+
+    def index(self) -> dict:
+        """
+        returns the index kept in memory; it is revalidated at most every
+        index_ttl seconds and only downloaded again when it changed. Until a
+        store is published, the index is empty and the absence is cached for
+        index_ttl seconds too
+        """
+        now = time.monotonic()
+        if self._index is None or now - self._index_checked_at > self.index_ttl:
+            try:
+                self._index = read_object_revalidated(
+                    service_endpoint=self.service_endpoint,
+                    access_key_id=self.access_key_id,
+                    secret_access_key=self.secret_access_key,
+                    bucket_name=self.bucket_name,
+                    object_path=PACKED_INDEX_PATH,
+                    decode=json_codec.loads,
+                )
+            except ClientError as e:
+                if e.response.get('Error', {}).get('Code') not in ('NoSuchKey', '404'):
+                    raise
+                self._index = EMPTY_INDEX
+            self._index_checked_at = now
+        return self._index
+
+    def __contains__(self, company_id: str) -> bool:
+        return company_id in self.index()["offsets"]
+
+    def get(self, company_id: str):
+        """
+        returns the data of one company, or None if it is not in the store
+        """
+        for _ in range(2):
+            index = self.index()
+            position = index["offsets"].get(company_id)
+            if position is None:
+                return None
+            offset, length = position
+            if self.local_dir:
+                blob = self._local_blob(index)
+                if blob is not None:
+                    return unpack_company(blob[offset:offset + length])
+                member = None
+            else:
+                member = self._ranged_read(index, offset, length)
+            if member is not None:
+                return unpack_company(member)
+            # the blob was republished after this index was loaded
+            self._index = None
+        raise RuntimeError("the packed company store keeps changing while being read")
+
+    def _ranged_read(self, index: dict, offset: int, length: int) -> bytes:
+        """
+        reads one member of the blob, returns None if the blob no longer
+        matches the index
+        """
+        try:
+            response = self._client().get_object(
+                Bucket=self.bucket_name,
+                Key=index["blob_path"],
+                Range=f"bytes={offset}-{offset + length - 1}",
+                IfMatch=index["blob_etag"],
+            )
+        except ClientError as e:
+            if e.response.get('Error', {}).get('Code') in ('PreconditionFailed', '412'):
+                return None
+            raise
+        return response['Body'].read()
+
+    def _local_blob(self, index: dict):
+        """
+        returns the memory-mapped local copy of the blob, downloading it if
+        needed; returns None if the blob no longer matches the index
+        """
+        etag = index["blob_etag"]
+        with self._lock:
+            blob = self._maps.get(etag)
+            if blob is not None:
+                return blob
+            name = hashlib.sha256(f"{self.bucket_name}/{index['blob_path']}/{etag}".encode()).hexdigest()
+            local_path = os.path.join(self.local_dir, f"{name}.bin")
+            try:
+                f = open(local_path, "rb")
+            except FileNotFoundError:
+                if not self._download_blob(index, local_path):
+                    return None
+                f = open(local_path, "rb")
+            with f:
+                blob = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            # older versions are dropped, and unmapped once no reader uses them
+            self._maps = {etag: blob}
+            self._prune_local_blobs(keep=local_path)
+            return blob
+
+    def _download_blob(self, index: dict, local_path: str) -> bool:
+        os.makedirs(self.local_dir, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=self.local_dir)
+        os.close(fd)
+        try:
+            response = self._client().get_object(
+                Bucket=self.bucket_name, Key=index["blob_path"], IfMatch=index["blob_etag"])
+            with open(tmp_path, "wb") as f:
+                shutil.copyfileobj(response['Body'], f)
+            os.replace(tmp_path, local_path)
+        except ClientError as e:
+            os.remove(tmp_path)
+            if e.response.get('Error', {}).get('Code') in ('PreconditionFailed', '412'):
+                return False
+            raise
+        except BaseException:
+            os.remove(tmp_path)
+            raise
+        return True
+
+    def _prune_local_blobs(self, keep: str):
+        """
+        removes the copies of older blobs; the processes that mapped one keep
+        reading it, the others download the current blob once their index is
+        revalidated
+        """
+        for entry in os.scandir(self.local_dir):
+            if entry.name.endswith(".bin") and entry.path != keep:
+                try:
+                    os.remove(entry.path)
+                except FileNotFoundError:
+                    pass
@@ -0,0 +1,253 @@
+# local disk cache of S3 objects, shared by every process of the machine
+# (uvicorn workers, scorecard pool processes, insights runs). Objects are
+# stored by content, under a hash of endpoint/bucket/key/ETag, and a small ref
+# file per key remembers the last ETag seen so that reads are a conditional GET:
+# an unchanged object costs a 304 and no transfer. Files are written to a
+# temporary file then renamed, downloads of the same object are serialized
+# with file locks, and the least recently used objects are evicted above a
+# size cap. The cache relies on flock, it is disabled where fcntl is missing.
+
+import hashlib
+import logging
+import os
+import shutil
+import tempfile
+import time
+from contextlib import contextmanager
+from botocore.exceptions import ClientError
+from core.metrics import METRICS
+
+try:
+    import fcntl
+except ImportError:  # e.g. on Windows
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+DISK_CACHE_DIR = os.getenv("S3_DISK_CACHE_DIR")
+DISK_CACHE_MAX_BYTES = int(os.getenv("S3_DISK_CACHE_MAX_BYTES", str(10 * 1024 ** 3)))
+
+
+def _digest(*parts) -> str:
+    return hashlib.sha256("\0".join(str(part) for part in parts).encode("utf-8")).hexdigest()
+
+
+def _write_atomically(directory: str, path: str, write):
+    fd, tmp_path = tempfile.mkstemp(dir=directory)
+    try:
+        with os.fdopen(fd, "wb") as f:
+            write(f)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+
+
+class DiskCache:
+    def __init__(self, directory: str, max_bytes: int = DISK_CACHE_MAX_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        for name in ("blobs", "refs", "locks", "tmp"):
+            os.makedirs(os.path.join(directory, name), exist_ok=True)
+        self.clear_stale_tmp()
+
+    def _blob_path(self, endpoint, bucket: str, key: str, etag: str) -> str:
+        return os.path.join(self.directory, "blobs", _digest(endpoint, bucket, key, etag))
+
+    def _ref_path(self, endpoint, bucket: str, key: str) -> str:
+        return os.path.join(self.directory, "refs", _digest(endpoint, bucket, key))
+
+    @contextmanager
+    def _lock(self, name: str, blocking: bool = True):
+        """
+        holds an exclusive lock on a lock file; yields False when not
+        blocking and another process holds it
+        """
+        path = os.path.join(self.directory, "locks", f"{name}.lock")
+        with open(path, "a") as f:
+            try:
+                fcntl.flock(f, fcntl.LOCK_EX | (0 if blocking else fcntl.LOCK_NB))
+            except BlockingIOError:
+                yield False
+                return
+            try:
+                yield True
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def _read_ref(self, ref_path: str):
+        try:
+            with open(ref_path) as f:
+                return f.read() or None
+        except FileNotFoundError:
+            return None
+
+    def _forget(self, ref_path: str):
+        try:
+            os.remove(ref_path)
+        except FileNotFoundError:
+            pass
+
+    def fetch(self, s3, bucket: str, key: str) -> tuple:
+        """
+        returns the local path and ETag of the current version of an object,
+        downloading it only if this version is not in the cache yet
+        """
+        endpoint = s3.meta.endpoint_url
+        ref_path = self._ref_path(endpoint, bucket, key)
+        etag = self._read_ref(ref_path)
+        request = {"Bucket": bucket, "Key": key}
+        if etag is not None and os.path.exists(self._blob_path(endpoint, bucket, key, etag)):
+            request["IfNoneMatch"] = etag
+        try:
+            # a 304 is timed as well, it is a round trip to S3
+            with METRICS.stage("s3_get"):
+                response = s3.get_object(**request)
+        except ClientError as e:
+            # imported here: core.s3_utilities imports this module
+            from core.s3_utilities import _is_not_modified
+            if "IfNoneMatch" in request and _is_not_modified(e):
+                METRICS.inc("dei_disk_cache_hits_total")
+                path = self._blob_path(endpoint, bucket, key, etag)
+                try:
+                    # the modification time orders the evictions
+                    os.utime(path)
+                    return path, etag
+                except FileNotFoundError:
+                    # evicted in the meantime, download it again
+                    self._forget(ref_path)
+                    return self.fetch(s3, bucket, key)
+            raise
+
+        etag = response.get('ETag')
+        path = self._blob_path(endpoint, bucket, key, etag)
+        # downloads are serialized over 256 lock files (first byte of the hash)
+        with self._lock(os.path.basename(path)[:2]):
+            if os.path.exists(path):
+                # another process downloaded it while we were waiting
+                response['Body'].close()
+                os.utime(path)
+            else:
+                with METRICS.stage("disk_cache_fill"):
+                    _write_atomically(
+                        os.path.join(self.directory, "tmp"), path,
+                        lambda f: shutil.copyfileobj(response['Body'], f, 1024 * 1024))
+                METRICS.add_bytes("get", os.path.getsize(path))
+        _write_atomically(
+            os.path.join(self.directory, "tmp"), ref_path,
+            lambda f: f.write((etag or "").encode("utf-8")))
+        self.evict(keep=path)
+        return path, etag
+
+    def open_stream(self, s3, bucket: str, key: str) -> tuple:
+        """
+        returns (file, cached) to stream the current version of an object:
+        the cached file if this version is in the cache, the body of the GET
+        otherwise. The body is not written to the cache, so that a reader
+        stopping early (e.g. a head sample) does not download the whole object
+        """
+        endpoint = s3.meta.endpoint_url
+        ref_path = self._ref_path(endpoint, bucket, key)
+        etag = self._read_ref(ref_path)
+        request = {"Bucket": bucket, "Key": key}
+        if etag is not None and os.path.exists(self._blob_path(endpoint, bucket, key, etag)):
+            request["IfNoneMatch"] = etag
+        try:
+            # a 304 is timed as well, it is a round trip to S3
+            with METRICS.stage("s3_get"):
+                response = s3.get_object(**request)
+        except ClientError as e:
+            # imported here: core.s3_utilities imports this module
+            from core.s3_utilities import _is_not_modified
+            if "IfNoneMatch" in request and _is_not_modified(e):
+                path = self._blob_path(endpoint, bucket, key, etag)
+                try:
+                    f = open(path, "rb")
+                except FileNotFoundError:
+                    # evicted in the meantime
+                    self._forget(ref_path)
+                    return self.open_stream(s3, bucket, key)
+                METRICS.inc("dei_disk_cache_hits_total")
+                try:
+                    os.utime(f.fileno())
+                except OSError:
+                    pass
+                return f, True
+            raise
+        return response['Body'], False
+
+    def open(self, s3, bucket: str, key: str, attempts: int = 3) -> tuple:
+        """
+        returns the opened cached file and the ETag of the current version of
+        an object; once open, the file stays readable even if it is evicted
+        """
+        for attempt in range(attempts):
+            path, etag = self.fetch(s3, bucket, key)
+            try:
+                return open(path, "rb"), etag
+            except FileNotFoundError:
+                # evicted by another process between the fetch and the open,
+                # the next fetch downloads it again
+                if attempt == attempts - 1:
+                    raise
+
+    def read(self, s3, bucket: str, key: str) -> tuple:
+        """
+        returns the content and ETag of the current version of an object
+        """
+        f, etag = self.open(s3, bucket, key)
+        with f:
+            return f.read(), etag
+
+    def evict(self, keep: str = None):
+        """
+        removes the least recently used objects until the cache fits in
+        max_bytes; skipped if another process is already evicting
+        """
+        with self._lock("evict", blocking=False) as locked:
+            if not locked:
+                return
+            entries = []
+            total = 0
+            with os.scandir(os.path.join(self.directory, "blobs")) as it:
+                for entry in it:
+                    try:
+                        stat = entry.stat()
+                    except FileNotFoundError:
+                        continue
+                    entries.append((stat.st_mtime, stat.st_size, entry.path))
+                    total += stat.st_size
+            if total <= self.max_bytes:
+                return
+            entries.sort()
+            for _, size, path in entries:
+                if total <= self.max_bytes:
+                    break
+                if path == keep:
+                    continue
+                # readers that already opened the file keep reading it
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+                total -= size
+            logger.info(f"disk cache evicted down to {total} bytes")
+
+    def clear_stale_tmp(self, older_than: float = 3600):
+        """
+        removes temporary files left by processes killed while downloading
+        """
+        now = time.time()
+        tmp_dir = os.path.join(self.directory, "tmp")
+        for name in os.listdir(tmp_dir):
+            path = os.path.join(tmp_dir, name)
+            try:
+                if now - os.path.getmtime(path) > older_than:
+                    os.remove(path)
+            except FileNotFoundError:
+                pass
+
+
+if DISK_CACHE_DIR and fcntl is None:
+    logger.warning("S3_DISK_CACHE_DIR is ignored, the disk cache needs fcntl file locks")
+disk_cache = DiskCache(DISK_CACHE_DIR) if DISK_CACHE_DIR and fcntl is not None else None
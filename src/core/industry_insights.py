@@ -2,11 +2,51 @@
 
 import pandas as pd
 import logging
-import json
-from core.s3_utilities import read_jsonl_file, save_dict_to_s3_as_jsonl_file
+import time
+from core.company_records import decode_company_records, records_to_dataframe
+from core.metrics import METRICS, log_event
+from core.rankings import RANKINGS_PATH, iter_rankings
+from core.s3_utilities import (
+    merge_jsonl_lines,
+    read_jsonl_file_revalidated,
+    read_parquet_file,
+    save_dataframe_to_s3_as_parquet,
+    save_dict_to_s3_as_jsonl_file,
+    save_records_to_s3_as_jsonl_file,
+)
+
+try:
+    import pyarrow as pa
+except ImportError:  # parquet snapshots are optional
+    pa = None
 
 logger = logging.getLogger(__name__)
 
+SCORE_COLUMNS = [
+    "Talent Pipeline Score",
+    "Retention Score",
+    "Access & Advancement Score",
+    "Representation Score",
+    "Historical Score",
+]
+
+# columnar snapshots written next to the JSON Lines aggregates
+SNAPSHOT_PATHS = {
+    "companies": "company_scores/all/companies.parquet",
+    "industry_statistics": "company_scores/all/industry_statistics.parquet",
+    "sector_statistics": "company_scores/all/sector_statistics.parquet",
+}
+
+DEFAULT_STATISTICS = ("mean", "median", "count", "std", "min", "max")
+DEFAULT_PERCENTILES = (0.1, 0.25, 0.75, 0.9)
+DEFAULT_GROUPINGS = [
+    ["industry"],
+    ["sector"],
+    ["company_size"],
+    ["industry", "company_size"],
+    ["sector", "company_size"],
+]
+
 
 def get_all_companies(
     service_endpoint: str,
@@ -23,18 +63,100 @@ def get_all_companies(
     - company website
     - company id
     """
-    all_dat = read_jsonl_file(
+    return read_jsonl_file_revalidated(
+        service_endpoint=service_endpoint,
+        access_key_id=access_key_id,
+        secret_access_key=secret_access_key,
+        bucket_name=bucket_name,
+        object_path="company_scores/all/companies_metadata.jsonl.gz",
+        return_lines=True,
+        as_bytes=True,
+        transform=merge_jsonl_lines,
+    )
+
+
+def get_company_records(
+    service_endpoint: str,
+    access_key_id: str,
+    secret_access_key: str,
+    bucket_name: str,
+) -> list:
+    """
+    the companies metadata decoded into typed CompanyRecords (see
+    core.company_records), raises SchemaDriftError if the file changed shape
+    """
+    return read_jsonl_file_revalidated(
         service_endpoint=service_endpoint,
         access_key_id=access_key_id,
         secret_access_key=secret_access_key,
         bucket_name=bucket_name,
         object_path="company_scores/all/companies_metadata.jsonl.gz",
-        return_lines=True
+        return_lines=True,
+        as_bytes=True,
+        transform=decode_company_records,
     )
-    result_dict = {}
-    for d in all_dat:
-        result_dict.update(json.loads(d))
-    return result_dict
+
+
+def grouping_name(by: list) -> str:
+    return "+".join(by)
+
+
+def grouped_statistics(
+    df: pd.DataFrame,
+    by: list,
+    columns: list = SCORE_COLUMNS,
+    statistics: tuple = DEFAULT_STATISTICS,
+    percentiles: tuple = DEFAULT_PERCENTILES,
+)->pd.DataFrame:
+    """
+    computes the statistics and percentiles of the columns for each group of
+    `by` on a single groupby, and returns them as a tidy table:
+    one row per group and column, with the group keys, a "score" column and
+    one column per statistic (e.g. mean, median, count, std, min, max, p25)
+    """
+    by = [by] if isinstance(by, str) else list(by)
+    grouped = df.groupby(by)[columns]
+    frames = []
+    if statistics:
+        # (column, statistic) multi-index columns
+        frames.append(grouped.agg(list(statistics)))
+    if percentiles:
+        # not in the agg above: agg only takes quantiles as callables, which
+        # run in Python for every group, while quantile() is vectorized
+        quantiles = grouped.quantile(list(percentiles)).unstack(level=-1)
+        quantiles.columns = pd.MultiIndex.from_tuples(
+            [(column, f"p{q * 100:g}") for column, q in quantiles.columns])
+        frames.append(quantiles)
+    wide = pd.concat(frames, axis=1)
+
+    parts = []
+    for column in columns:
+        part = wide[column].reset_index()
+        part.insert(len(by), "score", column)
+        parts.append(part)
+    tidy = pd.concat(parts, ignore_index=True)
+    tidy.columns.name = None
+    return tidy
+
+
+def average_and_median_table(stats: pd.DataFrame, grouping: str, label: str)->pd.DataFrame:
+    """
+    turns tidy statistics into the "<score> <label> Average/Median" table
+    saved as industry_statistics and sector_statistics
+    """
+    wide = stats.pivot(index=grouping, columns="score")
+    average = wide["mean"][SCORE_COLUMNS].rename(columns=lambda x: x + f' {label} Average')
+    median = wide["median"][SCORE_COLUMNS].rename(columns=lambda x: x + f' {label} Median')
+    summary = pd.concat([average, median], axis=1)
+    summary.columns.name = None
+    return summary
+
+
+def statistics_to_records(stats: pd.DataFrame)->list:
+    """
+    converts tidy statistics to JSON-serializable records (NaN becomes None)
+    """
+    return stats.astype(object).where(stats.notna(), None).to_dict(orient="records")
 
 
 class IndustryInsights:
@@ -48,100 +170,134 @@ class IndustryInsights:
         access_key_id: str,
         secret_access_key: str,
         bucket_name: str = "dei-bucket",
+        groupings: list = None,
     ):
         self.service_endpoint = service_endpoint
         self.access_key_id = access_key_id
         self.secret_access_key = secret_access_key
         self.bucket_name = bucket_name
+        self.groupings = groupings or DEFAULT_GROUPINGS
 
-    def get_data_across_companies(self)->pd.DataFrame:
+    def read_snapshot(self, name: str, columns: list = None)->pd.DataFrame:
         """
-        returns the content of a file stored in the bucket
+        loads one of the parquet snapshots (see SNAPSHOT_PATHS), only reading
+        the given columns
         """
-        comp_dict = get_all_companies(
+        table = read_parquet_file(
             service_endpoint=self.service_endpoint,
             access_key_id=self.access_key_id,
             secret_access_key=self.secret_access_key,
             bucket_name=self.bucket_name,
+            object_path=SNAPSHOT_PATHS[name],
+            columns=columns,
         )
-        
-        # Initialize list to store flattened data
-        flattened_data = []
-
-        for _, company_data in comp_dict.items():
-            # Flatten the inner dictionary and append to the list
-            scores = company_data.get('scores', {}).get('score', {})
-            flattened_data.append({
-                "company_name": company_data.get('company_name'),
-                "industry": company_data.get('industry'),
-                "sector": company_data.get('sector'),
-                "company_size": company_data.get('company_size'),
-                "company_website": company_data.get('company_website'),
-                "company_id": company_data.get('company_id'),
-                "Talent Pipeline Score": scores.get('Talent Pipeline'),
-                "Retention Score": scores.get('Retention'),
-                "Access & Advancement Score": scores.get('Access & Advancement'),
-                "Representation Score": scores.get('Representation'),
-                "Historical Score": scores.get('Historical'),
-            })
-
-        # Convert to pandas DataFrame
-        df = pd.DataFrame(flattened_data)
+        return table.to_pandas()
+
+    def save_snapshot(self, name: str, df: pd.DataFrame, preserve_index: bool = False):
+        if pa is None:
+            logger.warning(f"pyarrow is not installed, {name} snapshot not saved")
+            return
+        save_dataframe_to_s3_as_parquet(
+            df,
+            service_endpoint=self.service_endpoint,
+            access_key_id=self.access_key_id,
+            secret_access_key=self.secret_access_key,
+            bucket_name=self.bucket_name,
+            object_path=SNAPSHOT_PATHS[name],
+            preserve_index=preserve_index,
+        )
+        logger.info(f"{name} snapshot saved on wasabi")
+
+    def get_data_across_companies(self, columns: list = None, from_snapshot: bool = False)->pd.DataFrame:
+        """
+        returns the flattened table of all the companies, built from the
+        companies metadata or, with from_snapshot, loaded from the parquet
+        snapshot of the last insights run (optionally only some columns)
+        """
+        if from_snapshot:
+            return self.read_snapshot("companies", columns=columns)
+
+        records = get_company_records(
+            service_endpoint=self.service_endpoint,
+            access_key_id=self.access_key_id,
+            secret_access_key=self.secret_access_key,
+            bucket_name=self.bucket_name,
+        )
+        with METRICS.stage("companies_table"):
+            df = records_to_dataframe(records)
         nb_industries = df["industry"].nunique()
         nb_sectors = df["sector"].nunique()
         logger.info(f"Number of distinct industries: {nb_industries}")
         logger.info(f"Number of distinct sectors: {nb_sectors}")
+        if columns is not None:
+            df = df[columns]
         return df
     
     def industry_and_sector_comparisons(self, df: pd.DataFrame)->pd.DataFrame:
-        # Rank by industry for each score
-        for score in ["Talent Pipeline Score", "Retention Score", "Access & Advancement Score", "Representation Score", "Historical Score"]:
-            df[f"{score} Rank by Industry"] = df.groupby("industry")[score].rank(ascending=False, method='min')
-            df[f"{score} Rank by Sector"] = df.groupby("sector")[score].rank(ascending=False, method='min')
-
-        # Determine top % by industry and sector for each score
-        for score in ["Talent Pipeline Score", "Retention Score", "Access & Advancement Score", "Representation Score", "Historical Score"]:
-            total_companies_in_industry = df.groupby('industry').size()
-            total_companies_in_sector = df.groupby('sector').size()
-
-            df[f"{score} Top % by Industry"] = df.apply(lambda x: (x[f"{score} Rank by Industry"] / total_companies_in_industry[x['industry']]) * 100, axis=1)
-            df[f"{score} Top % by Sector"] = df.apply(lambda x: (x[f"{score} Rank by Sector"] / total_companies_in_sector[x['sector']]) * 100, axis=1)
+        """
+        adds, for each score, the rank and top % of each company within its
+        industry and within its sector; every grouping is computed in a single
+        vectorized groupby pass over all the scores
+        """
+        ranks = {}
+        top_percents = {}
+        with METRICS.stage("comparisons"):
+            for grouping, label in (("industry", "Industry"), ("sector", "Sector")):
+                grouped = df.groupby(grouping)
+                group_ranks = grouped[SCORE_COLUMNS].rank(ascending=False, method='min')
+                group_sizes = grouped[grouping].transform('size')
+                group_top_percents = group_ranks.div(group_sizes, axis=0) * 100
+                for score in SCORE_COLUMNS:
+                    ranks[f"{score} Rank by {label}"] = group_ranks[score]
+                    top_percents[f"{score} Top % by {label}"] = group_top_percents[score]
+
+        # keep the column order: all the ranks, then all the top %
+        for score in SCORE_COLUMNS:
+            for label in ("Industry", "Sector"):
+                df[f"{score} Rank by {label}"] = ranks[f"{score} Rank by {label}"]
+        for score in SCORE_COLUMNS:
+            for label in ("Industry", "Sector"):
+                df[f"{score} Top % by {label}"] = top_percents[f"{score} Top % by {label}"]
         return df
     
     
+    def group_statistics(self, companies_df: pd.DataFrame, groupings: list = None)->dict:
+        """
+        returns the tidy statistics of the scores for each grouping, keyed by
+        the grouping name (e.g. "industry" or "sector+company_size")
+        """
+        with METRICS.stage("aggregation"):
+            return {
+                grouping_name(by): grouped_statistics(companies_df, by=by)
+                for by in (groupings or self.groupings)
+            }
+
     def industry_statistics(self, companies_df: pd.DataFrame)->pd.DataFrame:
         # Industry Average and Median
-        industry_avg = companies_df.groupby('industry')[
-            ["Talent Pipeline Score", "Retention Score", "Access & Advancement Score", "Representation Score", "Historical Score"]
-        ].mean().rename(columns=lambda x: x + ' Industry Average')
-
-        industry_median = companies_df.groupby('industry')[
-            ["Talent Pipeline Score", "Retention Score", "Access & Advancement Score", "Representation Score", "Historical Score"]
-        ].median().rename(columns=lambda x: x + ' Industry Median')
-
-        industry_summary = pd.concat([industry_avg, industry_median], axis=1)
-        return industry_summary
+        stats = grouped_statistics(
+            companies_df, by=["industry"], statistics=("mean", "median"), percentiles=())
+        return average_and_median_table(stats, "industry", "Industry")
     
     
     def sector_statistics(self, companies_df: pd.DataFrame)->pd.DataFrame:
         # Sector Average and Median
-        sector_avg = companies_df.groupby('sector')[
-            ["Talent Pipeline Score", "Retention Score", "Access & Advancement Score", "Representation Score", "Historical Score"]
-        ].mean().rename(columns=lambda x: x + ' Sector Average')
-
-        sector_median = companies_df.groupby('sector')[
-            ["Talent Pipeline Score", "Retention Score", "Access & Advancement Score", "Representation Score", "Historical Score"]
-        ].median().rename(columns=lambda x: x + ' Sector Median')
-
-        sector_summary = pd.concat([sector_avg, sector_median], axis=1)
-        return sector_summary
+        stats = grouped_statistics(
+            companies_df, by=["sector"], statistics=("mean", "median"), percentiles=())
+        return average_and_median_table(stats, "sector", "Sector")
     
     
     def run_and_save_industry_and_sector_stats(self):
+        start = time.time()
         df = self.get_data_across_companies()
+        self.save_snapshot("companies", df)
+        # a single aggregation pass per grouping, the industry and sector
+        # summaries below are views of the same results
+        groupings = self.groupings + [
+            by for by in (["industry"], ["sector"]) if by not in self.groupings]
+        stats = self.group_statistics(df, groupings=groupings)
         
         # industry statistics
-        ind_df = self.industry_statistics(companies_df=df)
+        ind_df = average_and_median_table(stats["industry"], "industry", "Industry")
         ind_df = ind_df.fillna(0)
         ind_df[ind_df<0] = 0
         ind_dict = ind_df.to_dict()
@@ -155,8 +311,9 @@ class IndustryInsights:
             object_path=f"company_scores/all/industry_statistics.jsonl.gz"
         )
         logger.info("industry stats saved on wasabi")
+        self.save_snapshot("industry_statistics", ind_df, preserve_index=True)
         # sector statistics
-        sec_df = self.sector_statistics(companies_df=df)
+        sec_df = average_and_median_table(stats["sector"], "sector", "Sector")
         sec_df = sec_df.fillna(0)
         sec_df[sec_df<0] = 0
         sec_dict = sec_df.to_dict()
@@ -170,6 +327,32 @@ class IndustryInsights:
             object_path=f"company_scores/all/sector_statistics.jsonl.gz"
         )
         logger.info("sector stats saved on wasabi")
+        self.save_snapshot("sector_statistics", sec_df, preserve_index=True)
+        # every breakdown, one line per grouping
+        save_records_to_s3_as_jsonl_file(
+            ({name: statistics_to_records(grouping_stats)}
+             for name, grouping_stats in stats.items()),
+            service_endpoint=self.service_endpoint,
+            access_key_id=self.access_key_id,
+            secret_access_key=self.secret_access_key,
+            bucket_name="dei-bucket",
+            object_path=f"company_scores/all/group_statistics.jsonl.gz"
+        )
+        logger.info("group stats saved on wasabi")
+        # sorted per-industry and per-sector rankings served by the API
+        # built and written one grouping at a time
+        save_records_to_s3_as_jsonl_file(
+            ({grouping: groups} for grouping, groups in
+             iter_rankings(df, groupings=["industry", "sector"], scores=SCORE_COLUMNS)),
+            service_endpoint=self.service_endpoint,
+            access_key_id=self.access_key_id,
+            secret_access_key=self.secret_access_key,
+            bucket_name="dei-bucket",
+            object_path=RANKINGS_PATH
+        )
+        logger.info("rankings saved on wasabi")
+        log_event(logger, "insights_completed", duration=time.time() - start,
+                  nb_companies=len(df), metrics=METRICS.summary())
 
 
 def main():
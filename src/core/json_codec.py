@@ -0,0 +1,134 @@
+# JSON codec used by the S3 read/write paths and the API responses. orjson
+# or msgspec are used when installed, the standard library otherwise;
+# JSON_CODEC=orjson|msgspec|json forces one. Every codec decodes bytes (or
+# str) directly and encodes to compact UTF-8 bytes.
+#
+# Non-finite floats: files written before this codec contain the NaN and
+# Infinity tokens of json.dumps, which orjson and msgspec reject, so a line
+# they cannot parse is decoded again by the standard library. Every codec
+# encodes NaN and Infinity as null, so that what is written or sent is valid JSON.
+
+import json
+import math
+import os
+
+try:
+    import orjson
+except ImportError:  # faster codecs are optional
+    orjson = None
+
+try:
+    import msgspec
+except ImportError:
+    msgspec = None
+
+JSON_CODEC = os.getenv("JSON_CODEC", "auto")
+
+
+class JsonCodec:
+    __slots__ = ("name", "loads", "dumps")
+
+    def __init__(self, name: str, loads, dumps):
+        self.name = name
+        # loads(bytes | str) -> object, dumps(object, default=None) -> bytes
+        self.loads = loads
+        self.dumps = dumps
+
+    def __repr__(self):
+        return f"JsonCodec({self.name!r})"
+
+
+# built once, json.dumps / json.loads build one per call with non default arguments
+_stdlib_encoder = json.JSONEncoder(ensure_ascii=False, separators=(",", ":"), allow_nan=False)
+_stdlib_decoder = json.JSONDecoder()
+
+
+def _stdlib_loads(data):
+    if not isinstance(data, str):
+        data = bytes(data).decode("utf-8")
+    return _stdlib_decoder.decode(data)
+
+
+def _without_non_finite(obj):
+    """
+    returns obj with the NaN and infinite floats replaced by None
+    """
+    if isinstance(obj, float):
+        return obj if math.isfinite(obj) else None
+    if isinstance(obj, dict):
+        return {key: _without_non_finite(value) for key, value in obj.items()}
+    if isinstance(obj, (list, tuple)):
+        return [_without_non_finite(value) for value in obj]
+    return obj
+
+
+def _stdlib_dumps(obj, default=None) -> bytes:
+    def encode(obj):
+        if default is None:
+            return _stdlib_encoder.encode(obj)
+        return json.dumps(obj, ensure_ascii=False, separators=(",", ":"),
+                          allow_nan=False, default=default)
+
+    try:
+        return encode(obj).encode("utf-8")
+    except ValueError:
+        # only documents with non-finite floats pay for the copy
+        return encode(_without_non_finite(obj)).encode("utf-8")
+
+
+def _with_stdlib_fallback(loads, errors):
+    def lenient_loads(data):
+        try:
+            return loads(data)
+        except errors:
+            # NaN / Infinity written by json.dumps, or really invalid JSON
+            # for which the standard library raises its own error
+            return _stdlib_loads(data)
+    return lenient_loads
+
+
+def _orjson_dumps(obj, default=None) -> bytes:
+    # numpy scalars and non-string keys (e.g. from DataFrame.to_dict) are
+    # accepted like the standard library does
+    return orjson.dumps(
+        obj, default=default, option=orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY)
+
+
+def _msgspec_codec() -> JsonCodec:
+    decoder = msgspec.json.Decoder()
+    encoder = msgspec.json.Encoder()
+
+    def dumps(obj, default=None) -> bytes:
+        if default is None:
+            return encoder.encode(obj)
+        return msgspec.json.encode(obj, enc_hook=default)
+
+    return JsonCodec("msgspec", _with_stdlib_fallback(decoder.decode, msgspec.DecodeError), dumps)
+
+
+def available_codecs() -> dict:
+    """
+    returns {name: JsonCodec} for every codec installed, fastest first
+    """
+    codecs = {}
+    if orjson is not None:
+        codecs["orjson"] = JsonCodec(
+            "orjson", _with_stdlib_fallback(orjson.loads, orjson.JSONDecodeError), _orjson_dumps)
+    if msgspec is not None:
+        codecs["msgspec"] = _msgspec_codec()
+    codecs["json"] = JsonCodec("json", _stdlib_loads, _stdlib_dumps)
+    return codecs
+
+
+def get_codec(name: str = JSON_CODEC) -> JsonCodec:
+    codecs = available_codecs()
+    if name == "auto":
+        return next(iter(codecs.values()))
+    if name not in codecs:
+        raise ValueError(f"JSON codec {name!r} is not installed, available: {list(codecs)}")
+    return codecs[name]
+
+
+CODEC = get_codec()
+loads = CODEC.loads
+dumps = CODEC.dumps
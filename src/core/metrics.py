@@ -0,0 +1,184 @@
+# lightweight in-process metrics: latency histograms per stage, bytes
+# transferred and record counts, exported in the Prometheus text format by
+# the API (/metrics) and as structured log lines by the batch jobs. Metrics
+# are per process; pool workers send theirs back with their results (see
+# snapshot / merge).
+
+import json
+import logging
+import threading
+import time
+from contextlib import contextmanager
+
+# seconds
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+                   1, 2.5, 5, 10, 30, 60, 120, 300)
+
+STAGE_SECONDS = "dei_stage_seconds"
+HTTP_REQUEST_SECONDS = "dei_http_request_seconds"
+S3_BYTES = "dei_s3_bytes_total"
+RECORDS = "dei_records_total"
+
+
+def _labels_key(labels: dict) -> tuple:
+    return tuple(sorted((name, str(value)) for name, value in labels.items()))
+
+
+def _format_labels(key: tuple, extra: tuple = ()) -> str:
+    pairs = key + extra
+    if not pairs:
+        return ""
+    escaped = (
+        name + '="' + value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"') + '"'
+        for name, value in pairs
+    )
+    return "{" + ",".join(escaped) + "}"
+
+
+class Metrics:
+    """
+    thread-safe registry of histograms and counters, keyed by name and labels
+    """
+
+    def __init__(self, buckets: tuple = DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        # (name, labels) -> [counts per bucket, sum, count]
+        self._histograms = {}
+        # (name, labels) -> value
+        self._counters = {}
+        self._lock = threading.Lock()
+
+    def observe(self, name: str, value: float, **labels):
+        key = (name, _labels_key(labels))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = [[0] * len(self.buckets), 0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    histogram[0][i] += 1
+                    break
+            histogram[1] += value
+            histogram[2] += 1
+
+    def inc(self, name: str, value: float = 1, **labels):
+        key = (name, _labels_key(labels))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    @contextmanager
+    def timer(self, name: str, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+
+    def stage(self, stage: str):
+        """
+        times a block of code as one pipeline stage
+        """
+        return self.timer(STAGE_SECONDS, stage=stage)
+
+    def add_bytes(self, direction: str, nb_bytes: int):
+        self.inc(S3_BYTES, nb_bytes, direction=direction)
+
+    def add_records(self, stage: str, nb_records: int):
+        self.inc(RECORDS, nb_records, stage=stage)
+
+    def counted(self, items, stage: str):
+        """
+        yields the items of an iterable, and counts them once it is exhausted or closed
+        """
+        nb_items = 0
+        try:
+            for item in items:
+                nb_items += 1
+                yield item
+        finally:
+            self.add_records(stage, nb_items)
+
+    def snapshot(self) -> dict:
+        """
+        returns a picklable copy of the metrics, that merge() adds to another registry
+        """
+        with self._lock:
+            return {
+                "histograms": {key: [list(counts), total, count]
+                               for key, (counts, total, count) in self._histograms.items()},
+                "counters": dict(self._counters),
+            }
+
+    def merge(self, snapshot: dict):
+        with self._lock:
+            for key, (counts, total, count) in snapshot["histograms"].items():
+                histogram = self._histograms.get(key)
+                if histogram is None:
+                    histogram = self._histograms[key] = [[0] * len(self.buckets), 0.0, 0]
+                histogram[0] = [a + b for a, b in zip(histogram[0], counts)]
+                histogram[1] += total
+                histogram[2] += count
+            for key, value in snapshot["counters"].items():
+                self._counters[key] = self._counters.get(key, 0) + value
+
+    def reset(self):
+        with self._lock:
+            self._histograms.clear()
+            self._counters.clear()
+
+    def summary(self) -> dict:
+        """
+        returns {metric{labels}: {"count": n, "sum": s}} for histograms and
+        {metric{labels}: value} for counters, for log lines
+        """
+        with self._lock:
+            summary = {
+                f"{name}{_format_labels(labels)}": {"count": count, "sum": round(total, 6)}
+                for (name, labels), (_, total, count) in self._histograms.items()
+            }
+            summary.update({
+                f"{name}{_format_labels(labels)}": value
+                for (name, labels), value in self._counters.items()
+            })
+        return summary
+
+    def render_prometheus(self, gauges: dict = None) -> str:
+        """
+        returns the metrics in the Prometheus text exposition format; gauges
+        ({name: value}) are appended as is
+        """
+        lines = []
+        with self._lock:
+            histograms = sorted(self._histograms.items())
+            counters = sorted(self._counters.items())
+        declared = set()
+        for (name, labels), (counts, total, count) in histograms:
+            if name not in declared:
+                lines.append(f"# TYPE {name} histogram")
+                declared.add(name)
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                lines.append(f"{name}_bucket{_format_labels(labels, (('le', str(bound)),))} {cumulative}")
+            lines.append(f"{name}_bucket{_format_labels(labels, (('le', '+Inf'),))} {count}")
+            lines.append(f"{name}_sum{_format_labels(labels)} {total}")
+            lines.append(f"{name}_count{_format_labels(labels)} {count}")
+        for (name, labels), value in counters:
+            if name not in declared:
+                lines.append(f"# TYPE {name} counter")
+                declared.add(name)
+            lines.append(f"{name}{_format_labels(labels)} {value}")
+        for name, value in sorted((gauges or {}).items()):
+            lines.append(f"# TYPE {name} gauge")
+            lines.append(f"{name} {value}")
+        return "\n".join(lines) + "\n"
+
+
+METRICS = Metrics()
+
+
+def log_event(logger: logging.Logger, event: str, level: int = logging.INFO, **fields):
+    """
+    logs one JSON line {"event": event, **fields}, for batch jobs
+    """
+    logger.log(level, json.dumps({"event": event, **fields}, default=str))
@@ -0,0 +1,116 @@
+# sorted per-group score indexes: for each grouping (industry, sector), each
+# group and each score, the company ids sorted by decreasing score. They are
+# computed by the insights job and let the API answer "top N of a group" and
+# "rank of a company" without scanning all the companies.
+
+from bisect import bisect_left
+from core.s3_utilities import merge_jsonl_lines
+
+RANKINGS_PATH = "company_scores/all/rankings.jsonl.gz"
+
+
+def iter_rankings(df, groupings: list, scores: list):
+    """
+    yields (grouping, {group: {"size": n, "scores": {score: {"company_ids": [...],
+    "values": [...]}}}}) from the flattened companies table, one grouping at
+    a time; companies without a score are not ranked for it but count in
+    the group size
+    """
+    for grouping in groupings:
+        sizes = df.groupby(grouping).size()
+        groups = {
+            group: {"size": int(size), "scores": {}} for group, size in sizes.items()
+        }
+        for score in scores:
+            ranked = df.loc[df[score].notna() & df[grouping].notna(), [grouping, "company_id", score]]
+            # a stable sort keeps ties in the order of the data
+            ranked = ranked.sort_values([grouping, score], ascending=[True, False], kind="mergesort")
+            for group, part in ranked.groupby(grouping, sort=False):
+                groups[group]["scores"][score] = {
+                    "company_ids": part["company_id"].tolist(),
+                    "values": part[score].tolist(),
+                }
+        yield grouping, groups
+
+
+def build_rankings(df, groupings: list, scores: list) -> dict:
+    """
+    returns {grouping: {group: ...}}, see iter_rankings
+    """
+    return dict(iter_rankings(df, groupings, scores))
+
+
+class RankingIndex:
+    """
+    answers ranking queries from the persisted rankings; ranks follow
+    rank(method='min'): tied companies share the best rank
+    """
+
+    def __init__(self, rankings: dict):
+        self.rankings = rankings
+        # (grouping, company_id) -> group, and (grouping, group, score) ->
+        # {company_id: value} and negated values for bisection
+        self._company_groups = {}
+        self._values = {}
+        self._negated = {}
+        self.scores = set()
+        for grouping, groups in rankings.items():
+            for group, content in groups.items():
+                for score, ranked in content["scores"].items():
+                    self.scores.add(score)
+                    key = (grouping, group, score)
+                    self._values[key] = dict(zip(ranked["company_ids"], ranked["values"]))
+                    self._negated[key] = [-value for value in ranked["values"]]
+                    for company_id in ranked["company_ids"]:
+                        self._company_groups[(grouping, company_id)] = group
+
+    def groupings(self) -> list:
+        return list(self.rankings)
+
+    def top(self, grouping: str, group: str, score: str, n: int = 10) -> list:
+        """
+        returns the n best companies of a group for a score, with their value and rank
+        """
+        ranked = self.rankings[grouping][group]["scores"].get(score)
+        if ranked is None:
+            return []
+        top = []
+        rank = 0
+        previous = None
+        for position, (company_id, value) in enumerate(
+                zip(ranked["company_ids"][:n], ranked["values"][:n])):
+            if value != previous:
+                rank = position + 1
+                previous = value
+            top.append({"company_id": company_id, "value": value, "rank": rank})
+        return top
+
+    def rank_of(self, grouping: str, company_id: str, score: str):
+        """
+        returns the rank of a company within its group for a score, or None
+        if the company is not ranked
+        """
+        group = self._company_groups.get((grouping, company_id))
+        if group is None:
+            return None
+        key = (grouping, group, score)
+        value = self._values.get(key, {}).get(company_id)
+        if value is None:
+            return None
+        rank = bisect_left(self._negated[key], -value) + 1
+        size = self.rankings[grouping][group]["size"]
+        return {
+            "group": group,
+            "value": value,
+            "rank": rank,
+            "ranked": len(self._negated[key]),
+            "size": size,
+            "top_percent": rank / size * 100,
+        }
+
+
+def load_ranking_index(json_lines: list) -> RankingIndex:
+    """
+    builds the RankingIndex of a rankings JSON Lines file (one line per grouping)
+    """
+    return RankingIndex(merge_jsonl_lines(json_lines))
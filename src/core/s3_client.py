@@ -0,0 +1,74 @@
+import os
+import threading
+import boto3
+from botocore.config import Config
+
+S3_MAX_POOL_CONNECTIONS = int(os.getenv("S3_MAX_POOL_CONNECTIONS", "50"))
+S3_RETRY_MODE = os.getenv("S3_RETRY_MODE", "standard")
+S3_MAX_ATTEMPTS = int(os.getenv("S3_MAX_ATTEMPTS", "5"))
+S3_CONNECT_TIMEOUT = float(os.getenv("S3_CONNECT_TIMEOUT", "5"))
+S3_READ_TIMEOUT = float(os.getenv("S3_READ_TIMEOUT", "60"))
+
+# (pid, endpoint, credentials, config) -> client
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+def get_s3_client(
+    service_endpoint: str,
+    access_key_id: str,
+    secret_access_key: str,
+    max_pool_connections: int = None,
+    retry_mode: str = None,
+    max_attempts: int = None,
+    connect_timeout: float = None,
+    read_timeout: float = None,
+):
+    """
+    returns a shared S3 client for the given endpoint and credentials.
+    Clients are created once per process and reused, so their connection pool
+    stays warm; boto3 clients are thread-safe and can be shared by threads.
+    """
+    settings = (
+        max_pool_connections or S3_MAX_POOL_CONNECTIONS,
+        retry_mode or S3_RETRY_MODE,
+        max_attempts or S3_MAX_ATTEMPTS,
+        connect_timeout or S3_CONNECT_TIMEOUT,
+        read_timeout or S3_READ_TIMEOUT,
+    )
+    # the pid is part of the key so that forked workers never reuse the
+    # sockets of their parent
+    key = (os.getpid(), service_endpoint, access_key_id, secret_access_key, settings)
+    client = _clients.get(key)
+    if client is not None:
+        return client
+
+    with _clients_lock:
+        client = _clients.get(key)
+        if client is None:
+            pool_size, mode, attempts, connect, read = settings
+            # sessions are not thread-safe, so they are only used under the lock
+            session = boto3.session.Session(
+                aws_access_key_id=access_key_id,
+                aws_secret_access_key=secret_access_key,
+            )
+            client = session.client(
+                's3',
+                endpoint_url=service_endpoint,
+                config=Config(
+                    max_pool_connections=pool_size,
+                    retries={"mode": mode, "max_attempts": attempts},
+                    connect_timeout=connect,
+                    read_timeout=read,
+                ),
+            )
+            _clients[key] = client
+    return client
+
+
+def clear_s3_clients():
+    """
+    forgets every cached client, e.g. after credentials were rotated
+    """
+    with _clients_lock:
+        _clients.clear()
@@ -1,37 +1,127 @@
-import boto3
+import functools
+import io
+import itertools
 import json
 import gzip
+import math
 import os
+import random
+import threading
+import zlib
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from botocore.exceptions import ClientError
+from core import json_codec
+from core.disk_cache import disk_cache
+from core.metrics import METRICS
+from core.s3_client import S3_MAX_POOL_CONNECTIONS, get_s3_client
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # parquet snapshots are optional
+    pa = None
+    pq = None
 
 SERVICE_ENDPOINT = os.getenv(
     "SERVICE_ENDPOINT", "https://s3.us-west-1.wasabisys.com")
 ACCESS_KEY_ID = os.environ.get("ACCESS_KEY_ID")
 SECRET_ACCESS_KEY = os.environ.get("SECRET_ACCESS_KEY")
 
+# size of the compressed chunks read from S3, and max size of each
+# decompressed block, when streaming a file
+READ_CHUNK_SIZE = int(os.getenv("S3_READ_CHUNK_SIZE", str(1024 * 1024)))
 
-def list_files_in_raw_data_folder(
+# size of the compressed parts uploaded when writing a file; S3 multipart
+# uploads need parts of at least 5 MiB, except the last one
+MULTIPART_MIN_PART_SIZE = 5 * 1024 * 1024
+WRITE_PART_SIZE = int(os.getenv("S3_WRITE_PART_SIZE", str(8 * 1024 * 1024)))
+
+# number of objects downloaded at the same time by fetch_jsonl_files
+BULK_FETCH_WORKERS = int(os.getenv("S3_BULK_FETCH_WORKERS", "32"))
+
+
+def iter_objects(
     service_endpoint=SERVICE_ENDPOINT,
     access_key_id=ACCESS_KEY_ID,
     secret_access_key=SECRET_ACCESS_KEY,
     bucket_name="dei-bucket",
-    target_folder="raw_data/"
+    prefix="",
+    suffix=None,
+    page_size=1000,
 ):
     """
-    lists all files in the specified folder within a Wasabi bucket
+    lazily lists the objects under a prefix, following the pagination of
+    list_objects_v2 so that listings are never truncated at 1000 keys. Each
+    object is yielded as soon as its page is received, as a dict with its
+    key, etag, size and last_modified. Folder placeholders (keys ending with
+    a slash) are skipped, and suffix only keeps the keys ending with it.
     """
-    s3 = boto3.client('s3',
-                      aws_access_key_id=access_key_id,
-                      aws_secret_access_key=secret_access_key,
-                      endpoint_url=service_endpoint)
-
-    response = s3.list_objects_v2(Bucket=bucket_name, Prefix=target_folder)
+    s3 = get_s3_client(service_endpoint=service_endpoint,
+                       access_key_id=access_key_id,
+                       secret_access_key=secret_access_key)
+    paginator = s3.get_paginator('list_objects_v2')
+    pages = paginator.paginate(
+        Bucket=bucket_name,
+        Prefix=prefix,
+        PaginationConfig={"PageSize": page_size},
+    )
+    for page in pages:
+        for obj in page.get('Contents', []):
+            key = obj['Key']
+            if key.endswith('/'):
+                continue
+            if suffix and not key.endswith(suffix):
+                continue
+            yield {
+                "key": key,
+                "etag": obj.get('ETag'),
+                "size": obj.get('Size'),
+                "last_modified": obj.get('LastModified'),
+            }
+
+
+def iter_folders(
+    service_endpoint=SERVICE_ENDPOINT,
+    access_key_id=ACCESS_KEY_ID,
+    secret_access_key=SECRET_ACCESS_KEY,
+    bucket_name="dei-bucket",
+    prefix="",
+    delimiter="/",
+):
+    """
+    lazily lists the folders (common prefixes) directly under a prefix
+    """
+    s3 = get_s3_client(service_endpoint=service_endpoint,
+                       access_key_id=access_key_id,
+                       secret_access_key=secret_access_key)
+    paginator = s3.get_paginator('list_objects_v2')
+    for page in paginator.paginate(Bucket=bucket_name, Prefix=prefix, Delimiter=delimiter):
+        for common_prefix in page.get('CommonPrefixes', []):
+            yield common_prefix['Prefix']
 
-    files = []
-    for obj in response.get('Contents', []):
-        if not obj['Key'].endswith('/'):  # we don't want to include any subfolders
-            files.append(obj['Key'])
 
-    return files
+def list_files_in_raw_data_folder(
+    service_endpoint=SERVICE_ENDPOINT,
+    access_key_id=ACCESS_KEY_ID,
+    secret_access_key=SECRET_ACCESS_KEY,
+    bucket_name="dei-bucket",
+    target_folder="raw_data/",
+    with_metadata=False,
+):
+    """
+    lists all files in the specified folder within a Wasabi bucket; with
+    with_metadata, each file is a dict with its key, etag, size and last_modified
+    """
+    objects = iter_objects(
+        service_endpoint=service_endpoint,
+        access_key_id=access_key_id,
+        secret_access_key=secret_access_key,
+        bucket_name=bucket_name,
+        prefix=target_folder,
+    )
+    if with_metadata:
+        return list(objects)
+    return [obj["key"] for obj in objects]
 
 
 def list_files_folders(
@@ -43,20 +133,18 @@ def list_files_folders(
     """
     lists all files and folders in the specified Wasabi bucket
     """
-    s3 = boto3.client('s3',
-                      aws_access_key_id=access_key_id,
-                      aws_secret_access_key=secret_access_key,
-                      endpoint_url=service_endpoint)
-
-    response = s3.list_objects_v2(Bucket=bucket_name)
+    s3 = get_s3_client(service_endpoint=service_endpoint,
+                       access_key_id=access_key_id,
+                       secret_access_key=secret_access_key)
 
     files = []
     folders = []
-    for obj in response.get('Contents', []):
-        if obj['Key'].endswith('/'):
-            folders.append(obj['Key'])
-        else:
-            files.append(obj['Key'])
+    for page in s3.get_paginator('list_objects_v2').paginate(Bucket=bucket_name):
+        for obj in page.get('Contents', []):
+            if obj['Key'].endswith('/'):
+                folders.append(obj['Key'])
+            else:
+                files.append(obj['Key'])
 
     return (files, folders)
 
@@ -72,10 +160,9 @@ def read_jsonl_file_old(
     """
     reads the contents of a JSON Lines file stored in a Wasabi bucket
     """
-    s3 = boto3.client('s3',
-                      aws_access_key_id=access_key_id,
-                      aws_secret_access_key=secret_access_key,
-                      endpoint_url=service_endpoint)
+    s3 = get_s3_client(service_endpoint=service_endpoint,
+                       access_key_id=access_key_id,
+                       secret_access_key=secret_access_key)
 
     response = s3.get_object(Bucket=bucket_name, Key=object_path)
 
@@ -98,6 +185,58 @@ def read_jsonl_file_old(
         return json_objects
     
 
+def _decode_jsonl(file_content: bytes, return_lines: bool = False, as_bytes: bool = False):
+    """
+    decompresses a gzipped JSON Lines payload and returns its lines (as bytes
+    if as_bytes) or parsed objects; objects are parsed from the bytes directly
+    """
+    # decompress the gzipped content
+    with METRICS.stage("gunzip"):
+        file_content = gzip.decompress(file_content)
+
+    if return_lines and not as_bytes:
+        return file_content.decode('utf-8').split('\n')
+    json_lines = file_content.split(b'\n')
+    if return_lines:
+        return json_lines
+    with METRICS.stage("json_decode"):
+        json_objects = [json_codec.loads(line) for line in json_lines if line]
+    METRICS.add_records("json_decode", len(json_objects))
+    return json_objects
+
+
+def merge_jsonl_lines(json_lines: list) -> dict:
+    """
+    merges JSON Lines (str or bytes) of the form {key: value} into a single dictionary
+    """
+    result_dict = {}
+    nb_lines = 0
+    with METRICS.stage("json_decode"):
+        for line in json_lines:
+            if line:
+                result_dict.update(json_codec.loads(line))
+                nb_lines += 1
+    METRICS.add_records("json_decode", nb_lines)
+    return result_dict
+
+
+def _read_object(s3, bucket_name: str, object_path: str) -> bytes:
+    """
+    returns the content of an object, through the local disk cache when
+    S3_DISK_CACHE_DIR is set
+    """
+    if disk_cache is not None:
+        # the cache times its requests and downloads, and counts the bytes it
+        # downloads; reading the local copy is a stage of its own
+        f, _ = disk_cache.open(s3, bucket_name, object_path)
+        with f, METRICS.stage("disk_cache_read"):
+            return f.read()
+    with METRICS.stage("s3_get"):
+        content = s3.get_object(Bucket=bucket_name, Key=object_path)['Body'].read()
+    METRICS.add_bytes("get", len(content))
+    return content
+
+
 def read_jsonl_file(
     service_endpoint: str,
     access_key_id: str,
@@ -109,30 +248,357 @@ def read_jsonl_file(
     """
     reads the contents of a JSON Lines file stored in a Wasabi bucket
     """
-    s3 = boto3.client('s3',
-                      aws_access_key_id=access_key_id,
-                      aws_secret_access_key=secret_access_key,
-                      endpoint_url=service_endpoint)
-
-    response = s3.get_object(Bucket=bucket_name, Key=object_path)
+    s3 = get_s3_client(service_endpoint=service_endpoint,
+                       access_key_id=access_key_id,
+                       secret_access_key=secret_access_key)
 
     # read the contents of the file
-    file_content = response['Body'].read()
+    file_content = _read_object(s3, bucket_name, object_path)
 
-    # decompress the gzipped content
-    file_content = gzip.decompress(file_content)
+    return _decode_jsonl(file_content, return_lines=return_lines)
 
-    # parse the JSON lines
-    json_lines = file_content.decode('utf-8').split('\n')
-    if return_lines:
-        return json_lines
-    else:
-        json_objects = []
-        for line in json_lines:
+
+def fetch_jsonl_files(
+    object_paths,
+    service_endpoint: str,
+    access_key_id: str,
+    secret_access_key: str,
+    bucket_name: str = "dei-bucket",
+    return_lines: bool = False,
+    as_bytes: bool = False,
+    transform=None,
+    max_workers: int = BULK_FETCH_WORKERS,
+):
+    """
+    downloads and decodes many JSON Lines files concurrently, on a pool of
+    max_workers threads sharing one client and its connections. Yields
+    (object_path, payload, error) as each file completes, in no particular
+    order: error is None, or the exception raised for that path (the payload
+    is then None), so that one missing or corrupt file does not stop the
+    others. The paths can be a lazy iterable (e.g. from iter_objects), at most
+    2 * max_workers of them are pending at any time.
+    """
+    s3 = get_s3_client(service_endpoint=service_endpoint,
+                       access_key_id=access_key_id,
+                       secret_access_key=secret_access_key,
+                       max_pool_connections=max(max_workers, S3_MAX_POOL_CONNECTIONS))
+
+    def fetch(object_path: str):
+        payload = _decode_jsonl(_read_object(s3, bucket_name, object_path),
+                                return_lines=return_lines, as_bytes=as_bytes)
+        return payload if transform is None else transform(payload)
+
+    object_paths = iter(object_paths)
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="bulk-fetch") as pool:
+        pending = {}
+        try:
+            while True:
+                for object_path in itertools.islice(object_paths, 2 * max_workers - len(pending)):
+                    pending[pool.submit(fetch, object_path)] = object_path
+                if not pending:
+                    break
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    object_path = pending.pop(future)
+                    error = future.exception()
+                    yield object_path, (None if error is not None else future.result()), error
+        finally:
+            # the consumer stopped early: the queued downloads are dropped
+            for future in pending:
+                future.cancel()
+
+
+# (endpoint, bucket, key, decoder) -> (etag, last_modified, payload)
+REVALIDATION_MAX_OBJECTS = int(os.getenv("REVALIDATION_MAX_OBJECTS", "1024"))
+S3_NOT_MODIFIED = "dei_s3_not_modified_total"
+_revalidation_store = {}
+_revalidation_lock = threading.Lock()
+
+
+def _is_not_modified(error: ClientError) -> bool:
+    status = error.response.get('ResponseMetadata', {}).get('HTTPStatusCode')
+    code = error.response.get('Error', {}).get('Code')
+    return status == 304 or code in ('304', 'NotModified')
+
+
+def _remember(store_key, etag, last_modified, payload):
+    with _revalidation_lock:
+        _revalidation_store.pop(store_key, None)
+        _revalidation_store[store_key] = (etag, last_modified, payload)
+        # forget the oldest objects first
+        while len(_revalidation_store) > REVALIDATION_MAX_OBJECTS:
+            del _revalidation_store[next(iter(_revalidation_store))]
+
+
+def read_object_revalidated(
+    service_endpoint: str,
+    access_key_id: str,
+    secret_access_key: str,
+    bucket_name: str,
+    object_path: str,
+    decode,
+    decoder_key=None,
+):
+    """
+    reads an object and decodes its bytes with decode(), but remembers the ETag
+    and Last-Modified of the object and sends a conditional request on the next
+    read. When the object has not changed (304) the payload decoded last time
+    is returned without downloading or decoding anything. decoder_key identifies
+    the decoding (it defaults to decode itself), so that the same object read
+    in different ways is remembered separately.
+    """
+    store_key = (service_endpoint, bucket_name, object_path,
+                 decode if decoder_key is None else decoder_key)
+    with _revalidation_lock:
+        previous = _revalidation_store.get(store_key)
+
+    s3 = get_s3_client(service_endpoint=service_endpoint,
+                       access_key_id=access_key_id,
+                       secret_access_key=secret_access_key)
+
+    if disk_cache is not None:
+        # the disk cache sends the conditional request itself, and has a
+        # copy of the object even when this process never read it
+        f, etag = disk_cache.open(s3, bucket_name, object_path)
+        with f:
+            if previous is not None and previous[0] == etag:
+                _remember(store_key, *previous)
+                return previous[2]
+            with METRICS.stage("disk_cache_read"):
+                content = f.read()
+            payload = decode(content)
+        _remember(store_key, etag, None, payload)
+        return payload
+
+    request = {"Bucket": bucket_name, "Key": object_path}
+    if previous is not None:
+        etag, last_modified, _ = previous
+        # the ETag is the exact validator, Last-Modified only has a one
+        # second resolution so it is only used when there is no ETag
+        if etag:
+            request["IfNoneMatch"] = etag
+        elif last_modified:
+            request["IfModifiedSince"] = last_modified
+    try:
+        with METRICS.stage("s3_get"):
+            response = s3.get_object(**request)
+            content = response['Body'].read()
+    except ClientError as e:
+        if previous is not None and _is_not_modified(e):
+            METRICS.inc(S3_NOT_MODIFIED)
+            # marks the object as recently used
+            _remember(store_key, *previous)
+            return previous[2]
+        raise
+
+    METRICS.add_bytes("get", len(content))
+    payload = decode(content)
+    _remember(store_key, response.get('ETag'), response.get('LastModified'), payload)
+    return payload
+
+
+def read_jsonl_file_revalidated(
+    service_endpoint: str,
+    access_key_id: str,
+    secret_access_key: str,
+    bucket_name: str = "dei-bucket",
+    object_path: str = "raw_data/ADM.jsonl.gz",
+    return_lines: bool = False,
+    transform=None,
+    as_bytes: bool = False,
+):
+    """
+    reads a JSON Lines file like read_jsonl_file, but only downloads and parses
+    it again when it changed (see read_object_revalidated). An optional
+    transform is applied to fresh payloads and its result is what gets remembered.
+    With as_bytes, the lines are not decoded to str (for transforms parsing them).
+    """
+    def decode(file_content: bytes):
+        payload = _decode_jsonl(file_content, return_lines=return_lines, as_bytes=as_bytes)
+        if transform is not None:
+            payload = transform(payload)
+        return payload
+
+    return read_object_revalidated(
+        service_endpoint=service_endpoint,
+        access_key_id=access_key_id,
+        secret_access_key=secret_access_key,
+        bucket_name=bucket_name,
+        object_path=object_path,
+        decode=decode,
+        decoder_key=("jsonl", return_lines, as_bytes, transform),
+    )
+
+
+def _iter_gunzip(chunks, max_output: int = READ_CHUNK_SIZE):
+    """
+    incrementally decompresses gzipped byte chunks, yielding blocks of at most
+    max_output bytes so that highly compressed input never expands all at once;
+    raises EOFError if the stream ends in the middle of a gzip member
+    """
+    decompressor = zlib.decompressobj(wbits=zlib.MAX_WBITS | 16)
+    # whether the current member got any input, none after the last one
+    in_member = False
+    for chunk in chunks:
+        while chunk:
+            in_member = True
+            data = decompressor.decompress(chunk, max_output)
+            if data:
+                yield data
+            if decompressor.eof:
+                # a gzip file can hold several concatenated members
+                chunk = decompressor.unused_data
+                decompressor = zlib.decompressobj(wbits=zlib.MAX_WBITS | 16)
+                in_member = False
+            else:
+                chunk = decompressor.unconsumed_tail
+    data = decompressor.flush()
+    if data:
+        yield data
+    if in_member and not decompressor.eof:
+        raise EOFError("compressed stream ended before the end-of-stream marker was reached")
+
+
+def _iter_gzip_lines(chunks, max_output: int = READ_CHUNK_SIZE, decode: bool = True):
+    """
+    yields the non-empty lines of a gzipped stream of byte chunks, decoded to
+    str unless decode is False
+    """
+    pending = b''
+    for data in _iter_gunzip(chunks, max_output=max_output):
+        pending += data
+        *lines, pending = pending.split(b'\n')
+        for line in lines:
             if line:
-                json_objects.append(json.loads(line))
+                yield line.decode('utf-8') if decode else line
+    if pending:
+        yield pending.decode('utf-8') if decode else pending
+
+
+def iter_jsonl_file(
+    service_endpoint: str,
+    access_key_id: str,
+    secret_access_key: str,
+    bucket_name: str = "dei-bucket",
+    object_path: str = "raw_data/ADM.jsonl.gz",
+    return_lines: bool = False,
+    chunk_size: int = READ_CHUNK_SIZE,
+):
+    """
+    streams a gzipped JSON Lines file stored in a Wasabi bucket, yielding its
+    lines (or parsed objects) while the body is downloaded and decompressed
+    chunk by chunk, so memory stays bounded by chunk_size and the longest line
+    """
+    s3 = get_s3_client(service_endpoint=service_endpoint,
+                       access_key_id=access_key_id,
+                       secret_access_key=secret_access_key)
+
+    received = 0
+    nb_lines = 0
+    # a cached object is read from disk, others are streamed without being
+    # cached: the caller may stop early, e.g. once a head sample is read
+    if disk_cache is not None:
+        body, cached = disk_cache.open_stream(s3, bucket_name, object_path)
+    else:
+        body, cached = s3.get_object(Bucket=bucket_name, Key=object_path)['Body'], False
+    if cached:
+        chunks = iter(functools.partial(body.read, chunk_size), b'')
+    else:
+        def count_received(chunks):
+            nonlocal received
+            for chunk in chunks:
+                received += len(chunk)
+                yield chunk
+
+        chunks = count_received(body.iter_chunks(chunk_size))
+    try:
+        for line in _iter_gzip_lines(chunks, max_output=chunk_size, decode=return_lines):
+            nb_lines += 1
+            yield line if return_lines else json_codec.loads(line)
+    finally:
+        body.close()
+        METRICS.add_bytes("get", received)
+        METRICS.add_records("jsonl_stream", nb_lines)
+
+
+_END = object()
+
+
+def _open_uniform(rng: random.Random) -> float:
+    # uniform in (0, 1), logarithms of it are finite
+    while True:
+        u = rng.random()
+        if u > 0:
+            return u
+
+
+def reservoir_sample(items, n: int, seed=None) -> list:
+    """
+    returns a uniform random sample of n items of an iterable of unknown
+    length (all of them if there are fewer), holding only n items in memory.
+    Uses Algorithm L, which draws how many items to skip instead of drawing
+    for each item.
+    """
+    rng = random.Random(seed)
+    items = iter(items)
+    reservoir = list(itertools.islice(items, n))
+    if n <= 0 or len(reservoir) < n:
+        return reservoir
+    w = math.exp(math.log(_open_uniform(rng)) / n)
+    while True:
+        skip = math.floor(math.log(_open_uniform(rng)) / math.log(1 - w))
+        item = next(itertools.islice(items, skip, skip + 1), _END)
+        if item is _END:
+            return reservoir
+        reservoir[rng.randrange(n)] = item
+        w *= math.exp(math.log(_open_uniform(rng)) / n)
 
-        return json_objects
+
+SAMPLE_MODES = ("head", "reservoir")
+
+
+def sample_jsonl_file(
+    service_endpoint: str,
+    access_key_id: str,
+    secret_access_key: str,
+    bucket_name: str = "dei-bucket",
+    object_path: str = "raw_data/ADM.jsonl.gz",
+    n: int = 100_000,
+    mode: str = "head",
+    seed=None,
+    return_lines: bool = False,
+):
+    """
+    streams at most n lines (or parsed objects) of a gzipped JSON Lines file:
+    - head: the first n, the download stops as soon as they are read
+    - reservoir: a uniform random sample of the whole file (seeded by seed),
+      which is streamed through with only n lines in memory
+    """
+    if mode not in SAMPLE_MODES:
+        raise ValueError(f"unknown sample mode {mode!r}, expected one of {SAMPLE_MODES}")
+    lines = iter_jsonl_file(
+        service_endpoint=service_endpoint,
+        access_key_id=access_key_id,
+        secret_access_key=secret_access_key,
+        bucket_name=bucket_name,
+        object_path=object_path,
+        return_lines=True,
+    )
+    return _iter_sample(lines, n, mode, seed, return_lines)
+
+
+def _iter_sample(lines, n: int, mode: str, seed, return_lines: bool):
+    try:
+        if mode == "head":
+            sample = itertools.islice(lines, n)
+        else:
+            # lines are only parsed once sampled
+            sample = reservoir_sample(lines, n, seed=seed)
+        for line in sample:
+            yield line if return_lines else json_codec.loads(line)
+    finally:
+        # closes the S3 body, nothing more is downloaded
+        lines.close()
 
 
 def download_and_save_jsonl_file_locally(
@@ -146,30 +612,18 @@ def download_and_save_jsonl_file_locally(
     """
     Downloads a JSON Lines file from S3 and saves it locally as a .jsonl.gz file
     """
-    s3 = boto3.client('s3',
-                      aws_access_key_id=access_key_id,
-                      aws_secret_access_key=secret_access_key,
-                      endpoint_url=service_endpoint)
-
-    response = s3.get_object(Bucket=bucket_name, Key=object_path)
-
-    # read the contents of the file
-    file_content = response['Body'].read()
-
-    # decompress the gzipped content
-    file_content = gzip.decompress(file_content)
-
-    # parse the JSON lines
-    json_lines = file_content.decode('utf-8').split('\n')
-    json_objects = []
-    for line in json_lines:
-        if line:
-            json_objects.append(json.loads(line))
+    json_objects = iter_jsonl_file(
+        service_endpoint=service_endpoint,
+        access_key_id=access_key_id,
+        secret_access_key=secret_access_key,
+        bucket_name=bucket_name,
+        object_path=object_path,
+    )
 
     # save the JSON objects to a new file
     with gzip.open(local_path, 'wb') as f:
         for obj in json_objects:
-            f.write(json.dumps(obj).encode('utf-8'))
+            f.write(json_codec.dumps(obj))
             f.write('\n'.encode('utf-8'))
 
 
@@ -188,13 +642,87 @@ def create_s3_folder(
         folder_path += '/'
 
     # create a new object in the bucket with the folder path as the key
-    s3 = boto3.client('s3',
-                      aws_access_key_id=access_key_id,
-                      aws_secret_access_key=secret_access_key,
-                      endpoint_url=service_endpoint)
+    s3 = get_s3_client(service_endpoint=service_endpoint,
+                       access_key_id=access_key_id,
+                       secret_access_key=secret_access_key)
     s3.put_object(Bucket=bucket_name, Key=(folder_path))
 
 
+def _iter_gzip_parts(lines, part_size: int = WRITE_PART_SIZE):
+    """
+    gzip-compresses encoded lines (bytes) incrementally, joined with newlines and without a
+    trailing one (like the files written so far), and yields the compressed
+    stream in parts of at least part_size bytes, the last one being smaller
+    """
+    # same compression level as gzip.compress
+    compressor = zlib.compressobj(9, zlib.DEFLATED, 31)
+    part = bytearray()
+    separator = b""
+    for line in lines:
+        part += compressor.compress(separator + line)
+        separator = b"\n"
+        if len(part) >= part_size:
+            yield bytes(part)
+            part.clear()
+    part += compressor.flush()
+    yield bytes(part)
+
+
+def save_records_to_s3_as_jsonl_file(
+    records,
+    service_endpoint: str,
+    access_key_id: str,
+    secret_access_key: str,
+    bucket_name: str = "dei-bucket",
+    object_path: str = "raw_data/ADM.jsonl.gz",
+    part_size: int = WRITE_PART_SIZE,
+):
+    """
+    streams any iterable of records to a gzipped JSON Lines file in a S3
+    bucket, one record per line. Records are compressed as they are
+    consumed and uploaded in parts of part_size bytes, so that the memory
+    used does not depend on the size of the file; files that fit in a
+    single part are uploaded with a plain put_object.
+    """
+    s3 = get_s3_client(service_endpoint=service_endpoint,
+                       access_key_id=access_key_id,
+                       secret_access_key=secret_access_key)
+    part_size = max(part_size, MULTIPART_MIN_PART_SIZE)
+    parts = _iter_gzip_parts((json_codec.dumps(record) for record in records), part_size)
+    first = next(parts)
+    second = next(parts, None)
+    if second is None:
+        with METRICS.stage("s3_put"):
+            s3.put_object(Body=first, Bucket=bucket_name, Key=object_path)
+        METRICS.add_bytes("put", len(first))
+        return
+
+    upload_id = s3.create_multipart_upload(Bucket=bucket_name, Key=object_path)['UploadId']
+    uploaded = []
+    try:
+        for number, body in enumerate(itertools.chain((first, second), parts), start=1):
+            with METRICS.stage("s3_put"):
+                response = s3.upload_part(
+                    Body=body,
+                    Bucket=bucket_name,
+                    Key=object_path,
+                    UploadId=upload_id,
+                    PartNumber=number,
+                )
+            METRICS.add_bytes("put", len(body))
+            uploaded.append({"PartNumber": number, "ETag": response['ETag']})
+        s3.complete_multipart_upload(
+            Bucket=bucket_name,
+            Key=object_path,
+            UploadId=upload_id,
+            MultipartUpload={"Parts": uploaded},
+        )
+    except BaseException:
+        # do not leave the uploaded parts billed in the bucket
+        s3.abort_multipart_upload(Bucket=bucket_name, Key=object_path, UploadId=upload_id)
+        raise
+
+
 def save_dict_to_s3_as_jsonl_file(
     data_dict: dict,
     service_endpoint: str,
@@ -204,19 +732,140 @@ def save_dict_to_s3_as_jsonl_file(
     object_path: str = "raw_data/ADM.jsonl.gz"
 ):
     """
-    Takes a Python dictionary, converts it to JSON Lines format, and saves it to a specified location in a S3 bucket
+    Takes a Python dictionary, converts it to JSON Lines format (one {key: value} per line), and saves it to a
+    specified location in a S3 bucket
+    """
+    save_records_to_s3_as_jsonl_file(
+        ({key: value} for key, value in data_dict.items()),
+        service_endpoint=service_endpoint,
+        access_key_id=access_key_id,
+        secret_access_key=secret_access_key,
+        bucket_name=bucket_name,
+        object_path=object_path,
+    )
+
+
+def read_json_object(
+    service_endpoint: str,
+    access_key_id: str,
+    secret_access_key: str,
+    bucket_name: str = "dei-bucket",
+    object_path: str = "company_scores/manifest.json",
+    default=None,
+):
+    """
+    reads a JSON document stored in a S3 bucket, returns default if it does not exist
+    """
+    s3 = get_s3_client(service_endpoint=service_endpoint,
+                       access_key_id=access_key_id,
+                       secret_access_key=secret_access_key)
+    try:
+        response = s3.get_object(Bucket=bucket_name, Key=object_path)
+    except ClientError as e:
+        if e.response.get('Error', {}).get('Code') in ('NoSuchKey', '404'):
+            return default
+        raise
+    return json_codec.loads(response['Body'].read())
+
+
+def save_json_object(
+    data,
+    service_endpoint: str,
+    access_key_id: str,
+    secret_access_key: str,
+    bucket_name: str = "dei-bucket",
+    object_path: str = "company_scores/manifest.json",
+):
+    """
+    saves a JSON document to a specified location in a S3 bucket
     """
-    # convert dictionary to JSON Lines format
-    json_lines = []
-    for key, value in data_dict.items():
-        json_lines.append(json.dumps({key: value}))
+    s3 = get_s3_client(service_endpoint=service_endpoint,
+                       access_key_id=access_key_id,
+                       secret_access_key=secret_access_key)
+    s3.put_object(
+        Body=json.dumps(data, indent=2, default=str).encode('utf-8'),
+        Bucket=bucket_name,
+        Key=object_path,
+        ContentType='application/json',
+    )
+
 
-    # compress the JSON Lines content
-    file_content = gzip.compress('\n'.join(json_lines).encode('utf-8'))
+def _require_pyarrow():
+    if pa is None:
+        raise ImportError("pyarrow is required to read or write parquet snapshots")
 
-    # upload the compressed content to S3
-    s3 = boto3.client('s3',
-                      aws_access_key_id=access_key_id,
-                      aws_secret_access_key=secret_access_key,
-                      endpoint_url=service_endpoint)
-    s3.put_object(Body=file_content, Bucket=bucket_name, Key=object_path)
+
+def save_dataframe_to_s3_as_parquet(
+    df,
+    service_endpoint: str,
+    access_key_id: str,
+    secret_access_key: str,
+    bucket_name: str = "dei-bucket",
+    object_path: str = "company_scores/all/companies.parquet",
+    preserve_index: bool = False,
+):
+    """
+    saves a pandas DataFrame as a typed, columnar parquet file in a S3 bucket
+    """
+    _require_pyarrow()
+    table = pa.Table.from_pandas(df, preserve_index=preserve_index)
+    buffer = io.BytesIO()
+    pq.write_table(table, buffer, compression="zstd")
+
+    s3 = get_s3_client(service_endpoint=service_endpoint,
+                       access_key_id=access_key_id,
+                       secret_access_key=secret_access_key)
+    with METRICS.stage("s3_put"):
+        s3.put_object(Body=buffer.getvalue(), Bucket=bucket_name, Key=object_path)
+    METRICS.add_bytes("put", buffer.getbuffer().nbytes)
+
+
+def _decode_parquet(file_content: bytes, columns: list = None):
+    # the reader works on the downloaded bytes in place, only the selected
+    # columns are decoded
+    return pq.read_table(pa.BufferReader(file_content), columns=columns)
+
+
+def read_parquet_file(
+    service_endpoint: str,
+    access_key_id: str,
+    secret_access_key: str,
+    bucket_name: str = "dei-bucket",
+    object_path: str = "company_scores/all/companies.parquet",
+    columns: list = None,
+):
+    """
+    reads a parquet file stored in a S3 bucket as a pyarrow Table, only
+    decoding the given columns
+    """
+    _require_pyarrow()
+    s3 = get_s3_client(service_endpoint=service_endpoint,
+                       access_key_id=access_key_id,
+                       secret_access_key=secret_access_key)
+    return _decode_parquet(_read_object(s3, bucket_name, object_path), columns=columns)
+
+
+def read_parquet_file_revalidated(
+    service_endpoint: str,
+    access_key_id: str,
+    secret_access_key: str,
+    bucket_name: str = "dei-bucket",
+    object_path: str = "company_scores/all/companies.parquet",
+    columns: list = None,
+):
+    """
+    reads a parquet file like read_parquet_file, but only downloads it again
+    when it changed; columns are selected on the remembered table without copy
+    """
+    _require_pyarrow()
+    table = read_object_revalidated(
+        service_endpoint=service_endpoint,
+        access_key_id=access_key_id,
+        secret_access_key=secret_access_key,
+        bucket_name=bucket_name,
+        object_path=object_path,
+        decode=_decode_parquet,
+    )
+    if columns is not None:
+        table = table.select(columns)
+    return table
@@ -0,0 +1,267 @@
+# versioned snapshot bundles of the aggregates served by the API. Publishing
+# copies the current aggregates (server side, nothing is downloaded) under
+# company_scores/bundles/<version>/, writes the manifest of that version, and
+# only then moves the pointer company_scores/bundles/current.json to it. The
+# objects of a version are never rewritten, so a reader following the pointer
+# always gets a consistent set of aggregates, whatever the batch jobs are
+# writing at the time.
+
+import hashlib
+import logging
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from types import MappingProxyType
+from botocore.exceptions import ClientError
+from core import json_codec
+from core.metrics import METRICS
+from core.rankings import RANKINGS_PATH
+from core.s3_client import get_s3_client
+from core.s3_utilities import (
+    _decode_jsonl,
+    _decode_parquet,
+    _read_object,
+    iter_folders,
+    iter_objects,
+    read_json_object,
+    read_object_revalidated,
+    save_json_object,
+)
+
+logger = logging.getLogger(__name__)
+
+BUNDLES_PREFIX = "company_scores/bundles"
+BUNDLE_POINTER_PATH = f"{BUNDLES_PREFIX}/current.json"
+# number of published versions kept, older ones are deleted by the next publish
+BUNDLE_KEEP_VERSIONS = int(os.getenv("SNAPSHOT_BUNDLE_KEEP_VERSIONS", "3"))
+# max number of bundle objects downloaded at the same time
+BUNDLE_LOAD_WORKERS = int(os.getenv("SNAPSHOT_BUNDLE_LOAD_WORKERS", "8"))
+
+# name -> path of the current aggregate a bundle copies
+BUNDLE_SOURCES = {
+    "all_company_data": "company_scores/all/all_companies.jsonl.gz",
+    "all_companies": "company_scores/all/companies_metadata.jsonl.gz",
+    "industry_stats": "company_scores/all/industry_statistics.jsonl.gz",
+    "sector_stats": "company_scores/all/sector_statistics.jsonl.gz",
+    "rankings": RANKINGS_PATH,
+    "companies_table": "company_scores/all/companies.parquet",
+}
+# a bundle is not published without these, the others are optional
+REQUIRED_OBJECTS = ("all_company_data", "all_companies", "industry_stats", "sector_stats")
+
+
+class SnapshotBundle:
+    """
+    one loaded version of the bundle; objects maps each name to its decoded
+    data and is read only, as is the data itself once the bundle is served.
+    derived holds what the server builds from the objects (encoded responses,
+    indexes) before serving them, so that they always match the objects.
+    """
+    __slots__ = ("version", "created_at", "objects", "derived", "loaded_at")
+
+    def __init__(self, version: str, created_at: float, objects: dict):
+        self.version = version
+        self.created_at = created_at
+        self.objects = MappingProxyType(objects)
+        self.derived = {}
+        self.loaded_at = time.time()
+
+    def __repr__(self):
+        return f"SnapshotBundle(version={self.version!r}, objects={sorted(self.objects)})"
+
+
+def content_digest(etags: dict) -> str:
+    return hashlib.sha256(
+        "\0".join(f"{name}={etag}" for name, etag in sorted(etags.items())).encode("utf-8")
+    ).hexdigest()[:12]
+
+
+def bundle_version(etags: dict, now: float = None) -> str:
+    """
+    returns a version name that sorts by publication time and identifies the
+    content (the ETags of the copied aggregates)
+    """
+    timestamp = time.strftime("%Y%m%dT%H%M%SZ", time.gmtime(time.time() if now is None else now))
+    return f"{timestamp}-{content_digest(etags)}"
+
+
+def bundle_object_path(version: str, source_path: str) -> str:
+    return f"{BUNDLES_PREFIX}/{version}/{source_path.rsplit('/', 1)[-1]}"
+
+
+def _is_missing(error: ClientError) -> bool:
+    return error.response.get('Error', {}).get('Code') in ('NoSuchKey', '404', 'NotFound')
+
+
+def publish_snapshot_bundle(
+    service_endpoint: str,
+    access_key_id: str,
+    secret_access_key: str,
+    bucket_name: str = "dei-bucket",
+    sources: dict = None,
+    keep: int = BUNDLE_KEEP_VERSIONS,
+) -> dict:
+    """
+    copies the current aggregates into a new bundle version, saves its
+    manifest, then points company_scores/bundles/current.json to it; returns
+    the manifest. A copy fails if its source changed after it was listed, so
+    that the manifest describes exactly what was copied. Nothing is published
+    when the aggregates did not change since the current version.
+    """
+    sources = BUNDLE_SOURCES if sources is None else sources
+    s3 = get_s3_client(service_endpoint=service_endpoint,
+                       access_key_id=access_key_id,
+                       secret_access_key=secret_access_key)
+
+    heads = {}
+    for name, source_path in sources.items():
+        try:
+            heads[name] = s3.head_object(Bucket=bucket_name, Key=source_path)
+        except ClientError as e:
+            if not _is_missing(e) or name in REQUIRED_OBJECTS:
+                raise
+            logger.warning(f"{source_path} does not exist, {name} is left out of the bundle")
+
+    credentials = {
+        "service_endpoint": service_endpoint,
+        "access_key_id": access_key_id,
+        "secret_access_key": secret_access_key,
+        "bucket_name": bucket_name,
+    }
+    etags = {name: head.get('ETag') for name, head in heads.items()}
+    pointer = read_json_object(object_path=BUNDLE_POINTER_PATH, **credentials)
+    if pointer is not None and pointer["version"].endswith(f"-{content_digest(etags)}"):
+        logger.info(f"snapshot bundle {pointer['version']} is up to date")
+        return read_json_object(object_path=pointer["manifest"], **credentials)
+
+    version = bundle_version(etags)
+    objects = {}
+    for name, head in heads.items():
+        path = bundle_object_path(version, sources[name])
+        response = s3.copy_object(
+            Bucket=bucket_name,
+            Key=path,
+            CopySource={"Bucket": bucket_name, "Key": sources[name]},
+            CopySourceIfMatch=head['ETag'],
+        )
+        objects[name] = {
+            "path": path,
+            "etag": response.get('CopyObjectResult', {}).get('ETag'),
+            "size": head.get('ContentLength'),
+            "source": sources[name],
+        }
+
+    manifest = {"version": version, "created_at": time.time(), "objects": objects}
+    manifest_path = f"{BUNDLES_PREFIX}/{version}/manifest.json"
+    save_json_object(manifest, object_path=manifest_path, **credentials)
+    # readers only ever see complete versions: the pointer is written last
+    save_json_object({"version": version, "manifest": manifest_path},
+                     object_path=BUNDLE_POINTER_PATH, **credentials)
+    logger.info(f"published snapshot bundle {version} with {sorted(objects)}")
+
+    if keep:
+        prune_snapshot_bundles(keep=keep, current=version, **credentials)
+    return manifest
+
+
+def prune_snapshot_bundles(
+    service_endpoint: str,
+    access_key_id: str,
+    secret_access_key: str,
+    bucket_name: str = "dei-bucket",
+    keep: int = BUNDLE_KEEP_VERSIONS,
+    current: str = None,
+):
+    """
+    deletes every version but the `keep` most recent ones (and the current one),
+    the versions kept give time to the readers still loading an older one
+    """
+    credentials = {
+        "service_endpoint": service_endpoint,
+        "access_key_id": access_key_id,
+        "secret_access_key": secret_access_key,
+        "bucket_name": bucket_name,
+    }
+    versions = sorted(
+        folder[len(BUNDLES_PREFIX) + 1:].rstrip("/")
+        for folder in iter_folders(prefix=f"{BUNDLES_PREFIX}/", **credentials))
+    s3 = get_s3_client(service_endpoint=service_endpoint,
+                       access_key_id=access_key_id,
+                       secret_access_key=secret_access_key)
+    for version in versions[:-keep]:
+        if version == current:
+            continue
+        keys = [obj["key"] for obj in iter_objects(prefix=f"{BUNDLES_PREFIX}/{version}/", **credentials)]
+        # delete_objects takes at most 1000 keys
+        for start in range(0, len(keys), 1000):
+            s3.delete_objects(Bucket=bucket_name, Delete={
+                "Objects": [{"Key": key} for key in keys[start:start + 1000]], "Quiet": True})
+        logger.info(f"deleted snapshot bundle {version}")
+
+
+def read_snapshot_pointer(
+    service_endpoint: str,
+    access_key_id: str,
+    secret_access_key: str,
+    bucket_name: str = "dei-bucket",
+):
+    """
+    returns the pointer {"version", "manifest"} to the current bundle, or None
+    if no bundle was published; an unchanged pointer costs a 304
+    """
+    try:
+        return read_object_revalidated(
+            service_endpoint=service_endpoint,
+            access_key_id=access_key_id,
+            secret_access_key=secret_access_key,
+            bucket_name=bucket_name,
+            object_path=BUNDLE_POINTER_PATH,
+            decode=json_codec.loads,
+        )
+    except ClientError as e:
+        if _is_missing(e):
+            return None
+        raise
+
+
+def decode_bundle_object(path: str, content: bytes, transform=None):
+    """
+    decodes a bundle object by its type: JSON Lines files as a list of bytes
+    lines passed to transform, parquet files as a pyarrow Table
+    """
+    if path.endswith(".parquet"):
+        payload = _decode_parquet(content)
+    else:
+        payload = _decode_jsonl(content, return_lines=True, as_bytes=True)
+    return payload if transform is None else transform(payload)
+
+
+def load_snapshot_bundle(
+    pointer: dict,
+    transforms: dict,
+    service_endpoint: str,
+    access_key_id: str,
+    secret_access_key: str,
+    bucket_name: str = "dei-bucket",
+    max_workers: int = BUNDLE_LOAD_WORKERS,
+) -> SnapshotBundle:
+    """
+    downloads and decodes the objects of the bundle a pointer refers to, in
+    parallel; transforms maps the names of the objects to load to the
+    function applied to their decoded content (or None)
+    """
+    s3 = get_s3_client(service_endpoint=service_endpoint,
+                       access_key_id=access_key_id,
+                       secret_access_key=secret_access_key)
+    manifest = json_codec.loads(_read_object(s3, bucket_name, pointer["manifest"]))
+    entries = {name: entry for name, entry in manifest["objects"].items() if name in transforms}
+
+    def load(name: str):
+        path = entries[name]["path"]
+        return decode_bundle_object(path, _read_object(s3, bucket_name, path), transforms[name])
+
+    with METRICS.stage("snapshot_bundle_load"):
+        with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="bundle-load") as pool:
+            objects = dict(zip(entries, pool.map(load, entries)))
+    logger.info(f"loaded snapshot bundle {manifest['version']} with {sorted(objects)}")
+    return SnapshotBundle(manifest["version"], manifest.get("created_at"), objects)
@@ -1,7 +1,7 @@
 import os
-import boto3
-import json
 from botocore.exceptions import ClientError
+from core import json_codec
+from core.s3_client import get_s3_client
 import logging
 import glob
 
@@ -25,40 +25,36 @@ class WASABI_CONNECT:
         self.secret_access_key = secret_access_key
         self.bucket_name = bucket_name
 
+    def _client(self):
+        return get_s3_client(
+            service_endpoint=self.service_endpoint,
+            access_key_id=self.access_key_id,
+            secret_access_key=self.secret_access_key,
+        )
+
     def object_content(self, object_path: str = "company_scorecards/scorecards.json"):
         """
         returns the content of a file stored in the bucket
         """
-        wasa_resources = boto3.resource('s3',
-                                        aws_access_key_id=self.access_key_id,
-                                        aws_secret_access_key=self.secret_access_key,
-                                        endpoint_url=self.service_endpoint)
-        wasa_object = wasa_resources.Object(self.bucket_name, object_path)
-        file_content = wasa_object.get()['Body'].read().decode('utf-8')
-        json_content = json.loads(file_content)
+        wasa_client = self._client()
+        wasa_object = wasa_client.get_object(Bucket=self.bucket_name, Key=object_path)
+        json_content = json_codec.loads(wasa_object['Body'].read())
         return json_content
 
     def list_of_files_in_folder(self, folder_path: str = "company_scorecards/"):
         """
         """
-        wasa_resources = boto3.resource('s3',
-                                        aws_access_key_id=self.access_key_id,
-                                        aws_secret_access_key=self.secret_access_key,
-                                        endpoint_url=self.service_endpoint)
-        wasa_bucket = wasa_resources.Bucket(self.bucket_name)
+        paginator = self._client().get_paginator('list_objects_v2')
         object_list = []
-        for object_summary in wasa_bucket.objects.filter(Prefix=folder_path):
-            object_list.append(object_summary.key)
+        for page in paginator.paginate(Bucket=self.bucket_name, Prefix=folder_path):
+            for object_summary in page.get('Contents', []):
+                object_list.append(object_summary['Key'])
         return object_list
 
     def upload_files(self, local_filepath: str, bucket_folder: str = None):
         """
         """
-        # Create a session with profile credentials
-        wasa_client = boto3.client('s3',
-                                   aws_access_key_id=self.access_key_id,
-                                   aws_secret_access_key=self.secret_access_key,
-                                   endpoint_url=self.service_endpoint)
+        wasa_client = self._client()
 
         # Upload file and md5
         file_base = os.path.basename(local_filepath)
@@ -0,0 +1,98 @@
+# multi-worker serving, from src/: gunicorn -c gunicorn.conf.py app.main:app
+# gunicorn runs WEB_CONCURRENCY uvicorn workers. Before they start, it forks a
+# loader process that materializes the snapshot bundle in SHARED_DATASET_DIR
+# (see services/dataset_loader.py and app/shared_dataset.py), and every worker
+# maps that dataset instead of downloading and parsing the aggregates itself.
+# The master restarts the loader if it dies.
+
+import logging
+import multiprocessing
+import multiprocessing.connection
+import os
+import signal
+import threading
+
+logger = logging.getLogger(__name__)
+
+bind = os.getenv("BIND", "0.0.0.0:80")
+workers = int(os.getenv("WEB_CONCURRENCY", str(multiprocessing.cpu_count())))
+worker_class = "uvicorn.workers.UvicornWorker"
+timeout = int(os.getenv("WORKER_TIMEOUT", "120"))
+keepalive = 5
+
+# read by the workers (app.main) as well
+SHARED_DATASET_DIR = os.environ.setdefault("SHARED_DATASET_DIR", "/tmp/dei-dataset")
+# max number of seconds the workers wait at startup for the first dataset
+SHARED_DATASET_STARTUP_TIMEOUT = float(os.getenv("SHARED_DATASET_STARTUP_TIMEOUT", "300"))
+# seconds between two checks that the loader process is still running
+SHARED_DATASET_LOADER_CHECK_SECONDS = float(os.getenv("SHARED_DATASET_LOADER_CHECK_SECONDS", "10"))
+
+_loader = None
+_loader_lock = threading.Lock()
+_stopping = threading.Event()
+
+
+def _run_loader(**kwargs):
+    from gunicorn.arbiter import Arbiter
+    from services.dataset_loader import run_dataset_loader
+
+    # a loader restarted by the master inherits the handlers gunicorn installed
+    # there, which would only queue the SIGTERM of on_exit
+    for signum in Arbiter.SIGNALS + [signal.SIGCHLD]:
+        signal.signal(signum, signal.SIG_DFL)
+    run_dataset_loader(**kwargs)
+
+
+def _start_loader():
+    """
+    forks the loader process, returns the Event it sets once the first
+    update was attempted
+    """
+    global _loader
+    ready = multiprocessing.Event()
+    _loader = multiprocessing.Process(
+        target=_run_loader, kwargs={"directory": SHARED_DATASET_DIR, "ready": ready},
+        name="dataset-loader", daemon=True)
+    _loader.start()
+    return ready
+
+
+def _loader_exited() -> bool:
+    # the master reaps all its children, so Process.is_alive() never sees the
+    # loader exit; its sentinel becomes ready when it does
+    return bool(multiprocessing.connection.wait([_loader.sentinel], timeout=0))
+
+
+def _ensure_loader():
+    with _loader_lock:
+        if _stopping.is_set() or _loader is None or not _loader_exited():
+            return
+        logger.error("the dataset loader exited, restarting it")
+        _start_loader()
+
+
+def _monitor_loader():
+    while not _stopping.wait(SHARED_DATASET_LOADER_CHECK_SECONDS):
+        _ensure_loader()
+
+
+def on_starting(server):
+    ready = _start_loader()
+    if not ready.wait(SHARED_DATASET_STARTUP_TIMEOUT):
+        logger.warning("the shared dataset is not ready, the workers start without it")
+
+
+def when_ready(server):
+    threading.Thread(target=_monitor_loader, name="dataset-loader-monitor", daemon=True).start()
+
+
+def on_reload(server):
+    _ensure_loader()
+
+
+def on_exit(server):
+    _stopping.set()
+    with _loader_lock:
+        if _loader is not None:
+            _loader.terminate()
+            _loader.join(10)
@@ -0,0 +1,38 @@
+import logging
+import os
+from core.company_store import publish_packed_company_store
+from core.s3_utilities import merge_jsonl_lines, read_jsonl_file
+
+logger = logging.getLogger(__name__)
+
+SERVICE_ENDPOINT = os.getenv(
+    "SERVICE_ENDPOINT", "https://s3.us-west-1.wasabisys.com")
+ACCESS_KEY_ID = os.environ.get("ACCESS_KEY_ID")
+SECRET_ACCESS_KEY = os.environ.get("SECRET_ACCESS_KEY")
+
+
+def build_company_store():
+    """
+    packs every company of company_scores/all/all_companies.jsonl.gz
+    (one {company_id: company data} line per company) into the packed store
+    """
+    companies = merge_jsonl_lines(read_jsonl_file(
+        service_endpoint=SERVICE_ENDPOINT,
+        access_key_id=ACCESS_KEY_ID,
+        secret_access_key=SECRET_ACCESS_KEY,
+        bucket_name="dei-bucket",
+        object_path="company_scores/all/all_companies.jsonl.gz",
+        return_lines=True,
+    ))
+    return publish_packed_company_store(
+        companies,
+        service_endpoint=SERVICE_ENDPOINT,
+        access_key_id=ACCESS_KEY_ID,
+        secret_access_key=SECRET_ACCESS_KEY,
+        bucket_name="dei-bucket",
+    )
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    build_company_store()
@@ -0,0 +1,88 @@
+import argparse
+import logging
+import os
+import time
+from app.shared_dataset import materialize_dataset, read_current_version
+from core.s3_utilities import merge_jsonl_lines
+from core.snapshot_bundle import load_snapshot_bundle, read_snapshot_pointer
+
+logger = logging.getLogger(__name__)
+
+SERVICE_ENDPOINT = os.getenv(
+    "SERVICE_ENDPOINT", "https://s3.us-west-1.wasabisys.com")
+ACCESS_KEY_ID = os.environ.get("ACCESS_KEY_ID")
+SECRET_ACCESS_KEY = os.environ.get("SECRET_ACCESS_KEY")
+
+SHARED_DATASET_DIR = os.getenv("SHARED_DATASET_DIR", "/tmp/dei-dataset")
+SNAPSHOT_REFRESH_SECONDS = float(os.getenv("SNAPSHOT_REFRESH_SECONDS", "60"))
+
+# the rankings are kept as lines, each worker builds its own index from them
+LOADER_TRANSFORMS = {
+    "all_company_data": merge_jsonl_lines,
+    "all_companies": merge_jsonl_lines,
+    "industry_stats": merge_jsonl_lines,
+    "sector_stats": merge_jsonl_lines,
+    "rankings": None,
+    "companies_table": None,
+}
+
+
+def update_dataset(directory: str = SHARED_DATASET_DIR):
+    """
+    materializes the current snapshot bundle in directory if it is not the
+    current version there yet; returns the current version, or None if no
+    bundle was published
+    """
+    credentials = {
+        "service_endpoint": SERVICE_ENDPOINT,
+        "access_key_id": ACCESS_KEY_ID,
+        "secret_access_key": SECRET_ACCESS_KEY,
+        "bucket_name": "dei-bucket",
+    }
+    version = read_current_version(directory)
+    pointer = read_snapshot_pointer(**credentials)
+    if pointer is None:
+        logger.warning("no snapshot bundle published, the workers load the aggregates themselves")
+        return version
+    if pointer["version"] == version:
+        return version
+    snapshot = load_snapshot_bundle(pointer, LOADER_TRANSFORMS, **credentials)
+    return materialize_dataset(snapshot, directory)
+
+
+def run_dataset_loader(
+    directory: str = SHARED_DATASET_DIR,
+    refresh_seconds: float = SNAPSHOT_REFRESH_SECONDS,
+    ready=None,
+):
+    """
+    keeps the shared dataset up to date with the snapshot bundle; ready (an
+    Event) is set once the first update was attempted
+    """
+    os.makedirs(directory, exist_ok=True)
+    while True:
+        try:
+            update_dataset(directory)
+        except Exception:
+            logger.exception("failed to update the shared dataset")
+        if ready is not None:
+            ready.set()
+        time.sleep(refresh_seconds)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="materialize the snapshot bundle for the API workers")
+    parser.add_argument("--directory", default=SHARED_DATASET_DIR)
+    parser.add_argument("--refresh-seconds", type=float, default=SNAPSHOT_REFRESH_SECONDS)
+    parser.add_argument("--once", action="store_true", help="update the dataset once and exit")
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    args = parse_args()
+    if args.once:
+        os.makedirs(args.directory, exist_ok=True)
+        update_dataset(args.directory)
+    else:
+        run_dataset_loader(args.directory, args.refresh_seconds)
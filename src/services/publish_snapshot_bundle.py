@@ -0,0 +1,28 @@
+import logging
+import os
+from core.snapshot_bundle import publish_snapshot_bundle
+
+logger = logging.getLogger(__name__)
+
+SERVICE_ENDPOINT = os.getenv(
+    "SERVICE_ENDPOINT", "https://s3.us-west-1.wasabisys.com")
+ACCESS_KEY_ID = os.environ.get("ACCESS_KEY_ID")
+SECRET_ACCESS_KEY = os.environ.get("SECRET_ACCESS_KEY")
+
+
+def publish_bundle():
+    """
+    publishes the current aggregates as a new snapshot bundle, to be run once
+    the insights job and the scorecards aggregation are done
+    """
+    return publish_snapshot_bundle(
+        service_endpoint=SERVICE_ENDPOINT,
+        access_key_id=ACCESS_KEY_ID,
+        secret_access_key=SECRET_ACCESS_KEY,
+        bucket_name="dei-bucket",
+    )
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    publish_bundle()
@@ -1,15 +1,19 @@
-import time
+import argparse
+import logging
 import sys
 from pathlib import Path
+from core.metrics import METRICS
 from core.s3_utilities import *
+from services import scorecard_batch
+from services.scorecard_batch import DEFAULT_SAMPLE_MODE, DEFAULT_SAMPLE_SIZE, DEFAULT_WORKERS
 sys.path.append(str(Path(__file__).resolve().parents[2]))
 from diversitymaster import diversity
 
+logger = logging.getLogger(__name__)
+
 # all_files = list_files_folders()
-all_raw_company_data = list_files_in_raw_data_folder()
 exclude = ['raw_data/scorecards.json',
            'raw_data/scorecards_tst1.json', 'raw_data/scorecards_tst2.json']
-print(all_raw_company_data)
 # all_raw_company_data = [el for el in all_files[0]
 #                        if el.startswith("raw_data/") and el not in exclude]
 
@@ -19,28 +23,45 @@ ACCESS_KEY_ID = os.environ.get("ACCESS_KEY_ID")
 SECRET_ACCESS_KEY = os.environ.get("SECRET_ACCESS_KEY")
 
 
-def run_scorecard_for_company_and_save_data(path: str):
+def run_scorecard_for_company_and_save_data(
+    path: str,
+    sample_size: int = DEFAULT_SAMPLE_SIZE,
+    sample_mode: str = DEFAULT_SAMPLE_MODE,
+):
+    """
+    computes the scorecard of one company from a sample of at most
+    sample_size raw lines, and returns the path it was saved to, or None when
+    the raw data did not produce any scorecard
+    """
     company_name = path.split("/")[1].split(".jsonl.gz")[0].lower()
-    # if path_to_save in list(all_raw_company_data)[0]:
-    #    pass
-    # else:
+    path_to_save = None
     print(path)
     print(company_name)
 
-    # load the data from s3
-    raw_dat = read_jsonl_file(
+    # stream the data from s3, lines are decompressed as they are consumed
+    # and the download stops once the sample is read (head mode)
+    raw_dat = sample_jsonl_file(
         service_endpoint=SERVICE_ENDPOINT,
         access_key_id=ACCESS_KEY_ID,
         secret_access_key=SECRET_ACCESS_KEY,
         bucket_name="dei-bucket",
         object_path=path,
+        n=sample_size,
+        mode=sample_mode,
+        # the same sample on every run
+        seed=path,
         return_lines=True
     )
-    N = 100_000
     sc = diversity.scorecard.Scorecard()
-    sc.generate_counts((line for line in raw_dat),
-                        comp_list=[company_name], limit=N)
-    sc.create_scorecards()
+    counted = METRICS.counted(raw_dat, "scorecard_input")
+    try:
+        with METRICS.stage("scorecard_counts"):
+            sc.generate_counts(counted, comp_list=[company_name], limit=sample_size)
+    finally:
+        counted.close()
+        raw_dat.close()
+    with METRICS.stage("scorecard_create"):
+        sc.create_scorecards()
     res = sc.get_companies()
     print(res)
     if len(list(res.keys())) > 0:
@@ -54,30 +75,59 @@ def run_scorecard_for_company_and_save_data(path: str):
                     del comp_dict[year][key]
 
         # save the data to s3
+        path_to_save = f"company_scores/{company_name}.jsonl.gz"
         save_dict_to_s3_as_jsonl_file(
             data_dict=comp_dict,
             service_endpoint=SERVICE_ENDPOINT,
             access_key_id=ACCESS_KEY_ID,
             secret_access_key=SECRET_ACCESS_KEY,
             bucket_name="dei-bucket",
-            object_path=f"company_scores/{company_name}.jsonl.gz"
+            object_path=path_to_save
         )
     else:
         pass
     print("")
-    return
+    return path_to_save
+
 
+def run_all_scores(**kwargs) -> dict:
+    """
+    scores every new or changed company (see services.scorecard_batch)
+    """
+    return scorecard_batch.run_all_scores(run_scorecard_for_company_and_save_data, **kwargs)
 
-def run_all_scores():
-    for i, company_path in enumerate(all_raw_company_data):
-        print(i)
-        start = time.time()
-        run_scorecard_for_company_and_save_data(path=company_path)
-        end = time.time()
-        print(f"Completed in {end-start} seconds \n")
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="compute the scorecards of every company")
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS,
+                        help="number of worker processes")
+    parser.add_argument("--timeout", type=float, default=None,
+                        help="max number of seconds to score one company")
+    parser.add_argument("--retries", type=int, default=1,
+                        help="number of retries for a company that failed")
+    parser.add_argument("--report", default="scorecards_report.json",
+                        help="local path of the JSON summary report")
+    parser.add_argument("--force", action="store_true",
+                        help="rescore every company, even the unchanged ones")
+    parser.add_argument("--sample-size", type=int, default=DEFAULT_SAMPLE_SIZE,
+                        help="max number of raw lines used per company")
+    parser.add_argument("--sample-mode", choices=SAMPLE_MODES, default=DEFAULT_SAMPLE_MODE,
+                        help="head: the first lines (stops the download early), "
+                             "reservoir: a random sample of the whole file")
+    return parser.parse_args(argv)
 
 
 if __name__ == "__main__":
-    run_all_scores()
+    logging.basicConfig(level=logging.INFO)
+    args = parse_args()
+    run_all_scores(
+        workers=args.workers,
+        timeout=args.timeout,
+        retries=args.retries,
+        report_path=args.report,
+        force=args.force,
+        sample_size=args.sample_size,
+        sample_mode=args.sample_mode,
+    )
     # run_scorecard_for_company_and_save_data(
     #    path="raw_data/Activision_Blizzard.jsonl.gz")
@@ -0,0 +1,194 @@
+import json
+import logging
+import os
+import signal
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+from core.metrics import METRICS, Metrics, log_event
+from core.s3_utilities import iter_objects
+from services.scorecards_manifest import (
+    manifest_entry,
+    objects_to_score,
+    save_scorecards_manifest,
+    updating_manifest,
+)
+
+logger = logging.getLogger(__name__)
+
+# scoring is CPU bound but every company also waits on S3, running more
+# workers than cores lets downloads/uploads overlap with scoring
+DEFAULT_WORKERS = int(os.getenv("SCORECARD_WORKERS", str(2 * (os.cpu_count() or 1))))
+# number of raw lines a scorecard is computed from, and how they are picked
+# (see core.s3_utilities.sample_jsonl_file)
+DEFAULT_SAMPLE_SIZE = int(os.getenv("SCORECARD_SAMPLE_SIZE", "100000"))
+DEFAULT_SAMPLE_MODE = os.getenv("SCORECARD_SAMPLE_MODE", "head")
+# the manifest is saved every this many scored companies, so that a batch
+# that is interrupted does not score them again on the next run
+MANIFEST_SAVE_EVERY = int(os.getenv("SCORECARD_MANIFEST_SAVE_EVERY", "50"))
+
+
+def _raise_timeout(signum, frame):
+    raise TimeoutError("scorecard timed out")
+
+
+def score_company_in_worker(score, path: str, timeout: float = None, sample: tuple = ()) -> tuple:
+    """
+    runs score(path, *sample) for one company inside a pool worker and
+    returns its duration, output path and the metrics it recorded; the
+    timeout is enforced with SIGALRM where it is available
+    """
+    # workers are reused, only this company's metrics are sent back
+    METRICS.reset()
+    use_alarm = bool(timeout) and hasattr(signal, "SIGALRM")
+    if use_alarm:
+        previous_handler = signal.signal(signal.SIGALRM, _raise_timeout)
+        signal.setitimer(signal.ITIMER_REAL, timeout)
+    start = time.time()
+    try:
+        output = score(path, *sample)
+    finally:
+        if use_alarm:
+            signal.setitimer(signal.ITIMER_REAL, 0)
+            signal.signal(signal.SIGALRM, previous_handler)
+    return time.time() - start, output, METRICS.snapshot()
+
+
+def score_company_isolated(score, path: str, timeout: float = None, sample: tuple = ()) -> tuple:
+    """
+    runs the scorecard of one company in a dedicated worker process
+    """
+    with ProcessPoolExecutor(max_workers=1) as pool:
+        return pool.submit(score_company_in_worker, score, path, timeout, sample).result()
+
+
+def run_all_scores(
+    score,
+    workers: int = DEFAULT_WORKERS,
+    timeout: float = None,
+    retries: int = 1,
+    report_path: str = None,
+    force: bool = False,
+    sample_size: int = DEFAULT_SAMPLE_SIZE,
+    sample_mode: str = DEFAULT_SAMPLE_MODE,
+    manifest_save_every: int = MANIFEST_SAVE_EVERY,
+):
+    """
+    scores every new or changed company of the raw data folder on a process
+    pool with score(path, sample_size, sample_mode), which returns the path
+    the scorecard was saved to; score must be a module-level function so that
+    it can be sent to the workers. Each company is scored from a sample of at
+    most sample_size raw lines. A company that
+    fails or times out is retried up to `retries` times without affecting the
+    others, and a summary of durations and failures is written to report_path
+    (if given) and returned.
+
+    Companies whose raw object has the same ETag and size as recorded in the
+    scorecards manifest, and were scored with the same sample settings, are
+    skipped, unless force is set. The manifest is saved every
+    manifest_save_every scored companies, and when the batch ends or fails.
+    """
+    raw_objects = {obj["key"]: obj for obj in iter_objects(prefix="raw_data/", suffix=".jsonl.gz")}
+    sample = (sample_size, sample_mode)
+    run_start = time.time()
+    results = {}
+    # the manifest is saved when the batch ends, or fails part way through
+    with updating_manifest(raw_objects) as manifest:
+        all_raw_company_data = objects_to_score(raw_objects.values(), manifest, sample, force)
+        nb_skipped = len(raw_objects) - len(all_raw_company_data)
+        logger.info(f"{len(all_raw_company_data)} companies to score with {workers} workers, "
+                    f"{nb_skipped} unchanged companies skipped")
+
+        attempts = {path: 0 for path in all_raw_company_data}
+        nb_scored = 0
+
+        def record(path, outcome=None, error=None) -> bool:
+            # returns whether the company should be tried again
+            nonlocal nb_scored
+            if error is None:
+                duration, output, snapshot = outcome
+                METRICS.merge(snapshot)
+                company_metrics = Metrics()
+                company_metrics.merge(snapshot)
+                log_event(logger, "scorecard_completed", path=path, duration=duration,
+                          attempts=attempts[path], output=output, metrics=company_metrics.summary())
+                results[path] = {"status": "ok", "duration": duration, "attempts": attempts[path]}
+                manifest[path] = manifest_entry(raw_objects[path], sample, output)
+                nb_scored += 1
+                if manifest_save_every and nb_scored % manifest_save_every == 0:
+                    try:
+                        save_scorecards_manifest(manifest)
+                    except Exception:
+                        logger.exception("failed to save the scorecards manifest, it is saved again later")
+                return False
+            log_event(logger, "scorecard_failed", level=logging.ERROR, path=path,
+                      attempts=attempts[path], error=repr(error))
+            results[path] = {"status": "failed", "error": repr(error), "attempts": attempts[path]}
+            return attempts[path] <= retries
+
+        queue = deque(all_raw_company_data)
+        while queue:
+            suspects = []
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                running = {}
+                while queue or running:
+                    while queue and len(running) < workers:
+                        path = queue.popleft()
+                        attempts[path] += 1
+                        running[pool.submit(score_company_in_worker, score, path, timeout, sample)] = path
+                    done, _ = wait(running, return_when=FIRST_COMPLETED)
+                    broken = False
+                    for future in done:
+                        path = running.pop(future)
+                        try:
+                            outcome = future.result()
+                        except BrokenProcessPool:
+                            suspects.append(path)
+                            broken = True
+                        except Exception as e:
+                            if record(path, error=e):
+                                queue.append(path)
+                        else:
+                            record(path, outcome=outcome)
+                    if broken:
+                        suspects.extend(running.values())
+                        break
+
+            # a crashed worker breaks the whole pool: the companies that were
+            # running at that time are re-run one by one in their own process, so
+            # that the company that crashed cannot take the others down with it
+            for path in suspects:
+                attempts[path] -= 1
+                retry = True
+                while retry:
+                    attempts[path] += 1
+                    try:
+                        outcome = score_company_isolated(score, path, timeout, sample)
+                    except Exception as e:
+                        retry = record(path, error=e)
+                    else:
+                        retry = record(path, outcome=outcome)
+
+    failed = sorted(path for path, res in results.items() if res["status"] != "ok")
+    report = {
+        "started_at": run_start,
+        "duration": time.time() - run_start,
+        "workers": workers,
+        "sample_size": sample_size,
+        "sample_mode": sample_mode,
+        "nb_companies": len(results),
+        "nb_skipped": nb_skipped,
+        "nb_failed": len(failed),
+        "failed": failed,
+        "companies": results,
+        # stage latencies, bytes and records of the whole batch
+        "metrics": METRICS.summary(),
+    }
+    log_event(logger, "scorecards_batch_completed", duration=report["duration"],
+              nb_companies=len(results), nb_skipped=nb_skipped, nb_failed=len(failed),
+              metrics=report["metrics"])
+    if report_path:
+        with open(report_path, "w") as f:
+            json.dump(report, f, indent=2)
+    return report
@@ -0,0 +1,100 @@
+import os
+import time
+from contextlib import contextmanager
+from core.s3_utilities import read_json_object, save_json_object
+
+SERVICE_ENDPOINT = os.getenv(
+    "SERVICE_ENDPOINT", "https://s3.us-west-1.wasabisys.com")
+ACCESS_KEY_ID = os.environ.get("ACCESS_KEY_ID")
+SECRET_ACCESS_KEY = os.environ.get("SECRET_ACCESS_KEY")
+
+MANIFEST_PATH = "company_scores/manifest.json"
+
+
+def load_scorecards_manifest() -> dict:
+    """
+    returns the manifest mapping each raw object to the ETag and size it had
+    when it was last scored, the sample it was scored from and the scorecard
+    file it produced
+    """
+    return read_json_object(
+        service_endpoint=SERVICE_ENDPOINT,
+        access_key_id=ACCESS_KEY_ID,
+        secret_access_key=SECRET_ACCESS_KEY,
+        bucket_name="dei-bucket",
+        object_path=MANIFEST_PATH,
+        default={},
+    )
+
+
+def save_scorecards_manifest(manifest: dict):
+    save_json_object(
+        manifest,
+        service_endpoint=SERVICE_ENDPOINT,
+        access_key_id=ACCESS_KEY_ID,
+        secret_access_key=SECRET_ACCESS_KEY,
+        bucket_name="dei-bucket",
+        object_path=MANIFEST_PATH,
+    )
+
+
+def is_unchanged(manifest_entry: dict, raw_object: dict, sample: tuple = None) -> bool:
+    """
+    whether the raw object was already scored in its current version, from
+    the same (sample_size, sample_mode) sample if given
+    """
+    if not manifest_entry:
+        return False
+    if sample is not None and (manifest_entry.get("sample_size"),
+                               manifest_entry.get("sample_mode")) != tuple(sample):
+        return False
+    return (manifest_entry.get("etag") == raw_object["etag"]
+            and manifest_entry.get("size") == raw_object["size"])
+
+
+def objects_to_score(raw_objects: list, manifest: dict, sample: tuple, force: bool = False) -> list:
+    """
+    returns the keys of the raw objects that are new or changed since they
+    were scored (all of them if force is set), largest first so that the
+    largest files do not end up running alone at the end of a batch
+    """
+    return [
+        obj["key"] for obj in sorted(raw_objects, key=lambda obj: obj["size"], reverse=True)
+        if force or not is_unchanged(manifest.get(obj["key"]), obj, sample)
+    ]
+
+
+def manifest_entry(raw_object: dict, sample: tuple, output: str) -> dict:
+    sample_size, sample_mode = sample
+    return {
+        "etag": raw_object["etag"],
+        "size": raw_object["size"],
+        "sample_size": sample_size,
+        "sample_mode": sample_mode,
+        "output": output,
+        "scored_at": time.time(),
+    }
+
+
+def prune_manifest(manifest: dict, raw_keys) -> dict:
+    """
+    forgets the companies whose raw data was removed
+    """
+    for path in list(manifest):
+        if path not in raw_keys:
+            del manifest[path]
+    return manifest
+
+
+@contextmanager
+def updating_manifest(raw_keys):
+    """
+    yields the scorecards manifest to be updated by a batch, and saves it
+    when the batch ends, including when it fails part way through, so that
+    the companies scored so far are not scored again
+    """
+    manifest = load_scorecards_manifest()
+    try:
+        yield manifest
+    finally:
+        save_scorecards_manifest(prune_manifest(manifest, raw_keys))
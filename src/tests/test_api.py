@@ -0,0 +1,35 @@
+import pytest
+from fastapi.testclient import TestClient
+from app import main
+from app.main import app
+
+client = TestClient(app)
+
+
+@pytest.mark.parametrize("path", ["/api/v1/all_company_data", "/api/v1/all_companies"])
+def test_invalid_order_is_rejected(path):
+    response = client.get(path, params={"order": "bogus"})
+
+    assert response.status_code == 422
+
+
+@pytest.mark.parametrize("path, params", [
+    ("/api/v1/rankings/top", {"group_by": "country", "group": "Banking", "score": "Retention Score"}),
+    ("/api/v1/rankings/company", {"group_by": "country", "company_id": "1"}),
+])
+def test_invalid_group_by_is_rejected(path, params):
+    response = client.get(path, params=params)
+
+    assert response.status_code == 422
+
+
+def test_company_lookups_do_not_evict_the_aggregates(monkeypatch):
+    monkeypatch.setattr(main, "cache", main.TTLCache(max_entries=2))
+    monkeypatch.setattr(main, "company_cache", main.TTLCache(max_entries=2))
+    monkeypatch.setattr(main, "get_one_company_data", lambda company_id: {"company_id": company_id})
+    main.cache.get("all_companies", lambda: {"1": {}})
+
+    for company_id in map(str, range(10)):
+        assert main.get_cached_company(company_id) == {"company_id": company_id}
+    assert "all_companies" in main.cache
+    assert "9" in main.company_cache and "0" not in main.company_cache
@@ -0,0 +1,55 @@
+import asyncio
+import threading
+import pytest
+from app.async_io import AsyncLoader
+
+
+@pytest.mark.asyncio
+async def test_concurrent_callers_share_one_load():
+    loader = AsyncLoader(max_concurrency=4)
+    release = threading.Event()
+    calls = []
+
+    def load(value):
+        calls.append(value)
+        release.wait(5)
+        return {"value": value}
+
+    tasks = [asyncio.create_task(loader.run("key", load, 1)) for _ in range(5)]
+    other = asyncio.create_task(loader.run("other", load, 2))
+    await asyncio.sleep(0.05)
+    assert loader.stats()["in_flight"] == 2
+    release.set()
+
+    results = await asyncio.gather(*tasks)
+    assert all(result is results[0] for result in results)
+    assert results[0] == {"value": 1}
+    assert await other == {"value": 2}
+    assert sorted(calls) == [1, 2]
+
+    stats = loader.stats()
+    assert stats["loads"] == 2
+    assert stats["coalesced"] == 4
+    assert stats["in_flight"] == 0
+
+
+@pytest.mark.asyncio
+async def test_failure_reaches_every_waiter():
+    loader = AsyncLoader(max_concurrency=4)
+    release = threading.Event()
+
+    def load():
+        release.wait(5)
+        raise KeyError("missing")
+
+    tasks = [asyncio.create_task(loader.run("key", load)) for _ in range(3)]
+    await asyncio.sleep(0.05)
+    release.set()
+
+    results = await asyncio.gather(*tasks, return_exceptions=True)
+    assert all(isinstance(result, KeyError) for result in results)
+    assert loader.stats()["loads"] == 1
+
+    # the failed load is not kept: the next call loads again
+    assert await loader.run("key", lambda: "ok") == "ok"
+    assert loader.stats()["loads"] == 2
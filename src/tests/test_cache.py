@@ -0,0 +1,48 @@
+import time
+from app.cache import MISSING, TTLCache
+
+
+def test_cache_hit_miss_and_refresh():
+    calls = []
+
+    def loader():
+        calls.append(1)
+        return len(calls)
+
+    cache = TTLCache(default_ttl=0.05, max_entries=2)
+    assert cache.get("a", loader) == 1
+    assert cache.get("a", loader) == 1
+
+    # a stale entry is served as-is and reloaded in the background
+    time.sleep(0.06)
+    assert cache.get("a", loader) == 1
+    for _ in range(50):
+        if cache.stats()["refreshes"]:
+            break
+        time.sleep(0.01)
+    assert cache.get("a", loader) == 2
+
+    stats = cache.stats()
+    assert stats["misses"] == 1
+    assert stats["hits"] == 2
+    assert stats["stale_hits"] == 1
+    assert stats["refreshes"] == 1
+
+
+def test_cache_evicts_least_recently_used():
+    cache = TTLCache(default_ttl=60, max_entries=2)
+    cache.get("a", lambda: "a")
+    cache.get("b", lambda: "b")
+    cache.get("a", lambda: "a")
+    cache.get("c", lambda: "c")
+    assert cache.get("b", lambda: "b2") == "b2"
+    assert cache.stats()["evictions"] == 2
+
+
+def test_cache_peek_never_loads():
+    cache = TTLCache(default_ttl=60)
+
+    assert cache.peek("a", lambda: 1 / 0) is MISSING
+    cache.get("a", lambda: "a")
+    assert cache.peek("a", lambda: 1 / 0) == "a"
+    assert cache.stats()["misses"] == 1
@@ -0,0 +1,56 @@
+import json
+import pandas as pd
+import pytest
+from core.company_records import SchemaDriftError, decode_company_records, records_to_dataframe
+from core.industry_insights import SCORE_COLUMNS
+
+
+def metadata_line(company_id: str, scores: dict, **fields) -> bytes:
+    metadata = {"company_name": f"company {company_id}", "industry": "banks", "sector": "finance",
+                "company_size": "1-10", "company_website": None, "company_id": company_id,
+                "scores": {"score": scores}}
+    metadata.update(fields)
+    return json.dumps({company_id: metadata}).encode("utf-8")
+
+
+def test_records_to_dataframe():
+    lines = [
+        metadata_line("1", {"Talent Pipeline": 10, "Retention": 20.5, "Access & Advancement": 30,
+                            "Representation": 40, "Historical": 50}),
+        metadata_line("2", {"Retention": 70}),
+        b"",
+    ]
+
+    df = records_to_dataframe(decode_company_records(lines))
+
+    assert list(df.columns[:6]) == ["company_name", "industry", "sector", "company_size",
+                                    "company_website", "company_id"]
+    assert list(df.columns[6:]) == SCORE_COLUMNS
+    assert df["company_id"].tolist() == ["1", "2"]
+    assert df["Retention Score"].tolist() == [20.5, 70.0]
+    assert df["Talent Pipeline Score"].dtype == float
+    assert pd.isna(df.loc[1, "Historical Score"])
+
+
+def test_duplicated_companies_keep_their_last_metadata():
+    lines = [
+        metadata_line("1", {"Retention": 10}),
+        metadata_line("2", {"Retention": 20}),
+        metadata_line("1", {"Retention": 30}),
+    ]
+
+    df = records_to_dataframe(decode_company_records(lines))
+
+    assert df["company_id"].tolist() == ["1", "2"]
+    assert df["Retention Score"].tolist() == [30.0, 20.0]
+
+
+@pytest.mark.parametrize("line", [
+    metadata_line("1", {"Retention Score": 20}),
+    metadata_line("1", {"Retention": "20"}),
+    metadata_line("1", {}, industry=["banks"]),
+    json.dumps({"1": [1, 2]}).encode("utf-8"),
+])
+def test_schema_drift_fails_at_decode_time(line):
+    with pytest.raises(SchemaDriftError):
+        decode_company_records([line])
@@ -0,0 +1,68 @@
+import io
+import os
+from botocore.exceptions import ClientError
+from core import company_store
+from core.company_store import PackedCompanyStore, pack_companies, unpack_company
+
+
+def test_pack_companies_round_trip():
+    companies = {
+        str(i): {"company_id": str(i), "2021": {"women": i}, "score": {"Retention": i / 2}}
+        for i in range(50)
+    }
+    blob, index = pack_companies(companies)
+
+    assert list(index) == list(companies)
+    for company_id, (offset, length) in index.items():
+        assert unpack_company(blob[offset:offset + length]) == companies[company_id]
+
+
+class FakeStoreS3:
+    """
+    serves a packed blob, refusing the reads of an older version (IfMatch)
+    """
+
+    def __init__(self):
+        self.index = None
+        self.blob = b""
+        self.index_reads = 0
+
+    def publish(self, companies: dict, etag: str):
+        self.blob, offsets = pack_companies(companies)
+        self.index = {"blob_path": company_store.PACKED_BLOB_PATH, "blob_etag": etag,
+                      "blob_size": len(self.blob), "offsets": offsets}
+
+    def read_index(self, **kwargs):
+        self.index_reads += 1
+        if self.index is None:
+            raise ClientError({"Error": {"Code": "NoSuchKey"}}, "GetObject")
+        return self.index
+
+    def get_object(self, Bucket, Key, IfMatch=None):
+        if IfMatch != self.index["blob_etag"]:
+            raise ClientError({"Error": {"Code": "PreconditionFailed"}}, "GetObject")
+        return {"Body": io.BytesIO(self.blob)}
+
+
+def test_packed_company_store_caches_absence_and_prunes_old_blobs(tmp_path, monkeypatch):
+    s3 = FakeStoreS3()
+    monkeypatch.setattr(company_store, "read_object_revalidated", s3.read_index)
+    monkeypatch.setattr(company_store, "get_s3_client", lambda **kwargs: s3)
+    store = PackedCompanyStore(None, None, None, local_dir=str(tmp_path), index_ttl=60)
+
+    # nothing published: a single failed read per index_ttl
+    assert store.get("1") is None and store.get("2") is None
+    assert s3.index_reads == 1
+
+    s3.publish({"1": {"n": 1}}, '"v1"')
+    store._index = None
+    assert store.get("1") == {"n": 1}
+    s3.publish({"1": {"n": 2}}, '"v2"')
+    store._index = None
+    assert store.get("1") == {"n": 2}
+    assert len([name for name in os.listdir(tmp_path) if name.endswith(".bin")]) == 1
+
+    # a store holding the old index downloads the new blob once revalidated
+    other = PackedCompanyStore(None, None, None, local_dir=str(tmp_path), index_ttl=60)
+    other._index, other._index_checked_at = {**s3.index, "blob_etag": '"v1"'}, float("inf")
+    assert other.get("1") == {"n": 2}
@@ -0,0 +1,114 @@
+import io
+import os
+from types import SimpleNamespace
+from botocore.exceptions import ClientError
+from core import s3_utilities
+from core.disk_cache import DiskCache
+from core.metrics import METRICS
+
+
+class FakeS3:
+    """
+    in-memory bucket answering get_object like S3, including 304s
+    """
+
+    def __init__(self):
+        self.meta = SimpleNamespace(endpoint_url="https://s3.test")
+        self.objects = {}
+        self.downloads = 0
+
+    def put(self, key: str, content: bytes):
+        self.objects[key] = (content, f'"{hash(content)}"')
+
+    def get_object(self, Bucket, Key, IfNoneMatch=None):
+        content, etag = self.objects[Key]
+        if IfNoneMatch == etag:
+            raise ClientError({"Error": {"Code": "304"}, "ResponseMetadata": {"HTTPStatusCode": 304}},
+                              "GetObject")
+        self.downloads += 1
+        return {"Body": io.BytesIO(content), "ETag": etag}
+
+
+def test_disk_cache_is_shared_and_revalidated(tmp_path):
+    s3 = FakeS3()
+    s3.put("a.jsonl.gz", b"first")
+
+    assert DiskCache(str(tmp_path)).read(s3, "bucket", "a.jsonl.gz")[0] == b"first"
+    # another process using the same directory does not download it again
+    assert DiskCache(str(tmp_path)).read(s3, "bucket", "a.jsonl.gz")[0] == b"first"
+    assert s3.downloads == 1
+
+    s3.put("a.jsonl.gz", b"second")
+    assert DiskCache(str(tmp_path)).read(s3, "bucket", "a.jsonl.gz")[0] == b"second"
+    assert s3.downloads == 2
+
+
+def test_disk_cache_evicts_least_recently_used(tmp_path):
+    s3 = FakeS3()
+    cache = DiskCache(str(tmp_path), max_bytes=25)
+    for i, key in enumerate("abc"):
+        s3.put(key, bytes([i]) * 10)
+    path_a, _ = cache.fetch(s3, "bucket", "a")
+    path_b, _ = cache.fetch(s3, "bucket", "b")
+    os.utime(path_a, (1, 1))
+    os.utime(path_b, (2, 2))
+
+    path_c, _ = cache.fetch(s3, "bucket", "c")
+
+    assert not os.path.exists(path_a)
+    assert os.path.exists(path_b) and os.path.exists(path_c)
+    # an evicted object is downloaded again
+    assert cache.read(s3, "bucket", "a")[0] == bytes([0]) * 10
+    assert s3.downloads == 4
+
+
+def test_disk_cache_streams_uncached_objects_without_caching_them(tmp_path):
+    s3 = FakeS3()
+    cache = DiskCache(str(tmp_path))
+    s3.put("a", b"content")
+
+    body, cached = cache.open_stream(s3, "bucket", "a")
+    assert not cached and body.read(3) == b"con"
+    assert os.listdir(tmp_path / "blobs") == []
+
+    cache.fetch(s3, "bucket", "a")
+    body, cached = cache.open_stream(s3, "bucket", "a")
+    with body:
+        assert cached and body.read() == b"content"
+    assert s3.downloads == 2
+
+
+def test_disk_cache_downloads_again_an_object_evicted_before_it_is_opened(tmp_path):
+    s3 = FakeS3()
+    s3.put("a", b"content")
+    cache = DiskCache(str(tmp_path))
+    fetch = cache.fetch
+
+    def fetch_then_evict(*args):
+        path, etag = fetch(*args)
+        if s3.downloads == 1:
+            # another process evicts it right after the fetch
+            os.remove(path)
+        return path, etag
+
+    cache.fetch = fetch_then_evict
+    assert cache.read(s3, "bucket", "a")[0] == b"content"
+    assert s3.downloads == 2
+
+
+def test_disk_cache_hits_are_timed_apart_from_downloads(tmp_path, monkeypatch):
+    s3 = FakeS3()
+    s3.put("a", b"content")
+    monkeypatch.setattr(s3_utilities, "disk_cache", DiskCache(str(tmp_path)))
+    METRICS.reset()
+
+    for _ in range(3):
+        assert s3_utilities._read_object(s3, "bucket", "a") == b"content"
+
+    summary = METRICS.summary()
+    # three conditional GETs, one download into the cache, three local reads
+    assert summary['dei_stage_seconds{stage="s3_get"}']["count"] == 3
+    assert summary['dei_stage_seconds{stage="disk_cache_fill"}']["count"] == 1
+    assert summary['dei_stage_seconds{stage="disk_cache_read"}']["count"] == 3
+    assert summary['dei_s3_bytes_total{direction="get"}'] == len(b"content")
+    METRICS.reset()
@@ -0,0 +1,53 @@
+import math
+import pandas as pd
+from core.industry_insights import (
+    IndustryInsights,
+    SCORE_COLUMNS,
+    grouped_statistics,
+    statistics_to_records,
+)
+
+
+def make_insights():
+    return IndustryInsights(service_endpoint=None, access_key_id=None, secret_access_key=None)
+
+
+def test_industry_and_sector_comparisons():
+    df = pd.DataFrame({
+        "company_id": ["a", "b", "c", "d"],
+        "industry": ["banks", "banks", "banks", "retail"],
+        "sector": ["finance", "finance", "finance", "finance"],
+    })
+    for score in SCORE_COLUMNS:
+        df[score] = [50.0, 80.0, 50.0, None]
+
+    df = make_insights().industry_and_sector_comparisons(df)
+
+    score = "Retention Score"
+    assert df[f"{score} Rank by Industry"].tolist()[:3] == [2.0, 1.0, 2.0]
+    assert df[f"{score} Top % by Industry"].tolist()[:3] == [2 / 3 * 100, 1 / 3 * 100, 2 / 3 * 100]
+    assert df[f"{score} Top % by Sector"].tolist()[:3] == [50.0, 25.0, 50.0]
+    # a missing score has no rank, but still counts in the group size
+    assert math.isnan(df[f"{score} Rank by Industry"].iloc[3])
+
+
+def test_grouped_statistics_is_tidy():
+    df = pd.DataFrame({
+        "industry": ["banks", "banks", "retail"],
+        "company_size": ["1-10", "1-10", "11-50"],
+    })
+    for score in SCORE_COLUMNS:
+        df[score] = [10.0, 30.0, 50.0]
+
+    stats = grouped_statistics(df, by=["industry", "company_size"], percentiles=(0.5,))
+
+    assert list(stats.columns) == [
+        "industry", "company_size", "score",
+        "mean", "median", "count", "std", "min", "max", "p50",
+    ]
+    assert len(stats) == 2 * len(SCORE_COLUMNS)
+    banks = stats[(stats["industry"] == "banks") & (stats["score"] == "Retention Score")].iloc[0]
+    assert (banks["mean"], banks["count"], banks["min"], banks["max"]) == (20.0, 2, 10.0, 30.0)
+    # std of a single company is NaN, which must not leak in the records
+    retail = [r for r in statistics_to_records(stats) if r["industry"] == "retail"]
+    assert all(r["std"] is None for r in retail)
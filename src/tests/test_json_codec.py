@@ -0,0 +1,50 @@
+import math
+import numpy as np
+import pytest
+from core.json_codec import available_codecs
+
+CODECS = available_codecs()
+
+
+@pytest.mark.parametrize("name", list(CODECS))
+def test_codecs_round_trip_bytes(name):
+    codec = CODECS[name]
+    record = {"7": {"2021": {"women_share": 0.25}, "score": {"Retention Score": 80.0}},
+              "name": "Société Générale", "tags": [1, None, True]}
+
+    encoded = codec.dumps(record)
+
+    assert isinstance(encoded, bytes)
+    assert codec.loads(encoded) == record
+    assert codec.loads(encoded.decode("utf-8")) == record
+    assert codec.loads(b"\n".join([encoded, encoded]).split(b"\n")[1]) == record
+
+
+@pytest.mark.parametrize("name", list(CODECS))
+def test_codecs_encode_pandas_output(name):
+    codec = CODECS[name]
+    # DataFrame.to_dict produces numpy floats, and non-string keys for integer indexes
+    assert codec.loads(codec.dumps({1: np.float64(0.5)})) == {"1": 0.5}
+
+
+@pytest.mark.parametrize("name", list(CODECS))
+def test_codecs_decode_legacy_non_finite_floats(name):
+    codec = CODECS[name]
+    # json.dumps writes NaN and Infinity, files saved before the codec have them
+    line = b'{"1": {"Retention Score": NaN, "max": Infinity, "min": -Infinity, "n": 3}}'
+
+    decoded = codec.loads(line)["1"]
+
+    assert math.isnan(decoded["Retention Score"])
+    assert decoded["max"] == math.inf and decoded["min"] == -math.inf and decoded["n"] == 3
+    with pytest.raises(ValueError):
+        codec.loads(b'{"1": ')
+
+
+@pytest.mark.parametrize("name", list(CODECS))
+def test_codecs_encode_non_finite_floats_as_null(name):
+    codec = CODECS[name]
+
+    encoded = codec.dumps({"a": float("nan"), "b": [math.inf, 1.5], "c": np.float64("nan")})
+
+    assert codec.loads(encoded) == {"a": None, "b": [None, 1.5], "c": None}
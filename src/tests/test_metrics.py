@@ -0,0 +1,31 @@
+from core.metrics import Metrics
+
+
+def test_histograms_merge_and_render():
+    worker = Metrics(buckets=(0.1, 1))
+    worker.observe("dei_stage_seconds", 0.05, stage="gunzip")
+    worker.observe("dei_stage_seconds", 0.5, stage="gunzip")
+    worker.observe("dei_stage_seconds", 5, stage="gunzip")
+    worker.add_bytes("get", 100)
+
+    metrics = Metrics(buckets=(0.1, 1))
+    metrics.add_bytes("get", 20)
+    metrics.merge(worker.snapshot())
+
+    text = metrics.render_prometheus({"dei_cache_hits": 3})
+    assert 'dei_stage_seconds_bucket{stage="gunzip",le="0.1"} 1' in text
+    assert 'dei_stage_seconds_bucket{stage="gunzip",le="1"} 2' in text
+    assert 'dei_stage_seconds_bucket{stage="gunzip",le="+Inf"} 3' in text
+    assert 'dei_stage_seconds_count{stage="gunzip"} 3' in text
+    assert 'dei_s3_bytes_total{direction="get"} 120' in text
+    assert "dei_cache_hits 3" in text
+    assert metrics.summary()['dei_stage_seconds{stage="gunzip"}']["count"] == 3
+
+
+def test_counted_counts_consumed_items():
+    metrics = Metrics()
+    items = metrics.counted(iter(range(10)), "scorecard_input")
+    for i, _ in zip(range(4), items):
+        pass
+    items.close()
+    assert metrics.summary()['dei_records_total{stage="scorecard_input"}'] == 4
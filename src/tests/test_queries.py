@@ -0,0 +1,60 @@
+import pytest
+from app.queries import CompanyIndex, InvalidCursor, InvalidSort, encode_cursor, paginate, project
+
+
+def make_companies():
+    return {
+        str(i): {
+            "company_id": str(i),
+            "industry": "banks" if i % 2 else "retail",
+            "sector": "finance" if i < 6 else "consumer",
+            "company_size": "1-10",
+            "scores": {"score": {"Retention": None if i == 3 else i * 10}},
+        }
+        for i in range(10)
+    }
+
+
+def test_company_index_filters_and_sorts():
+    index = CompanyIndex(make_companies())
+
+    assert index.query({"industry": "banks", "sector": "finance"}) == ["1", "3", "5"]
+    assert index.query({"industry": "banks"}, sort_by="Retention") == ["9", "7", "5", "1", "3"]
+    assert index.query({"industry": "banks"}, sort_by="Retention", ascending=True) == ["1", "5", "7", "9", "3"]
+    assert index.query({"industry": "unknown"}) == []
+
+
+def test_company_index_rejects_non_numeric_scores():
+    companies = make_companies()
+    companies["4"]["scores"]["score"]["Retention"] = "high"
+    index = CompanyIndex(companies)
+
+    with pytest.raises(InvalidSort):
+        index.query(sort_by="Retention")
+
+
+def test_paginate_with_cursor():
+    index = CompanyIndex(make_companies())
+    company_ids = index.query(sort_by="Retention")
+
+    pages = []
+    cursor = None
+    while True:
+        page, cursor = paginate(company_ids, index.version, cursor=cursor, limit=4)
+        pages.append(page)
+        if cursor is None:
+            break
+    assert [company_id for page in pages for company_id in page] == company_ids
+    assert [len(page) for page in pages] == [4, 4, 2]
+
+    _, cursor = paginate(company_ids, index.version, limit=4)
+    with pytest.raises(InvalidCursor):
+        paginate(company_ids, "another version", cursor=cursor)
+    with pytest.raises(InvalidCursor):
+        paginate(company_ids, index.version, cursor=encode_cursor(-4, index.version))
+
+
+def test_project():
+    record = {"company_name": "a", "industry": "banks", "scores": {}}
+    assert project(record, ["industry", "missing"]) == {"industry": "banks"}
+    assert project(record) is record
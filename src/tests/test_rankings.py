@@ -0,0 +1,33 @@
+import pandas as pd
+from core.industry_insights import IndustryInsights, SCORE_COLUMNS
+from core.rankings import RankingIndex, build_rankings
+
+
+def test_rankings_agree_with_comparisons():
+    df = pd.DataFrame({
+        "company_id": ["a", "b", "c", "d", "e"],
+        "industry": ["banks", "banks", "banks", "banks", "retail"],
+        "sector": ["finance"] * 5,
+    })
+    for score in SCORE_COLUMNS:
+        df[score] = [50.0, 80.0, 50.0, None, 70.0]
+
+    index = RankingIndex(build_rankings(df, ["industry", "sector"], SCORE_COLUMNS))
+    compared = IndustryInsights(
+        service_endpoint=None, access_key_id=None, secret_access_key=None,
+    ).industry_and_sector_comparisons(df.copy())
+
+    score = "Retention Score"
+    for grouping, label in (("industry", "Industry"), ("sector", "Sector")):
+        for _, row in compared.iterrows():
+            rank = index.rank_of(grouping, row["company_id"], score)
+            if pd.isna(row[f"{score} Rank by {label}"]):
+                assert rank is None
+            else:
+                assert rank["rank"] == row[f"{score} Rank by {label}"]
+                assert rank["top_percent"] == row[f"{score} Top % by {label}"]
+
+    top = index.top("industry", "banks", score, n=3)
+    assert [(c["company_id"], c["rank"]) for c in top] == [("b", 1), ("a", 2), ("c", 2)]
+    assert index.rank_of("industry", "d", score) is None
+    assert index.rank_of("industry", "b", score)["size"] == 4
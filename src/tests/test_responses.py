@@ -0,0 +1,70 @@
+import gzip
+import pytest
+from starlette.requests import Request
+from app.responses import PreparedResponse, parse_accept_encoding
+
+
+def make_request(headers: dict) -> Request:
+    return Request({
+        "type": "http",
+        "method": "GET",
+        "path": "/",
+        "headers": [(name.lower().encode(), value.encode()) for name, value in headers.items()],
+    })
+
+
+def test_parse_accept_encoding_reads_q_values():
+    assert parse_accept_encoding("gzip, deflate;q=0.5, BR; q=0.8") == {
+        "gzip": 1.0, "deflate": 0.5, "br": 0.8}
+    assert parse_accept_encoding("gzip;q=0, identity;q=0") == {"gzip": 0.0, "identity": 0.0}
+    assert parse_accept_encoding("gzip;q=oops") == {"gzip": 0.0}
+    assert parse_accept_encoding("") == {}
+
+
+@pytest.mark.parametrize("header, expected", [
+    ("", None),
+    ("gzip", "gzip"),
+    ("gzip;q=0", None),
+    ("*", "gzip"),
+    ("*, gzip;q=0", None),
+    ("identity;q=0", "gzip"),
+    ("*;q=0", "gzip"),
+])
+def test_select_encoding(header, expected):
+    prepared = PreparedResponse({"a": 1})
+    prepared.encoded.pop("br", None)
+    assert prepared.select_encoding(header) == expected
+
+
+def test_select_encoding_prefers_br():
+    prepared = PreparedResponse({"a": 1})
+    prepared.encoded["br"] = b"br body"
+    assert prepared.select_encoding("gzip, br") == "br"
+    assert prepared.select_encoding("gzip, br;q=0") == "gzip"
+
+
+def test_each_encoding_has_its_own_etag():
+    prepared = PreparedResponse({"a": 1})
+    plain = prepared.to_response(make_request({}), max_age=60)
+    compressed = prepared.to_response(make_request({"Accept-Encoding": "gzip"}), max_age=60)
+
+    assert plain.body == prepared.body and "content-encoding" not in plain.headers
+    assert gzip.decompress(compressed.body) == prepared.body
+    assert compressed.headers["content-encoding"] == "gzip"
+    assert plain.headers["etag"] == prepared.etag
+    assert compressed.headers["etag"] == prepared.etag[:-1] + '-gzip"'
+    assert plain.headers["vary"] == compressed.headers["vary"] == "Accept-Encoding"
+
+
+@pytest.mark.parametrize("variant", ["", "-gzip", "-br"])
+def test_if_none_match_matches_any_variant(variant):
+    prepared = PreparedResponse({"a": 1})
+    etag = prepared.etag[:-1] + variant + '"'
+    request = make_request({"Accept-Encoding": "gzip", "If-None-Match": f'"other", W/{etag}'})
+
+    response = prepared.to_response(request, max_age=60)
+    assert response.status_code == 304
+    assert response.headers["etag"] == prepared.etag[:-1] + '-gzip"'
+
+    stale = make_request({"Accept-Encoding": "gzip", "If-None-Match": '"other-gzip"'})
+    assert prepared.to_response(stale, max_age=60).status_code == 200
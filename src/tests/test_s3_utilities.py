@@ -0,0 +1,228 @@
+import gzip
+import io
+import json
+import threading
+import time
+import pytest
+from botocore.exceptions import ClientError
+from core import s3_utilities
+from core.s3_utilities import _iter_gzip_lines, _iter_gzip_parts, fetch_jsonl_files, reservoir_sample
+
+
+def test_iter_gzip_lines_streams_multi_member_files():
+    lines = [json.dumps({"id": i, "text": "x" * (i % 300)}) for i in range(2000)]
+    raw = "\n".join(lines).encode("utf-8")
+    # two concatenated gzip members, split in the middle of a line
+    blob = gzip.compress(raw[:5000]) + gzip.compress(raw[5000:])
+
+    for chunk_size in (1, 7, 1000, len(blob)):
+        chunks = (blob[i:i + chunk_size] for i in range(0, len(blob), chunk_size))
+        assert list(_iter_gzip_lines(chunks, max_output=50)) == lines
+
+
+def test_iter_gzip_lines_raises_on_truncated_files():
+    raw = "\n".join(json.dumps({"id": i}) for i in range(2000)).encode("utf-8")
+    blob = gzip.compress(raw[:5000]) + gzip.compress(raw[5000:])
+
+    # cut in the second member, and right before the trailer of the last one
+    for truncated in (blob[:len(blob) // 2 + 100], blob[:-4]):
+        with pytest.raises(EOFError):
+            list(_iter_gzip_lines(iter([truncated]), max_output=50))
+    assert list(_iter_gzip_lines(iter([]))) == []
+
+
+def test_iter_gzip_parts_is_a_single_gzip_stream():
+    lines = [json.dumps({"id": i, "text": str(i) * (i % 50)}) for i in range(5000)]
+
+    parts = list(_iter_gzip_parts((line.encode("utf-8") for line in lines), part_size=1000))
+
+    assert len(parts) > 1
+    assert all(len(part) >= 1000 for part in parts[:-1])
+    # same content as the files written in one piece: no trailing newline
+    assert gzip.decompress(b"".join(parts)) == "\n".join(lines).encode("utf-8")
+
+
+def test_reservoir_sample_is_bounded_and_uniform():
+    assert reservoir_sample(range(5), 10) == [0, 1, 2, 3, 4]
+    sample = reservoir_sample(iter(range(100_000)), 1000, seed=1)
+    assert len(sample) == len(set(sample)) == 1000
+    assert reservoir_sample(range(100_000), 1000, seed=1) == sample
+    # roughly uniform: a tenth of the sample in each tenth of the input
+    for tenth in range(10):
+        nb = sum(1 for item in sample if tenth * 10_000 <= item < (tenth + 1) * 10_000)
+        assert 60 < nb < 140
+
+
+class SlowS3:
+    """
+    in-memory bucket whose GETs take some time, like a round trip
+    """
+
+    def __init__(self, objects: dict, latency: float = 0.05):
+        self.objects = objects
+        self.latency = latency
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self._lock = threading.Lock()
+
+    def get_object(self, Bucket, Key):
+        with self._lock:
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            time.sleep(self.latency)
+            if Key not in self.objects:
+                raise ClientError({"Error": {"Code": "NoSuchKey"}}, "GetObject")
+            return {"Body": io.BytesIO(self.objects[Key])}
+        finally:
+            with self._lock:
+                self.in_flight -= 1
+
+
+def test_fetch_jsonl_files_concurrently_with_errors_per_key(monkeypatch):
+    objects = {f"company_{i}.jsonl.gz": gzip.compress(json.dumps({str(i): {"n": i}}).encode())
+               for i in range(40)}
+    s3 = SlowS3(objects)
+    monkeypatch.setattr(s3_utilities, "get_s3_client", lambda **kwargs: s3)
+    keys = list(objects) + ["missing.jsonl.gz"]
+
+    start = time.perf_counter()
+    results = {key: (payload, error) for key, payload, error in fetch_jsonl_files(
+        iter(keys), service_endpoint=None, access_key_id=None, secret_access_key=None,
+        return_lines=True, transform=s3_utilities.merge_jsonl_lines, max_workers=8)}
+    duration = time.perf_counter() - start
+
+    assert set(results) == set(keys)
+    for i in range(40):
+        assert results[f"company_{i}.jsonl.gz"] == ({str(i): {"n": i}}, None)
+    payload, error = results["missing.jsonl.gz"]
+    assert payload is None and isinstance(error, ClientError)
+    assert s3.max_in_flight == 8
+    # 41 round trips of 50 ms, 8 at a time
+    assert duration < 41 * s3.latency / 2
+
+
+class RevalidatingS3:
+    """
+    in-memory bucket answering conditional GETs with 304s
+    """
+
+    def __init__(self):
+        self.objects = {}
+        self.requests = []
+
+    def put(self, key: str, content: bytes):
+        self.objects[key] = (content, f'"{key}-{len(content)}-{hash(content)}"')
+
+    def get_object(self, Bucket, Key, IfNoneMatch=None, IfModifiedSince=None):
+        self.requests.append((Key, IfNoneMatch))
+        content, etag = self.objects[Key]
+        if IfNoneMatch == etag:
+            raise ClientError({"Error": {"Code": "304"}, "ResponseMetadata": {"HTTPStatusCode": 304}},
+                              "GetObject")
+        return {"Body": io.BytesIO(content), "ETag": etag}
+
+
+def read_revalidated(key, decode):
+    return s3_utilities.read_object_revalidated("https://s3.test", "id", "secret", "bucket", key, decode)
+
+
+@pytest.fixture
+def revalidating_s3(monkeypatch):
+    s3 = RevalidatingS3()
+    monkeypatch.setattr(s3_utilities, "get_s3_client", lambda **kwargs: s3)
+    monkeypatch.setattr(s3_utilities, "disk_cache", None)
+    monkeypatch.setattr(s3_utilities, "_revalidation_store", {})
+    return s3
+
+
+def test_read_object_revalidated_reuses_the_payload_on_304(revalidating_s3):
+    s3 = revalidating_s3
+    s3.put("a.json", b'{"a": 1}')
+    decoded = []
+
+    def decode(content):
+        decoded.append(content)
+        return json.loads(content)
+
+    first = read_revalidated("a.json", decode)
+    assert first == {"a": 1}
+    assert s3.requests == [("a.json", None)]
+
+    # not modified: the same decoded object, nothing downloaded nor decoded
+    assert read_revalidated("a.json", decode) is first
+    assert s3.requests[-1] == ("a.json", s3.objects["a.json"][1])
+    assert len(decoded) == 1
+
+    s3.put("a.json", b'{"a": 2}')
+    assert read_revalidated("a.json", decode) == {"a": 2}
+    assert len(decoded) == 2
+
+    # another decoding of the same object is remembered separately
+    assert read_revalidated("a.json", len) == 8
+    assert s3.requests[-1] == ("a.json", None)
+
+
+def test_read_object_revalidated_forgets_the_least_recently_used(revalidating_s3, monkeypatch):
+    s3 = revalidating_s3
+    monkeypatch.setattr(s3_utilities, "REVALIDATION_MAX_OBJECTS", 2)
+    for key in ("a", "b", "c"):
+        s3.put(key, key.encode())
+
+    read_revalidated("a", bytes)
+    read_revalidated("b", bytes)
+    # a 304 for "a" makes "b" the least recently used
+    read_revalidated("a", bytes)
+    read_revalidated("c", bytes)
+
+    store = s3_utilities._revalidation_store
+    assert len(store) == 2
+    assert [key[2] for key in store] == ["a", "c"]
+
+    s3.requests.clear()
+    read_revalidated("b", bytes)
+    read_revalidated("c", bytes)
+    assert s3.requests == [("b", None), ("c", s3.objects["c"][1])]
+
+
+MOTO_CREDENTIALS = {
+    "service_endpoint": "https://s3.us-east-1.amazonaws.com",
+    "access_key_id": "testing",
+    "secret_access_key": "testing",
+}
+
+
+@pytest.fixture
+def moto_bucket(monkeypatch):
+    moto = pytest.importorskip("moto")
+    monkeypatch.setenv("AWS_DEFAULT_REGION", "us-east-1")
+    with moto.mock_aws():
+        s3 = s3_utilities.get_s3_client(**MOTO_CREDENTIALS)
+        s3.create_bucket(Bucket="dei-bucket")
+        yield s3
+
+
+def test_listings_follow_pagination_and_filter(moto_bucket):
+    s3 = moto_bucket
+    companies = [f"raw_data/company_{i:04d}.jsonl.gz" for i in range(1100)]
+    others = ["raw_data/", "raw_data/notes.txt", "raw_data/archive/old.jsonl.gz",
+              "company_scores/a.jsonl.gz", "company_scores/all/companies_metadata.jsonl.gz"]
+    for key in companies + others:
+        s3.put_object(Bucket="dei-bucket", Key=key, Body=b"x" * (len(key) % 7))
+
+    # two pages of 1000 keys
+    objects = list(s3_utilities.iter_objects(**MOTO_CREDENTIALS, prefix="raw_data/", suffix=".jsonl.gz"))
+    assert [obj["key"] for obj in objects] == sorted(companies + ["raw_data/archive/old.jsonl.gz"])
+    assert objects[0]["size"] == len(objects[0]["key"]) % 7
+    assert objects[0]["etag"].startswith('"') and objects[0]["last_modified"] is not None
+
+    # the folder placeholder is skipped, every other key is listed
+    raw_files = s3_utilities.list_files_in_raw_data_folder(**MOTO_CREDENTIALS)
+    assert len(raw_files) == 1102 and "raw_data/" not in raw_files and "raw_data/notes.txt" in raw_files
+
+    # the direct sub-folders only, once each even if their keys span several pages
+    assert list(s3_utilities.iter_folders(**MOTO_CREDENTIALS)) == ["company_scores/", "raw_data/"]
+    assert list(s3_utilities.iter_folders(**MOTO_CREDENTIALS, prefix="raw_data/")) == ["raw_data/archive/"]
+
+    files, folders = s3_utilities.list_files_folders(**MOTO_CREDENTIALS)
+    assert len(files) == 1104 and folders == ["raw_data/"]
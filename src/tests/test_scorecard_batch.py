@@ -0,0 +1,102 @@
+import json
+import os
+import time
+import pytest
+from core.metrics import METRICS
+from services import scorecard_batch, scorecards_manifest
+from services.scorecards_manifest import manifest_entry
+
+SAMPLE = (100, "head")
+
+
+def stub_score(path: str, sample_size: int, sample_mode: str) -> str:
+    """
+    stands in for the scorecard of a company, behaving as its name says
+    """
+    name = path.split("/")[1].split(".")[0]
+    with METRICS.stage("scorecard_counts"):
+        if name == "slow":
+            time.sleep(30)
+        if name == "fails":
+            raise ValueError("bad raw data")
+        if name == "crashes":
+            # kills the worker process, like a segfault or the OOM killer,
+            # once the companies started with it are done
+            time.sleep(0.5)
+            os._exit(1)
+        if name == "flaky":
+            # fails on its first attempt only
+            marker = os.path.join(os.environ["SCORECARD_TEST_DIR"], "flaky")
+            if not os.path.exists(marker):
+                open(marker, "w").close()
+                raise ConnectionError("S3 reset")
+    return f"company_scores/{name}.jsonl.gz"
+
+
+@pytest.fixture
+def batch(monkeypatch, tmp_path):
+    raw_objects = [
+        {"key": f"raw_data/{name}.jsonl.gz", "etag": f'"{name}"', "size": size}
+        for size, name in enumerate(["ok", "slow", "fails", "crashes", "flaky", "unchanged"])
+    ]
+    unchanged = raw_objects[-1]
+    saved = []
+    monkeypatch.setenv("SCORECARD_TEST_DIR", str(tmp_path))
+    monkeypatch.setattr(scorecard_batch, "iter_objects", lambda **kwargs: iter(raw_objects))
+    monkeypatch.setattr(scorecards_manifest, "load_scorecards_manifest", lambda: {
+        unchanged["key"]: manifest_entry(unchanged, SAMPLE, "company_scores/unchanged.jsonl.gz"),
+        "raw_data/deleted.jsonl.gz": {"etag": '"deleted"', "size": 1},
+    })
+    monkeypatch.setattr(scorecard_batch, "save_scorecards_manifest", saved.append)
+    monkeypatch.setattr(scorecards_manifest, "save_scorecards_manifest", saved.append)
+    return saved
+
+
+def test_run_all_scores_isolates_failures_timeouts_and_crashes(batch, tmp_path):
+    report_path = tmp_path / "report.json"
+    METRICS.reset()
+
+    report = scorecard_batch.run_all_scores(
+        stub_score, workers=2, timeout=1, retries=1, report_path=str(report_path),
+        sample_size=SAMPLE[0], sample_mode=SAMPLE[1])
+
+    companies = report["companies"]
+    assert companies["raw_data/ok.jsonl.gz"] == {
+        "status": "ok", "duration": companies["raw_data/ok.jsonl.gz"]["duration"], "attempts": 1}
+    assert companies["raw_data/flaky.jsonl.gz"]["status"] == "ok"
+    assert companies["raw_data/flaky.jsonl.gz"]["attempts"] == 2
+    # each failure is retried once, then reported
+    assert companies["raw_data/fails.jsonl.gz"]["attempts"] == 2
+    assert "ValueError('bad raw data')" == companies["raw_data/fails.jsonl.gz"]["error"]
+    assert companies["raw_data/slow.jsonl.gz"]["attempts"] == 2
+    assert "TimeoutError" in companies["raw_data/slow.jsonl.gz"]["error"]
+    assert companies["raw_data/crashes.jsonl.gz"]["attempts"] == 2
+    assert "BrokenProcessPool" in companies["raw_data/crashes.jsonl.gz"]["error"]
+
+    assert report["nb_companies"] == 5
+    assert report["nb_skipped"] == 1
+    assert report["nb_failed"] == 3
+    assert report["failed"] == [
+        "raw_data/crashes.jsonl.gz", "raw_data/fails.jsonl.gz", "raw_data/slow.jsonl.gz"]
+    assert (report["workers"], report["sample_size"], report["sample_mode"]) == (2, 100, "head")
+    # the metrics recorded by the workers that succeeded are merged into the report
+    assert report["metrics"]['dei_stage_seconds{stage="scorecard_counts"}']["count"] == 2
+    with open(report_path) as f:
+        assert json.load(f) == report
+
+    # only the scored companies are recorded, the deleted one is forgotten
+    manifest = batch[-1]
+    assert set(manifest) == {
+        "raw_data/ok.jsonl.gz", "raw_data/flaky.jsonl.gz", "raw_data/unchanged.jsonl.gz"}
+    assert manifest["raw_data/ok.jsonl.gz"]["output"] == "company_scores/ok.jsonl.gz"
+
+
+def test_run_all_scores_saves_the_manifest_periodically(batch):
+    report = scorecard_batch.run_all_scores(
+        stub_score, workers=1, timeout=1, retries=0, manifest_save_every=1,
+        sample_size=SAMPLE[0], sample_mode=SAMPLE[1], force=True)
+
+    assert report["nb_skipped"] == 0
+    assert report["nb_failed"] == 4
+    # once per scored company (ok, unchanged), and at the end of the batch
+    assert len(batch) == 3
@@ -0,0 +1,63 @@
+import pytest
+from services import scorecards_manifest
+from services.scorecards_manifest import (
+    is_unchanged,
+    manifest_entry,
+    objects_to_score,
+    prune_manifest,
+    updating_manifest,
+)
+
+SAMPLE = (1000, "head")
+
+
+def raw(key: str, etag: str, size: int) -> dict:
+    return {"key": key, "etag": etag, "size": size}
+
+
+def test_is_unchanged_matches_etag_size_and_sample():
+    obj = raw("raw_data/a.jsonl.gz", '"e1"', 10)
+    entry = manifest_entry(obj, SAMPLE, "company_scores/a.jsonl.gz")
+
+    assert is_unchanged(entry, obj, SAMPLE)
+    assert is_unchanged(entry, obj)
+    assert not is_unchanged(None, obj, SAMPLE)
+    assert not is_unchanged({}, obj, SAMPLE)
+    assert not is_unchanged(entry, raw(obj["key"], '"e2"', 10), SAMPLE)
+    assert not is_unchanged(entry, raw(obj["key"], '"e1"', 11), SAMPLE)
+    assert not is_unchanged(entry, obj, (1000, "reservoir"))
+    assert not is_unchanged(entry, obj, (500, "head"))
+
+
+def test_objects_to_score_skips_unchanged_objects_unless_forced():
+    objects = [raw("small", '"s"', 1), raw("large", '"l"', 100), raw("changed", '"c2"', 50)]
+    manifest = {
+        "small": manifest_entry(objects[0], SAMPLE, "out/small"),
+        "changed": manifest_entry(raw("changed", '"c1"', 50), SAMPLE, "out/changed"),
+    }
+
+    assert objects_to_score(objects, manifest, SAMPLE) == ["large", "changed"]
+    assert objects_to_score(objects, manifest, SAMPLE, force=True) == ["large", "changed", "small"]
+    assert objects_to_score(objects, manifest, (10, "head")) == ["large", "changed", "small"]
+
+
+def test_prune_manifest_forgets_deleted_raw_objects():
+    manifest = {"kept": {"etag": '"k"'}, "deleted": {"etag": '"d"'}}
+    assert prune_manifest(manifest, {"kept": {}, "new": {}}) == {"kept": {"etag": '"k"'}}
+
+
+def test_manifest_is_saved_after_a_partial_run(monkeypatch):
+    saved = []
+    monkeypatch.setattr(scorecards_manifest, "load_scorecards_manifest",
+                        lambda: {"a": {"etag": '"old"'}, "deleted": {"etag": '"d"'}})
+    monkeypatch.setattr(scorecards_manifest, "save_scorecards_manifest", saved.append)
+    raw_objects = {"a": raw("a", '"new"', 1), "b": raw("b", '"b"', 1)}
+
+    with pytest.raises(RuntimeError):
+        with updating_manifest(raw_objects) as manifest:
+            manifest["a"] = manifest_entry(raw_objects["a"], SAMPLE, "out/a")
+            raise RuntimeError("batch interrupted")
+
+    assert len(saved) == 1
+    assert set(saved[0]) == {"a"}
+    assert saved[0]["a"]["etag"] == '"new"'
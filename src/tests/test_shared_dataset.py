@@ -0,0 +1,51 @@
+from app.shared_dataset import (
+    PackedMapping,
+    dataset_versions,
+    materialize_dataset,
+    open_dataset,
+    prune_dataset_versions,
+    read_current_version,
+)
+from core import json_codec
+from core.snapshot_bundle import SnapshotBundle
+
+
+def make_bundle(version: str) -> SnapshotBundle:
+    return SnapshotBundle(version, 0, {
+        "all_company_data": {str(i): {"2021": {"women": i}} for i in range(20)},
+        "all_companies": {str(i): {"company_id": str(i), "industry": "Banking"} for i in range(20)},
+        "industry_stats": {"Retention Score Industry Average": {"Banking": 1.5}},
+        "rankings": [b'{"a": 1}', b'{"b": 2}'],
+    })
+
+
+def test_materialized_dataset_is_mapped_by_workers(tmp_path):
+    directory = str(tmp_path)
+    assert read_current_version(directory) is None
+
+    materialize_dataset(make_bundle("v1"), directory)
+    snapshot = open_dataset(directory, read_current_version(directory), transforms={"rankings": len})
+
+    companies = snapshot.objects["all_company_data"]
+    assert isinstance(companies, PackedMapping)
+    assert len(companies) == 20 and "3" in companies and "x" not in companies
+    assert companies["3"] == {"2021": {"women": 3}}
+    assert dict(snapshot.objects["all_companies"]) == make_bundle("v1").objects["all_companies"]
+    assert snapshot.objects["industry_stats"] == {"Retention Score Industry Average": {"Banking": 1.5}}
+    assert snapshot.objects["rankings"] == 2
+    prepared = snapshot.derived["responses"]["all_company_data"]
+    with open(prepared.paths["identity"], "rb") as f:
+        assert json_codec.loads(f.read()) == make_bundle("v1").objects["all_company_data"]
+    assert set(snapshot.derived["responses"]) == {"all_company_data", "all_companies", "industry_stats"}
+
+
+def test_new_versions_become_current_and_old_ones_are_pruned(tmp_path):
+    directory = str(tmp_path)
+    for version in ("v1", "v2", "v3"):
+        materialize_dataset(make_bundle(version), directory, keep=2)
+
+    assert read_current_version(directory) == "v3"
+    # the workers may still send the files of v1 until their next refresh
+    assert dataset_versions(directory) == ["v1", "v2", "v3"]
+    prune_dataset_versions(directory, keep=2, retain_seconds=0)
+    assert dataset_versions(directory) == ["v2", "v3"]
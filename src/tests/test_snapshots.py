@@ -0,0 +1,57 @@
+import gzip
+from app.snapshots import SnapshotHolder
+from core.snapshot_bundle import (
+    SnapshotBundle,
+    bundle_object_path,
+    bundle_version,
+    content_digest,
+    decode_bundle_object,
+)
+
+
+def test_bundle_versions_sort_by_time_and_identify_content():
+    etags = {"all_companies": '"a"', "industry_stats": '"b"'}
+    first = bundle_version(etags, now=1_700_000_000)
+    second = bundle_version(etags, now=1_700_000_060)
+
+    assert first < second
+    assert first.endswith(content_digest(etags)) and second.endswith(content_digest(etags))
+    assert content_digest(etags) != content_digest({**etags, "industry_stats": '"c"'})
+    assert bundle_object_path(first, "company_scores/all/rankings.jsonl.gz") == \
+        f"company_scores/bundles/{first}/rankings.jsonl.gz"
+
+
+def test_decode_bundle_object():
+    content = gzip.compress(b'{"1": {"a": 1}}\n{"2": {"a": 2}}')
+
+    assert decode_bundle_object("x.jsonl.gz", content) == [b'{"1": {"a": 1}}', b'{"2": {"a": 2}}']
+    assert decode_bundle_object("x.jsonl.gz", content, transform=len) == 2
+
+
+def test_snapshot_holder_swaps_whole_versions():
+    versions = iter([SnapshotBundle("v1", 0, {"a": 1}), None, SnapshotBundle("v2", 0, {"a": 2})])
+    holder = SnapshotHolder(lambda current: next(versions))
+
+    assert holder.refresh()
+    first = holder.current
+    assert not holder.refresh()
+    assert holder.current is first
+    assert holder.refresh()
+    assert holder.current.version == "v2" and holder.current.objects["a"] == 2
+    # a request holding the previous version keeps reading it
+    assert first.objects["a"] == 1
+    assert holder.stats()["loads"] == 2
+
+
+def test_snapshot_holder_keeps_current_version_on_failure():
+    def load(current):
+        if current is None:
+            return SnapshotBundle("v1", 0, {})
+        raise OSError("S3 is down")
+
+    holder = SnapshotHolder(load)
+    holder.refresh()
+
+    assert not holder.refresh()
+    assert holder.current.version == "v1"
+    assert holder.stats()["failures"] == 1